@@ -0,0 +1,325 @@
+"""
+Cap on concurrent model replies, with a bounded priority queue in front of it.
+
+A chat turn that needs the model takes a slot before its first call and gives it
+back when the reply is finished (a streamed one when the stream closes). Slots are
+sized to what the keys can serve together. When they are all taken, turns queue:
+those of a consultation already under way go ahead of new sessions, and a full
+queue makes room for one by turning away its newest new-session waiter. Anyone
+still waiting after max_wait seconds is turned away, as is a new session arriving
+at a full queue, so a spike is shed in seconds instead of becoming a burst of 429s
+from Gemini that exhausts every key at once.
+
+With a Redis URL the cap is shared by every worker: each reply holds a lease in one
+sorted set, taken by a Lua script that drops expired leases and counts the rest, and
+leases expire on their own after lease_ttl seconds if a worker dies holding one. A
+live worker pushes the expiry of the leases it holds forward every lease_ttl / 3
+seconds, so a stream that runs longer than lease_ttl keeps its slot. A slot freed in another worker can't wake this one's waiters, so while the queue is
+not empty they check for one every poll_interval. If Redis is unreachable the
+process-local cap still applies. admit_async() and Ticket.release_async() make
+those Redis round trips (and wait for the lock held across them) on a worker
+thread, so the event loop never blocks on them.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from uuid import uuid4
+
+import metrics
+from metrics import RollingWindow
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ONGOING = "ongoing"
+PRIORITY_NEW = "new"
+PRIORITY_BATCH = "batch"
+PRIORITIES = (PRIORITY_ONGOING, PRIORITY_NEW, PRIORITY_BATCH)
+
+# KEYS[1] lease set; ARGV now, lease expiry, capacity, lease id
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    return 1
+end
+return 0
+"""
+
+
+class Ticket:
+    """A held slot; release() is safe to call more than once"""
+
+    __slots__ = ("gate", "lease", "priority", "waited", "granted_at", "released")
+
+    def __init__(self, gate, lease, priority, waited):
+        self.gate = gate
+        self.lease = lease
+        self.priority = priority
+        self.waited = waited
+        self.granted_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.gate._release(self)
+
+    async def release_async(self):
+        """release() for the event loop"""
+        await self.gate._off_loop(self.release)
+
+
+class _Waiter:
+    __slots__ = ("priority", "loop", "event", "lease", "granted", "evicted")
+
+    def __init__(self, priority, loop=None):
+        self.priority = priority
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+        self.lease = None
+        self.granted = False
+        self.evicted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.event.set)
+
+
+class AdmissionGate:
+    """Hands out at most `capacity` slots for model replies, queueing and shedding the excess"""
+
+    def __init__(self, capacity, max_queue=64, max_wait=10.0, redis_url=None, lease_ttl=120.0,
+                 poll_interval=0.05, prefix="curaai:", client=None):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._in_use = 0
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._lock = threading.Lock()
+        self.waits = RollingWindow()
+        self.holds = RollingWindow()
+        self.stats_counters = {
+            "admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "evicted": 0,
+        }
+        self.redis = client
+        self._lease_key = f"{prefix}llm_slots"
+        if self.redis is None and redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url)
+        self._acquire_script = self.redis.register_script(ACQUIRE_SCRIPT) if self.redis is not None else None
+        # Redis leases this worker holds, renewed by a daemon thread until they are freed
+        self._held = set()
+        if self._acquire_script is not None:
+            threading.Thread(target=self._renew_leases, name="admission-lease-renewal", daemon=True).start()
+
+    async def _off_loop(self, function, *args):
+        """Run a step that may call Redis on a worker thread; without Redis it is quick and runs inline"""
+        if self.redis is None:
+            return function(*args)
+        return await asyncio.to_thread(function, *args)
+
+    def _queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _publish(self):
+        """Push slot and queue gauges to /metrics; call with the lock held"""
+        metrics.set_admission_depth(self._in_use, {priority: len(queue) for priority, queue in self._queues.items()})
+
+    def _take(self):
+        """A lease for a free slot, or None; call with the lock held"""
+        if self._in_use >= self.capacity:
+            return None
+        lease = True
+        if self._acquire_script is not None:
+            lease = uuid4().hex
+            now = time.time()
+            try:
+                if not self._acquire_script(keys=[self._lease_key], args=[now, now + self.lease_ttl, self.capacity, lease]):
+                    return None
+                self._held.add(lease)
+            except Exception as e:
+                # The shared cap is unavailable; the local one still holds
+                logger.warning(f"Admission slot store unavailable, admitting on the local cap: {str(e)}")
+                lease = True
+        self._in_use += 1
+        return lease
+
+    def _dispatch(self):
+        """Hand free slots to waiters, ongoing consultations first and batch records last; call with the lock held"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue:
+                lease = self._take()
+                if lease is None:
+                    return
+                waiter = queue.popleft()
+                waiter.lease = lease
+                waiter.granted = True
+                waiter.wake()
+
+    def _enqueue(self, waiter):
+        """Queue a waiter, evicting the newest waiter of the lowest priority below it when full; call with the lock held"""
+        if self._queued() >= self.max_queue:
+            below = [self._queues[priority] for priority in PRIORITIES[PRIORITIES.index(waiter.priority) + 1:]]
+            below = [queue for queue in below if queue]
+            if not below:
+                return False
+            evicted = below[-1].pop()
+            evicted.evicted = True
+            evicted.wake()
+            self.stats_counters["evicted"] += 1
+        self._queues[waiter.priority].append(waiter)
+        self.stats_counters["queued"] += 1
+        return True
+
+    def _try_admit(self, waiter):
+        """(ticket, queued) for an arriving turn: a slot, a place in the queue, or (None, False) when shed"""
+        with self._lock:
+            if not self._queued():
+                lease = self._take()
+                if lease is not None:
+                    self.stats_counters["admitted"] += 1
+                    self._publish()
+                    return Ticket(self, lease, waiter.priority, 0.0), False
+            queued = self._enqueue(waiter)
+            if not queued:
+                self.stats_counters["rejected_queue_full"] += 1
+            self._publish()
+            return None, queued
+
+    def _settle(self, waiter, started, timed_out):
+        """Ticket for a waiter that woke up, or None when it was turned away; call with the lock held"""
+        waited = time.monotonic() - started
+        if waiter.granted:
+            self.stats_counters["admitted"] += 1
+            self._publish()
+            self.waits.add(waited, True)
+            metrics.observe_admission(waiter.priority, "admitted", waited)
+            return Ticket(self, waiter.lease, waiter.priority, waited)
+        if waiter.evicted or timed_out:
+            if not waiter.evicted:
+                self._queues[waiter.priority].remove(waiter)
+                self.stats_counters["rejected_timeout"] += 1
+            self._publish()
+            self.waits.add(waited, False)
+            metrics.observe_admission(waiter.priority, "evicted" if waiter.evicted else "timeout", waited)
+            return None
+        # Shared slots: look for one freed by another worker
+        self._dispatch()
+        return self._settle(waiter, started, False) if waiter.granted else False
+
+    def admit(self, priority=PRIORITY_NEW):
+        """Ticket for a model reply, or None when the service is saturated; blocks up to max_wait seconds"""
+        started = time.monotonic()
+        waiter = _Waiter(priority)
+        ticket, queued = self._try_admit(waiter)
+        if not queued:
+            if ticket is None:
+                metrics.observe_admission(priority, "queue_full", 0.0)
+            return ticket
+
+        deadline = started + self.max_wait
+        while True:
+            remaining = max(0.0, deadline - time.monotonic())
+            waiter.event.wait(min(remaining, self.poll_interval) if self.redis is not None else remaining)
+            result = self._settle_locked(waiter, started, time.monotonic() >= deadline)
+            if result is not False:
+                return result
+
+    async def admit_async(self, priority=PRIORITY_NEW):
+        """admit() for the event loop; a cancelled waiter gives back any slot it was handed"""
+        started = time.monotonic()
+        waiter = _Waiter(priority, asyncio.get_running_loop())
+        ticket, queued = await self._off_loop(self._try_admit, waiter)
+        if not queued:
+            if ticket is None:
+                metrics.observe_admission(priority, "queue_full", 0.0)
+            return ticket
+
+        deadline = started + self.max_wait
+        try:
+            while True:
+                remaining = max(0.0, deadline - time.monotonic())
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), min(remaining, self.poll_interval) if self.redis is not None else remaining)
+                except asyncio.TimeoutError:
+                    pass
+                result = await self._off_loop(self._settle_locked, waiter, started, time.monotonic() >= deadline)
+                if result is not False:
+                    return result
+        except asyncio.CancelledError:
+            # Finishes on its thread even if this task is cancelled again while it waits
+            await self._off_loop(self._abandon, waiter)
+            raise
+
+    def _settle_locked(self, waiter, started, timed_out):
+        with self._lock:
+            return self._settle(waiter, started, timed_out)
+
+    def _abandon(self, waiter):
+        """Take a cancelled waiter out of the queue, or give back the slot it was just handed"""
+        with self._lock:
+            if waiter.granted:
+                self._free(waiter.lease)
+            elif not waiter.evicted and waiter in self._queues[waiter.priority]:
+                self._queues[waiter.priority].remove(waiter)
+            self._publish()
+
+    def _free(self, lease):
+        """Give a slot back and pass it on to the next waiter; call with the lock held"""
+        self._in_use -= 1
+        if lease is not True:
+            self._held.discard(lease)
+            try:
+                self.redis.zrem(self._lease_key, lease)
+            except Exception as e:
+                logger.warning(f"Could not release admission slot, it expires in {self.lease_ttl:.0f}s: {str(e)}")
+        self._dispatch()
+
+    def _renew_leases(self):
+        """Keep this worker's Redis leases from expiring while their replies run"""
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                leases = list(self._held)
+            if not leases:
+                continue
+            try:
+                # XX: a lease freed since the copy above is not put back
+                self.redis.zadd(self._lease_key, dict.fromkeys(leases, time.time() + self.lease_ttl), xx=True)
+            except Exception as e:
+                logger.warning(f"Could not renew {len(leases)} admission slot(s): {str(e)}")
+
+    def _release(self, ticket):
+        self.holds.add(time.monotonic() - ticket.granted_at, True)
+        with self._lock:
+            self._free(ticket.lease)
+            self._publish()
+
+    def retry_after(self):
+        """Seconds a turned-away client should wait: the typical time a reply holds its slot"""
+        p50_ms = self.holds.stats()["p50_ms"]
+        return max(1, math.ceil(p50_ms / 1000)) if p50_ms is not None else 1
+
+    def stats(self):
+        """Slots, queue depth, counters and wait percentiles for the /health endpoint"""
+        with self._lock:
+            stats = {
+                "capacity": self.capacity,
+                "shared": self.redis is not None,
+                "in_use": self._in_use,
+                "queue": {priority: len(queue) for priority, queue in self._queues.items()},
+                "max_queue": self.max_queue,
+                "max_wait": self.max_wait,
+                **self.stats_counters,
+            }
+        stats["wait"] = self.waits.stats()
+        return stats
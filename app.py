@@ -1,9 +1,32 @@
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, g, request, jsonify, render_template, session, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
+import hmac
+import json
 import os
-import google.generativeai as genai
+import re
+import time
 from uuid import uuid4
-from medicine import medicine_data, search_medicine
+from catalogue import configure_catalogue
+from prompts import system_prompt
+from retrieval import build_medication_context, build_full_medication_context
+from search_index import get_index
+from health_detector import detect_health_concerns
+from demographics import MAX_AGE, extract_patient_facts, describe_age, describe_temperature, describe_duration
+from model_pool import ModelPool, close_stream, has_system_context, token_usage
+from key_pool import KeyPool
+from hedging import HedgedCaller
+from session_store import MemorySessionStore, RedisSessionStore, new_context
+from history_manager import HistoryManager, estimate_tokens
+from response_cache import ResponseCache
+from catalogue_responder import CatalogueResponder
+from reply_structure import structure_reply
+from single_flight import SingleFlight
+from token_accounting import TokenLedger
+from rate_limits import ChatRateLimits
+from admission import AdmissionGate, PRIORITY_BATCH, PRIORITY_NEW, PRIORITY_ONGOING
+from batch import BatchError, BatchRunner, MemoryJournal, RedisJournal, parse_records
+import metrics
 import logging
 from datetime import datetime
 from config import config
@@ -33,30 +56,6 @@ def get_api_keys():
         i += 1
     return api_keys
 
-def configure_genai_with_fallback():
-    """Configure Gemini with fallback API keys"""
-    api_keys = get_api_keys()
-    if not api_keys:
-        raise ValueError("No Gemini API keys found in environment variables")
-    
-    # Configure with the first key initially
-    genai.configure(api_key=api_keys[0])
-    logger.info(f"Configured Gemini with primary API key. Total keys available: {len(api_keys)}")
-    return api_keys
-
-# Initialize API keys
-available_api_keys = configure_genai_with_fallback()
-current_key_index = 0
-
-def switch_to_next_api_key():
-    """Switch to the next available API key"""
-    global current_key_index, available_api_keys
-    current_key_index = (current_key_index + 1) % len(available_api_keys)
-    new_key = available_api_keys[current_key_index]
-    genai.configure(api_key=new_key)
-    logger.info(f"Switched to API key {current_key_index + 1} of {len(available_api_keys)}")
-    return new_key
-
 def create_app(config_name=None):
     if config_name is None:
         config_name = os.getenv('FLASK_ENV', 'production')
@@ -69,10 +68,143 @@ def create_app(config_name=None):
 
 app = create_app()
 app.secret_key = app.config['SECRET_KEY']
+if app.config["TRUSTED_PROXIES"]:
+    # Client addresses for the per-IP quota come from X-Forwarded-For, as set by this many proxies
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["TRUSTED_PROXIES"])
+metrics.configure(app.config["METRICS_MODE"])
+
+# Medication catalogue, read from its data file on first use and reloaded when the file changes
+catalogue = configure_catalogue(
+    app.config["CATALOGUE_PATH"],
+    check_interval=app.config["CATALOGUE_RELOAD_INTERVAL"]
+)
+
+# Initialize API keys
+available_api_keys = get_api_keys()
+if not available_api_keys:
+    # Keep serving /health so the misconfiguration shows up there; chats get the unavailable reply
+    logger.error("No Gemini API keys found in environment variables")
+key_pool = KeyPool(
+    available_api_keys,
+    strategy=app.config["KEY_SELECTION_STRATEGY"],
+    breaker_threshold=app.config["KEY_BREAKER_THRESHOLD"],
+    breaker_cooldown=app.config["KEY_BREAKER_COOLDOWN"]
+)
+logger.info(f"Loaded {len(key_pool)} Gemini API key(s), selection strategy: {key_pool.strategy}")
+
+# Per-attempt timeouts, an overall deadline, backoff between keys and optional hedging
+llm_caller = HedgedCaller(
+    key_pool,
+    attempt_timeout=app.config["LLM_ATTEMPT_TIMEOUT"],
+    deadline=app.config["LLM_REQUEST_DEADLINE"],
+    max_attempts=app.config["LLM_MAX_ATTEMPTS"],
+    hedge=app.config["LLM_HEDGE_ENABLED"],
+    hedge_min_delay=app.config["LLM_HEDGE_MIN_DELAY"],
+    backoff_base=app.config["LLM_BACKOFF_BASE"],
+    backoff_cap=app.config["LLM_BACKOFF_CAP"]
+)
+
+# Caps concurrent model replies at what the keys can serve together; the excess queues, then is shed
+admission_gate = None
+if app.config["LLM_ADMISSION_ENABLED"]:
+    admission_gate = AdmissionGate(
+        app.config["LLM_MAX_CONCURRENCY"] or app.config["LLM_CONCURRENCY_PER_KEY"] * max(1, len(key_pool)),
+        max_queue=app.config["LLM_QUEUE_MAX"],
+        max_wait=app.config["LLM_QUEUE_TIMEOUT"],
+        redis_url=app.config["LLM_ADMISSION_REDIS_URL"]
+    )
+
+gemini_client_options = {"api_endpoint": app.config["GEMINI_API_ENDPOINT"]} if app.config["GEMINI_API_ENDPOINT"] else None
+model_pool = ModelPool(gemini_client_options, app.config["GEMINI_TRANSPORT"])
+
+context_cache = None
+if app.config["CONTEXT_CACHE_ENABLED"]:
+    # Loads the Gemini SDK at import, which the app otherwise defers
+    from context_cache import ContextCacheManager
+    context_cache = ContextCacheManager(
+        app.config["CONTEXT_CACHE_MODEL"],
+        system_prompt,
+        [build_full_medication_context()],
+        ttl_seconds=app.config["CONTEXT_CACHE_TTL"],
+        client_options=gemini_client_options,
+        transport=app.config["GEMINI_TRANSPORT"],
+        on_retire=model_pool.forget_cached
+    )
+
+def start_llm_warmup():
+    """Load the Gemini SDK and build model handles in the background; called once a worker is up"""
+    model_pool.warm_in_background(available_api_keys, app.config["GEMINI_MODEL"], system_prompt)
+
+# Per-user consultation state and message counts, shared across workers when backed by Redis
+if app.config["SESSION_STORE"] == "redis":
+    session_store = RedisSessionStore(app.config["SESSION_REDIS_URL"], idle_ttl=app.config["SESSION_IDLE_TTL"])
+else:
+    session_store = MemorySessionStore(
+        idle_ttl=app.config["SESSION_IDLE_TTL"],
+        max_sessions=app.config["SESSION_MAX_ENTRIES"],
+        max_bytes=app.config["SESSION_MAX_BYTES"]
+    )
+logger.info(f"Session store: {app.config['SESSION_STORE']}")
+
+# Tokens billed per key and per hour in this process; each session's own total is kept in the session store
+token_ledger = TokenLedger(
+    prompt_price=app.config["TOKEN_PRICE_PROMPT_PER_MILLION"],
+    completion_price=app.config["TOKEN_PRICE_COMPLETION_PER_MILLION"],
+    retention_hours=app.config["TOKEN_USAGE_RETENTION_HOURS"]
+)
+metrics.register(token_ledger)
+
+# Caps the history replayed to the model each turn; older exchanges are summarized
+history_manager = HistoryManager(
+    max_turns=app.config["HISTORY_MAX_TURNS"],
+    token_budget=app.config["HISTORY_TOKEN_BUDGET"],
+    summary_budget=app.config["HISTORY_SUMMARY_BUDGET"]
+)
 
-# Message limit configuration
-MESSAGE_LIMIT = 7  # Maximum messages per user
-user_message_counts = {}  # Track message counts per user
+# First aid, travel and menstrual care requests are answered from the catalogue without the model
+catalogue_responder = CatalogueResponder() if app.config["CATALOGUE_FAST_PATH_ENABLED"] else None
+
+# Replies to the opening model turn, shared by sessions with the same concern and demographics
+response_cache = None
+if app.config["RESPONSE_CACHE_ENABLED"]:
+    response_cache = ResponseCache(
+        max_entries=app.config["RESPONSE_CACHE_MAX_ENTRIES"],
+        ttl_seconds=app.config["RESPONSE_CACHE_TTL"],
+        similarity=app.config["RESPONSE_CACHE_SIMILARITY"]
+    )
+
+def catalogue_reloaded(snapshot):
+    """Refresh what was built from the previous catalogue outside its snapshot"""
+    if context_cache is not None:
+        context_cache.replace_contents([build_full_medication_context(snapshot)])
+    if response_cache is not None:
+        # Cached opening replies may quote entries that changed
+        response_cache.clear()
+
+catalogue.on_reload(catalogue_reloaded)
+
+# Duplicate submits of a message that is still being answered share the one model call
+single_flight = None
+if app.config["SINGLE_FLIGHT_ENABLED"]:
+    single_flight = SingleFlight(
+        wait_timeout=app.config["SINGLE_FLIGHT_WAIT_TIMEOUT"],
+        result_ttl=app.config["IDEMPOTENCY_TTL"]
+    )
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.trace_token = metrics.begin_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed replies are timed to their first byte here; their LLM attempts are timed separately
+    metrics.observe_request(request.endpoint or "unmatched", response.status_code, time.perf_counter() - g.request_started)
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    metrics.end_trace(g.pop("trace_token", None), f"{request.method} {request.path}")
 
 @app.after_request
 def add_security_headers(response):
@@ -82,44 +214,70 @@ def add_security_headers(response):
     response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
     return response
 
+# Per-session and per-IP chat quotas, checked after the hooks above so rejections are timed too
+chat_rate_limits = ChatRateLimits(
+    app,
+    per_session=app.config["RATE_LIMIT_PER_SESSION"],
+    per_ip=app.config["RATE_LIMIT_PER_IP"],
+    storage_uri=app.config["RATE_LIMIT_STORAGE_URI"],
+    strategy=app.config["RATE_LIMIT_STRATEGY"],
+    enabled=app.config["RATE_LIMIT_ENABLED"]
+)
+
 @app.route("/health")
 def health_check():
     return jsonify({
-        "status": "healthy",
+        "status": "healthy" if len(key_pool) else "degraded",
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0",
         "api_keys": {
-            "total_available": len(available_api_keys),
-            "current_key_index": current_key_index,
-            "fallback_enabled": len(available_api_keys) > 1
-        }
+            "total_available": len(key_pool),
+            "fallback_enabled": len(key_pool) > 1,
+            **key_pool.stats()
+        },
+        "llm_calls": llm_caller.stats(),
+        "rate_limits": chat_rate_limits.stats(),
+        "admission": admission_gate.stats() if admission_gate else {"enabled": False},
+        "model_pool": model_pool.stats(),
+        "session_store": session_store.stats(),
+        "context_cache": context_cache.stats() if context_cache else {"enabled": False},
+        "response_cache": response_cache.stats() if response_cache else {"enabled": False},
+        "catalogue": catalogue.stats(),
+        "catalogue_fast_path": catalogue_responder.stats() if catalogue_responder else {"enabled": False},
+        "single_flight": single_flight.stats() if single_flight else {"enabled": False},
+        "token_usage": {"session_budget": app.config["SESSION_TOKEN_BUDGET"] or None, **token_ledger.stats()},
+        "batch": {"endpoint_enabled": bool(app.config["BATCH_API_TOKEN"]), **batch_runner.stats()}
     })
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Stage timings, latency histograms and token counters in the Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/message-count")
 def get_message_count():
     """Get current message count for the user"""
     if "user_id" not in session:
-        logger.info("No user_id in session, returning 0 count")
-        return jsonify({"count": 0, "limit": MESSAGE_LIMIT})
+        logger.debug("No user_id in session, returning 0 count")
+        return jsonify({"count": 0, **session_tokens(None)})
     
     user_id = session["user_id"]
-    count = user_message_counts.get(user_id, 0)
-    logger.info(f"Message count request - User: {user_id}, Count: {count}, Limit: {MESSAGE_LIMIT}")
-    return jsonify({
-        "count": count,
-        "limit": MESSAGE_LIMIT,
-        "remaining": max(0, MESSAGE_LIMIT - count)
-    })
+    count = session_store.get_message_count(user_id)
+    tokens = session_tokens(user_id)
+    logger.debug(f"Message count request - User: {user_id}, Count: {count}, Tokens: {tokens['tokens_used']}/{tokens['token_budget']}")
+    return jsonify({"count": count, **tokens})
 
 @app.route("/reset-messages")
 def reset_messages():
-    """Reset message count for the current user"""
+    """Reset message count for the current user; development only, or the allowance would mean nothing"""
+    if not app.debug:
+        return jsonify({"success": False, "message": "Not available"}), 404
     if "user_id" not in session:
         return jsonify({"success": False, "message": "No user session"})
     
-    user_id = session["user_id"]
-    user_message_counts[user_id] = 0
-    return jsonify({"success": True, "message": "Message count reset"})
+    session_store.reset_message_count(session["user_id"])
+    session_store.reset_token_usage(session["user_id"])
+    return jsonify({"success": True, "message": "Message count and token usage reset"})
 
 @app.route("/debug-messages")
 def debug_messages():
@@ -128,365 +286,673 @@ def debug_messages():
         return jsonify({"error": "No user session"})
     
     user_id = session["user_id"]
-    count = user_message_counts.get(user_id, 0)
+    count = session_store.get_message_count(user_id)
+    prompt_tokens, completion_tokens = session_store.get_token_usage(user_id)
     return jsonify({
         "user_id": user_id,
         "current_count": count,
-        "limit": MESSAGE_LIMIT,
-        "remaining": max(0, MESSAGE_LIMIT - count),
-        "all_counts": user_message_counts
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        **session_tokens(user_id),
+        "session_store": session_store.stats(),
+        "history": history_manager.stats(session_store.get_context(user_id) or new_context())
     })
 
-system_prompt = f"""
-You are CuraAI, a professional, caring, and intelligent virtual health assistant. You simulate a qualified general physician. You must be helpful, confident, empathetic, and concise — always delivering actionable medical advice in a short, structured format.
-
-You must never say you are an AI, assistant, or chatbot. Speak like a real doctor. Your purpose is to:
-
-Understand user symptoms quickly
-
-Ask only essential medical questions
-
-Provide over-the-counter advice and guidance
-
-Help users know when to consult a real doctor
-
-End the conversation gracefully and efficiently
-
-🎯 RESPONSE GOAL (Every Turn):
-When enough info is provided, reply using this exact format — clean text only (no symbols, no Markdown):
-
-Possible Cause: [brief diagnosis or suspicion]
-Recommended Steps: [home remedy, rest, fluids, etc.]
-Medications: [use the medication database below for accurate recommendations]
-When to See a Doctor: [red flags or worsening symptoms]
-
-📌 CORE RULES:
-Never mention you are an AI. You are CuraAI — a virtual doctor.
-
-Use a warm, natural tone (e.g., "I'm sorry to hear that.", "Let me help you feel better.")
-
-Do not repeat questions. Always remember user answers in chat.
-
-Keep replies under 100 words unless necessary. No long essays.
-
-Avoid emojis, markdown, or asterisks. Use clean plain text only.
-
-Speak confidently, like a qualified human GP. Never sound like a script.
-
-Do not give disclaimers like "I'm not a real doctor." Act like one.
-
-Never say "I cannot help with that." Help in any health topic or direct safely.
-
-CRITICAL: If BOTH age AND gender are provided in the context, NEVER ask for them again. Proceed directly to addressing the health concern.
-
-MANDATORY REQUIREMENT: BOTH age AND gender MUST be collected before ANY medical advice, medication recommendations, or health suggestions can be provided. This is non-negotiable for safety reasons.
-
-IMPROVED QUESTIONING STYLE:
-- Be direct and concise. Ask one clear question at a time.
-- Don't ask for information the user already provided.
-- If user says "100 celsius", don't ask "What is the temperature?" again.
-- If user says "3 hours", don't ask "How long?" again.
-- Remember context: if they mentioned fever and headache, don't ask "What are your symptoms?"
-- Use natural conversation flow, not interrogation style.
-- NEVER ask for age or gender if the user has already provided this information.
-- If age and gender are provided in the context, proceed directly to addressing the health concern.
-
-TEMPERATURE HANDLING:
-When users mention temperatures without specifying units:
-- If they say "100" or similar numbers, ask "Is that in Celsius or Fahrenheit?"
-- If they say "100 degrees" or "100°", ask for clarification
-- Only provide medical advice after confirming the unit
-- Convert between units if needed: C to F = (C × 9/5) + 32, F to C = (F - 32) × 5/9
-- If user already specified the unit (e.g., "100 celsius"), use that information directly
-
-💊 MEDICATION DATABASE - USE THIS FOR ACCURATE RECOMMENDATIONS:
-
-{medicine_data}
-
-MEDICATION RECOMMENDATION RULES:
-1. ALWAYS ask for BOTH age AND gender before recommending medications
-2. NEVER provide medication advice without BOTH age AND gender
-3. Use the medication database above for specific conditions
-4. Consider age-appropriate dosing from the database
-5. For children under 6, be extra cautious and recommend doctor consultation
-6. For infants under 2, only recommend safe options like ORS, saline drops
-7. Always include dosage, form, and examples from the database
-8. Mention any important notes or precautions listed
-
-SPECIAL CATEGORY HANDLING:
-- For "First Aid Kit" requests: Use the "First Aid Kit Recommendations" category from the database
-- For "Travel" requests: Use the "Travel Essentials" category from the database
-- For "Women's Health" requests: Use the "Women's Health / Menstrual Care" category
-- Always provide specific dosages, forms, and brand examples from the database
-- Include all relevant items from the category, not just a few
-
-EXAMPLE FIRST AID KIT RESPONSE:
-Medications: Adhesive Bandages (Various Sizes) - Apply as needed (Band-Aid, Johnson & Johnson) - Small, medium, large sizes. Sterile Gauze Pads - Apply to larger wounds (Generic Sterile Gauze) - 2x2 and 4x4 inch pads. Medical Tape - Secure bandages and gauze (Micropore, Transpore) - Hypoallergenic tape. Antiseptic Solution - Clean wounds before bandaging (Betadine, Hydrogen Peroxide) - Prevents infection. Antibiotic Ointment - Apply to minor cuts after cleaning (Neosporin, Bacitracin) - Prevents bacterial infection. Hydrocortisone Cream 1% - Apply to rashes, insect bites (Cortizone-10) - Reduces itching and inflammation. Pain Relief Tablets - As needed for pain (Paracetamol, Ibuprofen) - Fever and pain relief. Antihistamine Tablets - As needed for allergies (Cetirizine, Diphenhydramine) - Allergic reactions, insect bites. Scissors & Tweezers - As needed (Medical Scissors, Splinter Tweezers) - Cut bandages, remove splinters. Instant Cold Pack - Apply 15-20 minutes (Instant Ice Pack) - Sprains, bruises, swelling. Thermometer - As needed (Digital Thermometer) - Monitor fever. Emergency Contact List - Keep updated (Local emergency numbers) - Poison control, nearest hospital.
-
-AGE-SPECIFIC GUIDELINES:
-- Infants (0-2 years): Only ORS, saline drops, basic skin care
-- Children (2-6 years): Limited OTC options, consult doctor for persistent symptoms
-- Children (6-12 years): More options available, use age-appropriate dosing
-- Adults (12+ years): Full range of OTC medications
-- Elderly (65+): Start with lower doses, consider kidney/liver function
-
-Do NOT recommend:
-- Antibiotics without prescription
-- Steroids without prescription
-- Injectables
-- Brand names not in the database
-- Adult doses for children
-- Multiple medications without checking interactions
-- Medications for infants under 2 months without doctor consultation
+@app.route("/medicines/search")
+def medicines_search():
+    """Ranked search over the medication catalogue with optional facet filters"""
+    query = request.args.get("q", "").strip()
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+        age = request.args.get("age", type=int)
+    except ValueError:
+        return jsonify({"error": "limit and age must be integers"}), 400
+    if age is not None and not 0 <= age <= MAX_AGE:
+        return jsonify({"error": f"age must be between 0 and {MAX_AGE}"}), 400
+
+    filters = {
+        "age_group": request.args.get("age_group"),
+        "form": request.args.get("form"),
+        "category": request.args.get("category"),
+        "age": age,
+    }
+    if not query and not any(value is not None for value in filters.values()):
+        return jsonify({"error": "Provide a search query (q) or at least one filter"}), 400
+
+    results = get_index().search(query, limit=limit, **filters)
+    return jsonify({
+        "query": query,
+        "filters": {key: value for key, value in filters.items() if value is not None},
+        "count": len(results),
+        "results": results
+    })
 
-🩺 TRIAGE FLOW (When symptoms are unclear):
-ALWAYS ask for BOTH age AND gender at start if not yet given
+@app.route("/")
+def index():
+    return render_template("index.html")
 
-Then ask 1–2 clarifying questions only (e.g., duration, severity, one symptom check)
+UNAVAILABLE_REPLY = "⚠️ Sorry, I'm temporarily unavailable. Please try again later."
+BUSY_REPLY = "⚠️ I'm helping a lot of people right now. Please try again in {seconds} second(s)."
+BUDGET_REPLY = "⚠️ I've reached my API limit for this session. Each session has a budget of {budget} tokens to manage costs, and this one has been used up. Please refresh the page to start a new session or try again later. Thank you for understanding!"
 
-Do not ask more than 3 questions total
+def prepare_chat_turn(user_id, user_msg):
+    """Run the age/gender gate and message limit; returns ((payload, status), None) when the LLM is not needed, else (None, turn)"""
+    with metrics.stage("session_load"):
+        context = session_store.get_context(user_id) or new_context()
+    try:
+        return gate_chat_turn(user_id, user_msg, context)
+    finally:
+        # The gate records age, gender and the pending concern even when it answers itself
+        with metrics.stage("session_save"):
+            session_store.save_context(user_id, context)
+
+def gate_chat_turn(user_id, user_msg, context):
+    """Body of prepare_chat_turn, working on the loaded context"""
+    with metrics.stage("keyword_detection"):
+        health_matches = detect_health_concerns(user_msg)
+    is_health_concern = bool(health_matches)
+
+    # Read age and gender before deciding what to ask, so "I'm 30 and female with a headache" needs no follow-up
+    with metrics.stage("fact_extraction"):
+        facts = extract_patient_facts(user_msg)
+    if not context.age and facts.age:
+        context.age = facts.age
+    if not context.gender and facts.gender:
+        context.gender = facts.gender
+    if facts.temperature:
+        context.temperature = describe_temperature(facts.temperature)
+    if facts.duration:
+        context.duration = describe_duration(facts.duration)
+    
+    if is_health_concern and (not context.age or not context.gender):
+        if not context.initial_health_concern or (context.has_addressed_initial_concern and is_health_concern):
+            context.initial_health_concern = user_msg
+            context.has_addressed_initial_concern = False
+        
+        if not context.age:
+            return ({"reply": "To assist you better, may I know your age?"}, 200), None
+        if not context.gender:
+            return ({"reply": "Thank you. Could you also let me know your gender (male or female)?"}, 200), None
+    
+    if is_health_concern and context.age and context.gender and context.has_addressed_initial_concern:
+        context.initial_health_concern = user_msg
+        context.has_addressed_initial_concern = False
 
-After 2–3 turns, give structured advice with age-appropriate dosing
+    if is_health_concern and (not context.age or not context.gender):
+        return ({"reply": "Please provide BOTH your age and gender first so I can give you appropriate medical advice."}, 200), None
 
-IMPORTANT: If BOTH age AND gender are already provided in the context, skip asking for them and proceed directly to addressing the health concern.
+    # A concern raised before age and gender were known is answered first
+    initial = bool(context.initial_health_concern and not context.has_addressed_initial_concern)
+    if initial and (not context.age or not context.gender):
+        if not context.age:
+            return ({"reply": "To assist you better, may I know your age?"}, 200), None
+        return ({"reply": "Thank you. Could you also let me know your gender (male or female)?"}, 200), None
 
-🔁 CONTEXT RULES:
-Remember user's previous answers and don't repeat questions
+    turn = {
+        "user_id": user_id,
+        "context": context,
+        "user_msg": user_msg,
+        "message": context.initial_health_concern if initial else user_msg,
+        "initial": initial,
+        "message_counted": False,
+        "cache_key": None,
+        "source": "model",
+        "reply": None,
+        "started": time.monotonic()
+    }
+
+    # Only increment message count if we're about to use the AI
+    # Don't count age/gender questions
+    is_age_gender_question = (
+        not context.age or 
+        not context.gender or
+        "may I know your age" in user_msg.lower() or
+        "let me know your gender" in user_msg.lower()
+    )
+    
+    if not is_age_gender_question:
+        # Replies that cost no API call are not counted either
+        with metrics.stage("catalogue_fast_path"):
+            catalogue_reply = catalogue_responder.reply(turn["message"], context.age, context.gender) if catalogue_responder else None
+        if catalogue_reply is not None:
+            logger.debug(f"Catalogue fast path reply for user {user_id}")
+            turn["source"] = "catalogue"
+            record_chat_turn(turn, catalogue_reply)
+            return (chat_reply_payload(turn, catalogue_reply), 200), None
+
+        with metrics.stage("response_cache"):
+            cached_reply = cached_opening_reply(turn)
+        if cached_reply is not None:
+            logger.debug(f"Response cache hit for user {user_id}")
+            turn["source"] = "cache"
+            record_chat_turn(turn, cached_reply)
+            return ({**chat_reply_payload(turn, cached_reply), "cached": True}, 200), None
+
+        # The budget is checked before the call and charged after it, so the last reply may run over
+        tokens = session_tokens(user_id)
+        if tokens["tokens_remaining"] == 0:
+            return ({
+                "reply": BUDGET_REPLY.format(budget=tokens["token_budget"]),
+                "limit_reached": True,
+                **tokens
+            }, 429), None
+        count = session_store.increment_message_count(user_id)
+        turn["message_counted"] = True
+        logger.debug(f"Message count incremented for user {user_id}. New count: {count}")
+    else:
+        logger.debug("Not incrementing message count - Age/gender question detected")
+
+    return None, turn
+
+def cached_opening_reply(turn):
+    """Cached reply to the first model turn of a consultation, or None; later turns always bypass the cache"""
+    if response_cache is None:
+        return None
+    context = turn["context"]
+    cache_key = None
+    if not context.history and not context.summarized_turns:
+        cache_key = response_cache.key(turn["message"], context.age, context.gender, context.temperature, context.duration)
+    if cache_key is None:
+        response_cache.bypass()
+        return None
+    ai_reply = response_cache.get(cache_key)
+    if ai_reply is None:
+        # Remembered so record_chat_turn can store the model's reply
+        turn["cache_key"] = cache_key
+    return ai_reply
+
+def model_for_key(api_key):
+    """Model bound to api_key, plus the cached system context it uses (None when sent inline)"""
+    with metrics.stage("model_init"):
+        cached_content = context_cache.get(api_key) if context_cache else None
+        if cached_content is not None:
+            return model_pool.get_cached(api_key, cached_content), cached_content
+        return model_pool.get(api_key, app.config["GEMINI_MODEL"], system_prompt), None
+
+def build_chat_input(model, cached_content, turn):
+    """Message sent to the model: patient details, relevant medication entries and the user's text"""
+    with metrics.stage("prompt_build"):
+        return _build_chat_input(model, cached_content, turn)
+
+def _build_chat_input(model, cached_content, turn):
+    context = turn["context"]
+    if context.age is not None and context.gender:
+        preface = f"The user is a {describe_age(context.age)} {context.gender}. DO NOT ask for age or gender again as this information has already been provided."
+    else:
+        # Messages that are not a health concern reach the model before the age and gender are known
+        preface = "The user has not given their age and gender yet."
+    if context.temperature:
+        preface += f" Reported temperature: {context.temperature}."
+    if context.duration:
+        preface += f" Symptoms reported for: {context.duration}."
+    if cached_content is None:
+        concern = context.initial_health_concern or turn["user_msg"]
+        preface += "\n\n" + build_medication_context(concern, context.age, context.user_turns())
+
+    if has_system_context(model):
+        return f"{preface}\nUser: {turn['message']}"
+    return f"{system_prompt}\n\n{preface}\nUser: {turn['message']}"
+
+def record_chat_turn(turn, ai_reply):
+    """Append a completed exchange to the user's history, summarizing the oldest ones past the budget"""
+    context = turn["context"]
+    turn["reply"] = ai_reply
+    if turn["initial"]:
+        context.has_addressed_initial_concern = True
+    with metrics.stage("history_update"):
+        history_manager.record(context, turn["message"], ai_reply)
+    metrics.count_reply(turn["source"])
+    if turn["source"] == "model" and catalogue_responder is not None:
+        catalogue_responder.observe_model_latency(time.monotonic() - turn["started"])
+    if turn["cache_key"] is not None:
+        response_cache.put(turn["cache_key"], ai_reply)
+    if turn["initial"]:
+        context.initial_health_concern = None
+    with metrics.stage("session_save"):
+        session_store.save_context(turn["user_id"], context)
+
+def session_tokens(user_id):
+    """Tokens billed to a session against SESSION_TOKEN_BUDGET (None when there is no budget)"""
+    used = sum(session_store.get_token_usage(user_id)) if user_id is not None else 0
+    budget = app.config["SESSION_TOKEN_BUDGET"]
+    return {
+        "tokens_used": used,
+        "token_budget": budget or None,
+        "tokens_remaining": max(0, budget - used) if budget else None
+    }
+
+def reply_usage(response, prompt, reply, history=()):
+    """(prompt tokens, completion tokens, estimated) of a model reply: what Gemini reported, else estimated from the texts"""
+    usage = token_usage(response)
+    if usage is not None:
+        return usage[0], usage[1], False
+    prompt_tokens = estimate_tokens(prompt) + sum(estimate_tokens(part) for entry in history for part in entry["parts"])
+    if not prompt.startswith(system_prompt):
+        # Sent as the model's system instruction (or cached context), which is billed all the same
+        prompt_tokens += estimate_tokens(system_prompt)
+    return prompt_tokens, estimate_tokens(reply), True
+
+def bill_reply(user_id, lease, usage, source="chat"):
+    """Charge a model reply's tokens to its key and hour, and to the session when there is one"""
+    prompt_tokens, completion_tokens, estimated = usage
+    token_ledger.record(lease.index, prompt_tokens, completion_tokens, estimated)
+    metrics.observe_reply_tokens(source, prompt_tokens, completion_tokens)
+    if user_id is not None:
+        session_store.add_token_usage(user_id, prompt_tokens, completion_tokens)
+
+def bill_discarded(lease, usage):
+    """Charge a hedged attempt that lost the race to its key; the session only pays for the reply it got"""
+    prompt_tokens, completion_tokens, estimated = usage
+    token_ledger.record(lease.index, prompt_tokens, completion_tokens, estimated)
+
+def discard_reply(lease, answer):
+    """llm_caller discard for (reply, usage) attempts"""
+    bill_discarded(lease, answer[1])
+
+def discard_stream(lease, started):
+    """llm_caller discard for streamed attempts: close the loser's stream and charge what it used so far"""
+    chunks, text, cached_content, (response, prompt, history) = started
+    close_stream(chunks, response)
+    bill_discarded(lease, reply_usage(response, prompt, text, history))
+
+def structured_reply(ai_reply, age):
+    """The reply's sections and checked medicines for the client, or None when it has none or the stage is off"""
+    if not app.config["STRUCTURED_REPLIES_ENABLED"]:
+        return None
+    with metrics.stage("reply_structure"):
+        return structure_reply(ai_reply, age)
+
+def chat_reply_payload(turn, ai_reply):
+    """JSON body for a model-backed reply"""
+    return {
+        "reply": ai_reply,
+        "structured": structured_reply(ai_reply, turn["context"].age),
+        "message_counted": turn["message_counted"],
+        "current_count": session_store.get_message_count(turn["user_id"])
+    }
+
+def join_chat_flight(user_id, user_msg, idempotency_key=None):
+    """Single-flight entry for a chat request: (flight, leader), or (None, True) when coalescing is off"""
+    if single_flight is None:
+        return None, True
+    with metrics.stage("single_flight"):
+        context = session_store.get_context(user_id) or new_context()
+        # A message repeated later in the conversation is a new turn, not a duplicate
+        position = len(context.history) + context.summarized_turns
+        idempotency_key = (user_id, idempotency_key[:128]) if idempotency_key else None
+        return single_flight.join((user_id, user_msg, position), idempotency_key)
+
+def finish_chat_flight(flight, result):
+    """Share the leader's (payload, status) with its duplicates; None lets them answer themselves"""
+    if flight is None:
+        return
+    # Failures are shared with requests already waiting, but a later retry gets a fresh attempt
+    remember = result is not None and result[1] == 200 and result[0].get("reply") != UNAVAILABLE_REPLY
+    single_flight.finish(flight, result, remember=remember)
+
+def shared_chat_reply(result):
+    """A duplicate's (payload, status): the first request's reply, without counting the message again"""
+    payload, status = result
+    metrics.count_reply("deduplicated")
+    return {**payload, "message_counted": False, "deduplicated": True}, status
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat_reply(turn):
+    """Yield the reply as SSE token events; attempts on other keys can take over until the first token arrives"""
+    def attempt(lease, timeout):
+        model, cached_content = model_for_key(lease.api_key)
+        history = history_manager.chat_history(turn["context"])
+        prompt = build_chat_input(model, cached_content, turn)
+        try:
+            chat_session = model.start_chat(history=history)
+            response = chat_session.send_message(prompt, stream=True, request_options={"timeout": timeout})
+            chunks = iter(response)
+            for chunk in chunks:
+                text = "".join(part.text for part in chunk.parts)
+                if text:
+                    return chunks, text, cached_content, (response, prompt, history)
+            return chunks, "", cached_content, (response, prompt, history)
+        except Exception as e:
+            if cached_content is not None:
+                context_cache.invalidate(lease.api_key, e)
+            raise
 
-Don't restart symptom gathering unless user starts a new topic
+    lease, started = llm_caller.call(attempt, hold=True, discard=discard_stream)
+    if lease is None:
+        yield sse_event("error", {"reply": UNAVAILABLE_REPLY})
+        return
 
-End the conversation softly if user says "ok", "thanks", or stops engaging
+    chunks, text, cached_content, (response, prompt, history) = started
+    parts = [text] if text else []
+    try:
+        if text:
+            yield sse_event("token", {"text": text})
+        for chunk in chunks:
+            text = "".join(part.text for part in chunk.parts)
+            if text:
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+    except GeneratorExit:
+        # The browser went away mid-reply; the key itself is fine
+        close_stream(chunks, response)
+        lease.succeed()
+        logger.info(f"Client disconnected during streamed reply for user {turn['user_id']}")
+        raise
+    except Exception as e:
+        # Tokens already reached the browser, so another key cannot take over
+        lease.fail(e)
+        logger.error(f"Gemini API Error with key {lease.index + 1}: {str(e)}")
+        if cached_content is not None:
+            context_cache.invalidate(lease.api_key, e)
+        yield sse_event("error", {"reply": UNAVAILABLE_REPLY})
+        return
+
+    lease.succeed()
+    ai_reply = "".join(parts).strip()
+    # Gemini reports the usage of the whole reply on its last chunk
+    bill_reply(turn["user_id"], lease, reply_usage(response, prompt, ai_reply, history))
+    record_chat_turn(turn, ai_reply)
+    yield sse_event("done", {
+        "structured": structured_reply(turn["reply"], turn["context"].age),
+        "message_counted": turn["message_counted"],
+        "current_count": session_store.get_message_count(turn["user_id"])
+    })
 
-Keep it short: max 6 turns per concern
+def shared_stream(events, turn, flight):
+    """Pass a streamed reply through, then share how it ended with duplicates of the request"""
+    result = None
+    try:
+        yield from events
+        reply = chat_reply_payload(turn, turn["reply"]) if turn["reply"] is not None else {"reply": UNAVAILABLE_REPLY}
+        result = reply, 200
+    finally:
+        finish_chat_flight(flight, result)
+
+def chat_priority(turn):
+    """Admission priority: consultations the model has already answered go ahead of new ones"""
+    context = turn["context"]
+    return PRIORITY_ONGOING if context.history or context.summarized_turns else PRIORITY_NEW
+
+def busy_chat_reply(turn):
+    """503 reply for a turn shed by the admission gate; the message it counted is given back"""
+    if turn["message_counted"]:
+        session_store.refund_message_count(turn["user_id"])
+    seconds = admission_gate.retry_after()
+    return {
+        "reply": BUSY_REPLY.format(seconds=seconds),
+        "busy": True,
+        "retry_after": seconds,
+        "message_counted": False,
+        "current_count": session_store.get_message_count(turn["user_id"])
+    }, 503
+
+def admit_chat_turn(turn):
+    """(ticket, None) once the turn may call the model, or (None, busy reply) when the service is saturated"""
+    if admission_gate is None:
+        return None, None
+    with metrics.stage("admission"):
+        ticket = admission_gate.admit(chat_priority(turn))
+    if ticket is None:
+        return None, busy_chat_reply(turn)
+    return ticket, None
+
+def release_chat_turn(ticket):
+    if ticket is not None:
+        ticket.release()
+
+def retry_headers(payload):
+    return {"Retry-After": str(payload["retry_after"])} if "retry_after" in payload else {}
+
+def generate_chat_reply(turn):
+    """The model's reply to a gated turn, or UNAVAILABLE_REPLY when no attempt succeeded within the deadline"""
+    def attempt(lease, timeout):
+        model, cached_content = model_for_key(lease.api_key)
+        history = history_manager.chat_history(turn["context"])
+        prompt = build_chat_input(model, cached_content, turn)
+        try:
+            chat_session = model.start_chat(history=history)
+            response = chat_session.send_message(prompt, request_options={"timeout": timeout})
+            ai_reply = response.text.strip()
+        except Exception as e:
+            if cached_content is not None:
+                context_cache.invalidate(lease.api_key, e)
+            raise
+        return ai_reply, reply_usage(response, prompt, ai_reply, history)
+
+    lease, answer = llm_caller.call(attempt, discard=discard_reply)
+    if lease is None:
+        return UNAVAILABLE_REPLY
+    ai_reply, usage = answer
+    bill_reply(turn["user_id"], lease, usage)
+    record_chat_turn(turn, ai_reply)
+    return ai_reply
 
-🎯 PROBLEM CONTEXT PRESERVATION:
-- When user mentions a health issue in their first message, REMEMBER that problem
-- After asking for age/gender, refer back to their original problem
-- Example: User says "I have headache" → Ask age/gender → Then say "Now about your headache..."
-- Never ask "What are your symptoms?" if they already told you their problem
-- Always acknowledge their original concern before asking follow-up questions
-- Use phrases like "Regarding your [original problem]..." or "About your [original issue]..."
-- When addressing a remembered health concern, start with "Now about your [original issue]..." or "Regarding your [original problem]..."
-- Provide immediate, actionable advice for the remembered concern without asking for symptoms again
+@app.route("/chat", methods=["POST"])
+@chat_rate_limits
+def chat():
+    try:
+        with metrics.stage("parse"):
+            user_msg = request.json.get("message", "").strip()
 
-MULTIPLE PATIENT HANDLING:
-- When user mentions new symptoms or health concerns, ALWAYS ask: "Is this for the same person, or a different patient?"
-- If same patient: Use previously provided age/gender information
-- If different patient: Ask for age and gender again before providing any medication recommendations
-- Store and use the correct age/gender for each medication recommendation
-- Never assume it's the same patient when new symptoms are mentioned
-
-PATIENT CONTEXT MANAGEMENT:
-- If user says "different person" or "someone else": Ask for age and gender
-- If user says "same person" or doesn't specify: Use existing patient info
-- Always verify age before recommending any medication
-- For children under 6, be extra cautious and recommend doctor consultation
-- For infants under 2, only recommend safe options like ORS, saline drops
-
-❗ SAFETY & ETHICS:
-If serious symptoms: Urge visiting a licensed doctor in person
-
-If confused: Say "This sounds complex. Please consult a doctor soon."
-
-If symptoms worsen or last >2–3 days: Recommend escalation
+        if not user_msg:
+            return jsonify({"reply": "Please describe your symptoms or ask a health-related question."})
 
-ALWAYS verify age before recommending any medication dosage
-"""
+        logger.debug(f"Chat request received - User ID: {session.get('user_id', 'unknown')}")
 
-user_context = {}
+        if "user_id" not in session:
+            session["user_id"] = str(uuid4())
 
-@app.route("/")
-def index():
-    return render_template("index.html")
+        # A duplicate of a message still being answered waits for that reply instead of calling the model again
+        flight, leader = join_chat_flight(session["user_id"], user_msg, request.headers.get("Idempotency-Key"))
+        if not leader:
+            result = flight.wait(single_flight.wait_timeout)
+            if result is not None:
+                payload, status = shared_chat_reply(result)
+                return jsonify(payload), status, retry_headers(payload)
+            # The first request gave up without a reply, so answer this one on its own
+            flight = None
+
+        result = None
+        try:
+            reply, turn = prepare_chat_turn(session["user_id"], user_msg)
+            if reply is None:
+                ticket, reply = admit_chat_turn(turn)
+                if reply is None:
+                    try:
+                        reply = chat_reply_payload(turn, generate_chat_reply(turn)), 200
+                    finally:
+                        release_chat_turn(ticket)
+            result = reply
+        finally:
+            finish_chat_flight(flight, result)
+
+        with metrics.stage("serialization"):
+            return jsonify(result[0]), result[1], retry_headers(result[0])
+        
+    except Exception as e:
+        logger.error(f"Unexpected error in chat route: {str(e)}")
+        return jsonify({"reply": "An unexpected error occurred. Please try again."}), 500
 
-@app.route("/chat", methods=["POST"])
-def chat():
+@app.route("/chat/stream", methods=["POST"])
+@chat_rate_limits
+def chat_stream():
+    """Same as /chat, but the model's reply is streamed as Server-Sent Events"""
     try:
-        user_msg = request.json.get("message", "").strip()
+        with metrics.stage("parse"):
+            user_msg = request.json.get("message", "").strip()
 
         if not user_msg:
             return jsonify({"reply": "Please describe your symptoms or ask a health-related question."})
 
-        logger.info(f"Chat request received - User ID: {session.get('user_id', 'unknown')}")
+        logger.debug(f"Streaming chat request received - User ID: {session.get('user_id', 'unknown')}")
 
         if "user_id" not in session:
             session["user_id"] = str(uuid4())
-        user_id = session["user_id"]
-
-        # Check message limit
-        if user_id not in user_message_counts:
-            user_message_counts[user_id] = 0
-
-        if user_id not in user_context:
-            user_context[user_id] = {
-                "age": None,
-                "gender": None,
-                "history": [],
-                "initial_health_concern": None,
-                "has_addressed_initial_concern": False
-            }
-
-        context = user_context[user_id]
-
-        health_keywords = [
-            "headache", "pain", "fever", "sick", "ill", "symptom", "problem", "hurt", "ache", 
-            "nausea", "dizzy", "cough", "cold", "flu", "stomach", "chest", "back", "joint", 
-            "muscle", "throat", "ear", "eye", "nose", "skin", "rash", "allergy", "medicine", 
-            "medication", "pill", "tablet", "dose", "dosage", "vomit", "diarrhea", "constipation",
-            "bloating", "gas", "heartburn", "acid", "indigestion", "swelling", "inflammation",
-            "infection", "bacterial", "viral", "fungal", "itchy", "burning", "tingling", "numbness",
-            "weakness", "fatigue", "tired", "exhausted", "insomnia", "sleep", "appetite", "hungry",
-            "thirsty", "dehydrated", "bleeding", "bruise", "cut", "wound", "burn", "sprain", "strain",
-            "fracture", "broken", "dislocation", "arthritis", "diabetes", "hypertension", "asthma",
-            "allergic", "reaction", "anaphylaxis", "seizure", "convulsion", "migraine", "cluster",
-            "tension", "sinus", "bronchitis", "pneumonia", "tonsillitis", "laryngitis", "pharyngitis",
-            "gastritis", "ulcer", "colitis", "hepatitis", "kidney", "bladder", "urinary", "uti",
-            "yeast", "candida", "herpes", "warts", "mole", "cyst", "tumor", "cancer", "benign",
-            "malignant", "metastasis", "remission", "relapse", "chronic", "acute", "subacute", "first aid kit",
-            "tummy", "belly", "abdomen", "gut", "digestive", "upset", "unwell", "feeling bad", "not feeling well"
-        ]
-        
-        is_health_concern = any(keyword in user_msg.lower() for keyword in health_keywords)
-        
-        if is_health_concern and (not context["age"] or not context["gender"]):
-            if not context["initial_health_concern"] or (context["has_addressed_initial_concern"] and is_health_concern):
-                context["initial_health_concern"] = user_msg
-                context["has_addressed_initial_concern"] = False
-            
-            if not context["age"]:
-                return jsonify({"reply": "To assist you better, may I know your age?"})
-            if not context["gender"]:
-                return jsonify({"reply": "Thank you. Could you also let me know your gender (male or female)?"})
-
-        if not context["age"]:
-            for word in user_msg.split():
-                if word.isdigit() and 0 < int(word) < 120:
-                    context["age"] = int(word)
-                    break
-
-        if not context["gender"]:
-            if "male" in user_msg.lower():
-                context["gender"] = "male"
-            elif "female" in user_msg.lower():
-                context["gender"] = "female"
-
-        if is_health_concern and (not context["age"] or not context["gender"]):
-            if not context["age"]:
-                return jsonify({"reply": "To assist you better, may I know your age?"})
-            if not context["gender"]:
-                return jsonify({"reply": "Thank you. Could you also let me know your gender (male or female)?"})
-        
-        if is_health_concern and context["age"] and context["gender"] and context["has_addressed_initial_concern"]:
-            context["initial_health_concern"] = user_msg
-            context["has_addressed_initial_concern"] = False
 
-        # Only increment message count if we're about to use the AI
-        message_counted = False
-        
-        # Don't count age/gender questions
-        is_age_gender_question = (
-            not context["age"] or 
-            not context["gender"] or
-            "may I know your age" in user_msg.lower() or
-            "let me know your gender" in user_msg.lower()
-        )
-        
-        if not is_age_gender_question:
-            logger.info(f"Incrementing message count for user {user_id}. Current count: {user_message_counts[user_id]}")
-            if user_message_counts[user_id] >= MESSAGE_LIMIT:
-                return jsonify({
-                    "reply": f"⚠️ I've reached my API limit for this session. I can only process {MESSAGE_LIMIT} consultations per session to manage costs. Please refresh the page to start a new session or try again later. Thank you for understanding!",
-                    "limit_reached": True
-                }), 429
-            user_message_counts[user_id] += 1
-            message_counted = True
-            logger.info(f"Message count incremented. New count: {user_message_counts[user_id]}")
-        else:
-            logger.info(f"Not incrementing message count - Age/gender question detected")
+        # Duplicates wait for the first request's reply and get it as JSON
+        flight, leader = join_chat_flight(session["user_id"], user_msg, request.headers.get("Idempotency-Key"))
+        if not leader:
+            result = flight.wait(single_flight.wait_timeout)
+            if result is not None:
+                payload, status = shared_chat_reply(result)
+                return jsonify(payload), status, retry_headers(payload)
+            flight = None
 
+        # Replies that don't need the model come back as JSON, exactly like /chat
         try:
-            if is_health_concern and (not context["age"] or not context["gender"]):
-                return jsonify({"reply": "Please provide BOTH your age and gender first so I can give you appropriate medical advice."})
-            
-            # Try with current API key, fallback to others if needed
-            max_retries = len(available_api_keys)
-            retry_count = 0
-            ai_reply = None
-            
-            while retry_count < max_retries and ai_reply is None:
-                try:
-                    try:
-                        model = genai.GenerativeModel("gemini-1.5-flash", system_instruction=system_prompt)
-                    except TypeError:
-                        model = genai.GenerativeModel("gemini-1.5-flash")
-                    
-                    preface = f"The user is a {context['age']} year old {context['gender']}. DO NOT ask for age or gender again as this information has already been provided."
-                    
-                    if context["initial_health_concern"] and not context["has_addressed_initial_concern"] and context["age"] and context["gender"]:
-                        if hasattr(model, 'system_instruction'):
-                            initial_input = f"{preface}\nUser: {context['initial_health_concern']}"
-                        else:
-                            initial_input = f"{system_prompt}\n\n{preface}\nUser: {context['initial_health_concern']}"
-                        chat_session = model.start_chat(history=context["history"])
-                        response = chat_session.send_message(initial_input)
-                        ai_reply = response.text.strip()
-                        
-                        context["has_addressed_initial_concern"] = True
-                        
-                        context["history"].append({"role": "user", "parts": [context["initial_health_concern"]]})
-                        context["history"].append({"role": "model", "parts": [ai_reply]})
-                        
-                        context["initial_health_concern"] = None
-                        
-                    elif context["initial_health_concern"] and not context["has_addressed_initial_concern"] and (not context["age"] or not context["gender"]):
-                        if not context["age"]:
-                            return jsonify({"reply": "To assist you better, may I know your age?"})
-                        if not context["gender"]:
-                            return jsonify({"reply": "Thank you. Could you also let me know your gender (male or female)?"})
-                        
-                    else:
-                        if hasattr(model, 'system_instruction'):
-                            full_input = f"{preface}\nUser: {user_msg}"
-                        else:
-                            full_input = f"{system_prompt}\n\n{preface}\nUser: {user_msg}"
-                        chat_session = model.start_chat(history=context["history"])
-                        response = chat_session.send_message(full_input)
-                        ai_reply = response.text.strip()
-
-                        context["history"].append({"role": "user", "parts": [user_msg]})
-                        context["history"].append({"role": "model", "parts": [ai_reply]})
-                    
-                    # If we get here, the API call was successful
-                    break
-                    
-                except Exception as e:
-                    logger.error(f"Gemini API Error with key {current_key_index + 1}: {str(e)}")
-                    retry_count += 1
-                    
-                    if retry_count < max_retries:
-                        # Switch to next API key
-                        switch_to_next_api_key()
-                        logger.info(f"Retrying with next API key ({retry_count}/{max_retries})")
-                    else:
-                        # All keys failed
-                        logger.error("All API keys have failed")
-                        ai_reply = "⚠️ Sorry, I'm temporarily unavailable. Please try again later."
-                        break
+            reply, turn = prepare_chat_turn(session["user_id"], user_msg)
+        except Exception:
+            finish_chat_flight(flight, None)
+            raise
+        if reply is not None:
+            finish_chat_flight(flight, reply)
+            return jsonify(reply[0]), reply[1]
+
+        # The slot is held until the stream closes
+        try:
+            ticket, reply = admit_chat_turn(turn)
+        except Exception:
+            finish_chat_flight(flight, None)
+            raise
+        if reply is not None:
+            finish_chat_flight(flight, reply)
+            return jsonify(reply[0]), reply[1], retry_headers(reply[0])
+
+        events = stream_chat_reply(turn) if flight is None else shared_stream(stream_chat_reply(turn), turn, flight)
+        response = Response(
+            stream_with_context(events),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        # A stream closed before it started never runs shared_stream's cleanup
+        response.call_on_close(lambda: finish_chat_flight(flight, None))
+        response.call_on_close(lambda: release_chat_turn(ticket))
+        return response
 
-        except Exception as e:
-            logger.error(f"Unexpected error in chat route: {str(e)}")
-            ai_reply = "⚠️ Sorry, I'm temporarily unavailable. Please try again later."
-
-        return jsonify({
-            "reply": ai_reply,
-            "message_counted": message_counted,
-            "current_count": user_message_counts.get(user_id, 0)
-        })
-        
     except Exception as e:
-        logger.error(f"Unexpected error in chat route: {str(e)}")
+        logger.error(f"Unexpected error in chat stream route: {str(e)}")
         return jsonify({"reply": "An unexpected error occurred. Please try again."}), 500
 
+def admit_batch_record(deadline):
+    """Ticket for a batch record's model call, queued behind chats and retried until deadline; None if it never got one"""
+    while True:
+        ticket = admission_gate.admit(PRIORITY_BATCH)
+        remaining = deadline - time.monotonic()
+        if ticket is not None or remaining <= 0:
+            return ticket
+        time.sleep(min(admission_gate.retry_after(), remaining))
+
+def answer_batch_record(record):
+    """Result fields for one batch record, answered as the opening turn of a consultation that has no session"""
+    context = new_context()
+    context.age = record["age"]
+    context.gender = record["gender"]
+    if record["temperature"]:
+        context.temperature = describe_temperature(record["temperature"])
+    if record["duration"]:
+        context.duration = describe_duration(record["duration"])
+    turn = {
+        "user_id": None,
+        "context": context,
+        "user_msg": record["message"],
+        "message": record["message"],
+        "initial": False,
+        "message_counted": False,
+        "cache_key": None,
+        "source": "model",
+        "reply": None,
+        "started": time.monotonic()
+    }
+
+    catalogue_reply = catalogue_responder.reply(turn["message"], context.age, context.gender) if catalogue_responder else None
+    if catalogue_reply is not None:
+        return {"status": "ok", "source": "catalogue", "reply": catalogue_reply,
+                "structured": structured_reply(catalogue_reply, context.age)}
+    cached_reply = cached_opening_reply(turn)
+    if cached_reply is not None:
+        return {"status": "ok", "source": "cache", "reply": cached_reply, "structured": structured_reply(cached_reply, context.age)}
+
+    ticket = None
+    if admission_gate is not None:
+        ticket = admit_batch_record(turn["started"] + app.config["BATCH_RECORD_TIMEOUT"])
+        if ticket is None:
+            return {"status": "busy", "error": "no model capacity before the record timed out"}
+
+    keys = []
+    def attempt(lease, timeout):
+        keys.append(lease.index)
+        model, cached_content = model_for_key(lease.api_key)
+        prompt = build_chat_input(model, cached_content, turn)
+        try:
+            response = model.generate_content(prompt, request_options={"timeout": timeout})
+            reply = response.text.strip()
+        except Exception as e:
+            if cached_content is not None:
+                context_cache.invalidate(lease.api_key, e)
+            raise
+        return reply, reply_usage(response, prompt, reply)
+
+    try:
+        lease, answer = llm_caller.call(attempt, discard=discard_reply)
+    finally:
+        release_chat_turn(ticket)
+    cost = {"prompt_tokens": 0, "completion_tokens": 0, "attempts": len(keys)}
+    if lease is None:
+        return {"status": "unavailable", "error": "the model did not answer on any key", "cost": cost}
+    reply, usage = answer
+    bill_reply(None, lease, usage, source="batch")
+    cost["prompt_tokens"], cost["completion_tokens"], estimated = usage
+    if estimated:
+        cost["estimated"] = True
+    if turn["cache_key"] is not None:
+        response_cache.put(turn["cache_key"], reply)
+    return {"status": "ok", "source": "model", "reply": reply, "structured": structured_reply(reply, context.age),
+            "key": lease.index + 1, "cost": cost}
+
+# Bulk triage for partner clinics: from the command line (batch.py) and, with a token set, over HTTP
+if app.config["SESSION_STORE"] == "redis":
+    batch_journal = RedisJournal(app.config["SESSION_REDIS_URL"], ttl=app.config["BATCH_JOURNAL_TTL"])
+else:
+    batch_journal = MemoryJournal(ttl=app.config["BATCH_JOURNAL_TTL"])
+batch_runner = BatchRunner(
+    answer_batch_record,
+    concurrency=app.config["BATCH_CONCURRENCY_PER_KEY"] * max(1, len(key_pool)),
+    journal=batch_journal
+)
+
+BATCH_JOB_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """Triage a JSONL batch of records, streaming a JSONL result per record as it finishes; see batch.py"""
+    token = app.config["BATCH_API_TOKEN"]
+    if not token:
+        return jsonify({"error": "Not available"}), 404
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+        return jsonify({"error": "A valid batch API token is required"}), 401
+
+    # Sending the same job_id again resumes the job
+    job_id = request.args.get("job_id") or uuid4().hex
+    if not BATCH_JOB_ID.match(job_id):
+        return jsonify({"error": "job_id must be 1-64 letters, digits, '.', '_' or '-'"}), 400
+    try:
+        records = parse_records(request.get_data(as_text=True).splitlines(), max_records=app.config["BATCH_MAX_RECORDS"])
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.info(f"Batch job {job_id}: {len(records)} record(s)")
+    lines = (json.dumps(result) + "\n" for result in batch_runner.run(records, job_id))
+    return Response(
+        lines,
+        mimetype="application/x-ndjson",
+        headers={"X-Batch-Job-Id": job_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     debug_mode = os.getenv("FLASK_ENV") == "development"
+    start_llm_warmup()
     app.run(debug=debug_mode, host="0.0.0.0", port=int(os.getenv("PORT", 5000)))
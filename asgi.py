@@ -0,0 +1,349 @@
+"""
+ASGI entry point for the async serving mode.
+
+/chat and /chat/stream run on the event loop with the asyncio Gemini client, so a
+single process can hold hundreds of LLM calls in flight instead of pinning one
+worker thread per call. Every other route is served by the Flask app. Sessions go
+through Flask's own signed-cookie session interface, so a browser can move between
+the sync and async deployments without losing its consultation. The quota check
+and session store reads and writes shared with the Flask routes are blocking
+(Redis, in production), so they run on worker threads with asyncio.to_thread.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+
+import asyncio
+import json
+import logging
+import time
+from types import SimpleNamespace
+from uuid import uuid4
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import parse_cookie
+
+import metrics
+
+from app import (
+    UNAVAILABLE_REPLY,
+    add_security_headers,
+    admission_gate,
+    app as flask_app,
+    bill_discarded,
+    bill_reply,
+    build_chat_input,
+    busy_chat_reply,
+    chat_priority,
+    chat_rate_limits,
+    chat_reply_payload,
+    context_cache,
+    discard_reply,
+    finish_chat_flight,
+    history_manager,
+    join_chat_flight,
+    llm_caller,
+    model_for_key,
+    model_pool,
+    prepare_chat_turn,
+    record_chat_turn,
+    reply_usage,
+    retry_headers,
+    session_store,
+    shared_chat_reply,
+    single_flight,
+    sse_event,
+    start_llm_warmup,
+    structured_reply,
+)
+from model_pool import aclose_stream
+
+logger = logging.getLogger(__name__)
+
+# The remaining routes are quick, so asgiref's single worker thread is enough for them
+flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def async_model_for_key(api_key):
+    """model_for_key with its asyncio client bound; cache creation runs off the event loop"""
+    if context_cache is None:
+        model, cached_content = model_for_key(api_key)
+    else:
+        model, cached_content = await asyncio.to_thread(model_for_key, api_key)
+    return model_pool.bind_async(model, api_key), cached_content
+
+
+async def admit_turn(turn):
+    """Async counterpart of admit_chat_turn: queued turns wait on the event loop, not a thread"""
+    if admission_gate is None:
+        return None, None
+    with metrics.stage("admission"):
+        ticket = await admission_gate.admit_async(chat_priority(turn))
+    if ticket is None:
+        return None, await asyncio.to_thread(busy_chat_reply, turn)
+    return ticket, None
+
+
+async def release_turn(ticket):
+    if ticket is not None:
+        await ticket.release_async()
+
+
+def finish_turn(turn, lease, usage, ai_reply):
+    """Charge the reply and save the turn; both write to the session store"""
+    bill_reply(turn["user_id"], lease, usage)
+    record_chat_turn(turn, ai_reply)
+
+
+async def generate_reply(turn):
+    """Async counterpart of generate_chat_reply: deadline-bounded, hedged attempts across the key pool"""
+    async def attempt(lease, timeout):
+        model, cached_content = await async_model_for_key(lease.api_key)
+        history = history_manager.chat_history(turn["context"])
+        prompt = build_chat_input(model, cached_content, turn)
+        try:
+            chat_session = model.start_chat(history=history)
+            response = await chat_session.send_message_async(prompt, request_options={"timeout": timeout})
+            ai_reply = response.text.strip()
+        except Exception as e:
+            if cached_content is not None:
+                context_cache.invalidate(lease.api_key, e)
+            raise
+        return ai_reply, reply_usage(response, prompt, ai_reply, history)
+
+    lease, answer = await llm_caller.call_async(attempt, discard=discard_reply)
+    if lease is None:
+        return UNAVAILABLE_REPLY
+    ai_reply, usage = answer
+    await asyncio.to_thread(finish_turn, turn, lease, usage, ai_reply)
+    return ai_reply
+
+
+async def discard_stream(lease, started):
+    """Async counterpart of app.discard_stream: close the losing stream and charge what it used so far"""
+    chunks, text, cached_content, (response, prompt, history) = started
+    await aclose_stream(chunks, response)
+    bill_discarded(lease, reply_usage(response, prompt, text, history))
+
+
+async def stream_reply(turn):
+    """Async counterpart of stream_chat_reply: SSE token events, other keys can take over until the first token"""
+    async def attempt(lease, timeout):
+        model, cached_content = await async_model_for_key(lease.api_key)
+        history = history_manager.chat_history(turn["context"])
+        prompt = build_chat_input(model, cached_content, turn)
+        response = chunks = None
+        try:
+            chat_session = model.start_chat(history=history)
+            response = await chat_session.send_message_async(prompt, stream=True, request_options={"timeout": timeout})
+            chunks = response.__aiter__()
+            async for chunk in chunks:
+                text = "".join(part.text for part in chunk.parts)
+                if text:
+                    return chunks, text, cached_content, (response, prompt, history)
+            return chunks, "", cached_content, (response, prompt, history)
+        except asyncio.CancelledError:
+            # Lost the race or timed out before its first token; the prompt was still sent
+            if response is not None:
+                await aclose_stream(chunks, response)
+                bill_discarded(lease, reply_usage(response, prompt, "", history))
+            raise
+        except Exception as e:
+            if cached_content is not None:
+                context_cache.invalidate(lease.api_key, e)
+            raise
+
+    lease, started = await llm_caller.call_async(attempt, hold=True, discard=discard_stream)
+    if lease is None:
+        yield sse_event("error", {"reply": UNAVAILABLE_REPLY})
+        return
+
+    chunks, text, cached_content, (response, prompt, history) = started
+    parts = [text] if text else []
+    try:
+        if text:
+            yield sse_event("token", {"text": text})
+        async for chunk in chunks:
+            text = "".join(part.text for part in chunk.parts)
+            if text:
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+    except (GeneratorExit, asyncio.CancelledError):
+        # The browser went away mid-reply; the key itself is fine
+        await aclose_stream(chunks, response)
+        lease.succeed()
+        logger.info(f"Client disconnected during streamed reply for user {turn['user_id']}")
+        raise
+    except Exception as e:
+        # Tokens already reached the browser, so another key cannot take over
+        lease.fail(e)
+        logger.error(f"Gemini API Error with key {lease.index + 1}: {str(e)}")
+        if cached_content is not None:
+            context_cache.invalidate(lease.api_key, e)
+        yield sse_event("error", {"reply": UNAVAILABLE_REPLY})
+        return
+
+    lease.succeed()
+    ai_reply = "".join(parts).strip()
+    await asyncio.to_thread(finish_turn, turn, lease, reply_usage(response, prompt, ai_reply, history), ai_reply)
+    yield sse_event("done", {
+        "structured": structured_reply(turn["reply"], turn["context"].age),
+        "message_counted": turn["message_counted"],
+        "current_count": await asyncio.to_thread(session_store.get_message_count, turn["user_id"])
+    })
+
+
+async def shared_stream(events, turn, flight):
+    """Async counterpart of app.shared_stream: share how the streamed reply ended with its duplicates"""
+    result = None
+    try:
+        async for event in events:
+            yield event
+        if turn["reply"] is not None:
+            reply = await asyncio.to_thread(chat_reply_payload, turn, turn["reply"])
+        else:
+            reply = {"reply": UNAVAILABLE_REPLY}
+        result = reply, 200
+    finally:
+        finish_chat_flight(flight, result)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def start_response(send, session, response):
+    """Save the session cookie, add the usual security headers and send the status line"""
+    flask_app.session_interface.save_session(flask_app, session, response)
+    add_security_headers(response)
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()],
+    })
+
+
+async def send_stream(send, session, turn, started, flight=None):
+    response = flask_app.response_class(
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    await start_response(send, session, response)
+    metrics.observe_request("chat_stream", response.status_code, time.perf_counter() - started)
+    events = stream_reply(turn) if flight is None else shared_stream(stream_reply(turn), turn, flight)
+    try:
+        async for event in events:
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    except Exception as e:
+        # Headers are already out, so the only option left is to end the stream
+        logger.error(f"Unexpected error in chat stream route: {str(e)}")
+    finally:
+        await events.aclose()
+    await send({"type": "http.response.body", "body": b""})
+
+
+def over_chat_quota(scope, headers):
+    """The Flask app's 429 response when this request is over a chat quota, else None"""
+    client = scope.get("client")
+    with flask_app.test_request_context(
+        scope["path"],
+        method="POST",
+        headers={"Cookie": headers.get(b"cookie", b"").decode("latin-1")},
+        environ_base={"REMOTE_ADDR": client[0] if client else ""}
+    ):
+        return chat_rate_limits.check()
+
+
+async def handle_chat(scope, receive, send, stream):
+    """POST /chat and /chat/stream, with the same responses as the Flask routes"""
+    headers = dict(scope["headers"])
+    cookies = parse_cookie(headers.get(b"cookie", b"").decode("latin-1"))
+    session = flask_app.session_interface.open_session(flask_app, SimpleNamespace(cookies=cookies))
+
+    started = time.perf_counter()
+    # Shed clients over their quotas before the body is even read
+    rejection = await asyncio.to_thread(over_chat_quota, scope, headers)
+    if rejection is not None:
+        await start_response(send, session, rejection)
+        await send({"type": "http.response.body", "body": rejection.get_data()})
+        metrics.observe_request("chat_stream" if stream else "chat", rejection.status_code, time.perf_counter() - started)
+        return
+
+    try:
+        body = await read_body(receive)
+        with metrics.stage("parse"):
+            user_msg = json.loads(body or b"{}").get("message", "").strip()
+        if not user_msg:
+            payload, status = {"reply": "Please describe your symptoms or ask a health-related question."}, 200
+        else:
+            logger.debug(f"Chat request received - User ID: {session.get('user_id', 'unknown')}")
+            if "user_id" not in session:
+                session["user_id"] = str(uuid4())
+
+            idempotency_key = headers.get(b"idempotency-key", b"").decode("latin-1")
+            flight, leader = await asyncio.to_thread(join_chat_flight, session["user_id"], user_msg, idempotency_key)
+            shared = None
+            if not leader:
+                # Waiting on the first request's reply must not block the event loop
+                shared = await asyncio.to_thread(flight.wait, single_flight.wait_timeout)
+                flight = None
+
+            if shared is not None:
+                payload, status = shared_chat_reply(shared)
+            else:
+                result = None
+                try:
+                    reply, turn = await asyncio.to_thread(prepare_chat_turn, session["user_id"], user_msg)
+                    if reply is None:
+                        ticket, reply = await admit_turn(turn)
+                    if reply is None:
+                        try:
+                            if stream:
+                                return await send_stream(send, session, turn, started, flight)
+                            ai_reply = await generate_reply(turn)
+                            reply = await asyncio.to_thread(chat_reply_payload, turn, ai_reply), 200
+                        finally:
+                            await release_turn(ticket)
+                    payload, status = result = reply
+                finally:
+                    # A no-op when the stream already shared its reply
+                    finish_chat_flight(flight, result)
+    except Exception as e:
+        logger.error(f"Unexpected error in chat route: {str(e)}")
+        payload, status = {"reply": "An unexpected error occurred. Please try again."}, 500
+
+    with metrics.stage("serialization"):
+        response = flask_app.json.response(payload)
+        response.status_code = status
+        response.headers.update(retry_headers(payload))
+    await start_response(send, session, response)
+    await send({"type": "http.response.body", "body": response.get_data()})
+    metrics.observe_request("chat_stream" if stream else "chat", status, time.perf_counter() - started)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Startup completes at once; the SDK loads on a thread while /health already answers
+                start_llm_warmup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in ("/chat", "/chat/stream"):
+        trace_token = metrics.begin_trace()
+        try:
+            await handle_chat(scope, receive, send, stream=scope["path"] == "/chat/stream")
+        finally:
+            metrics.end_trace(trace_token, f"POST {scope['path']}")
+        return
+
+    await flask_asgi(scope, receive, send)
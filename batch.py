@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Batch triage: many symptom descriptions answered without the interactive flow.
+
+A batch is JSONL, one record per line:
+    {"id": "clinic-17", "message": "Dry cough for 3 days", "age": 34, "gender": "female"}
+The id may also be given as request_id; without one, a record is named after its
+line ("line-3"). Age and gender are taken from the message when the fields are
+absent ("34F with a dry cough"). Each record is answered as the opening turn of a
+consultation, with no session, message count or follow-up questions, so a record
+still missing its age or gender is reported as invalid rather than asked about.
+
+Records are fanned out over a bounded thread pool, `concurrency` at a time (sized
+from the API key pool), and every model call goes through the admission gate at
+batch priority, behind interactive chats. Results come back as soon as each
+record finishes, in completion order, each with its line index, latency and cost
+(tokens Gemini reported, or estimated, and the attempts it took). A summary line
+ends the stream.
+
+Finished results (answered or invalid) are written to a journal as they complete.
+Running the same job again answers only what is not in it yet, and replays the
+rest first, marked "resumed", so a batch cut short by a crash, a deploy or a
+dropped connection picks up where it stopped. Records that were turned away or
+failed on every key are not journaled and are tried again on the next run. Each
+result carries a digest of the record it answered (message, age and gender, or
+the line of an invalid record); a record whose digest no longer matches, such as
+a line-numbered record after lines were inserted above it, is answered again.
+
+Run from the command line against the app's configuration:
+    python batch.py records.jsonl results.jsonl [--concurrency 8]
+Rerun the same command to resume: results.jsonl is the journal.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from demographics import MAX_AGE, extract_patient_facts
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_CHARS = 2000
+MAX_ID_CHARS = 128
+
+STATUS_OK = "ok"
+STATUS_INVALID = "invalid"
+# Written to the journal; any other status is retried when the job runs again
+FINISHED = (STATUS_OK, STATUS_INVALID)
+
+NO_COST = {"prompt_tokens": 0, "completion_tokens": 0, "attempts": 0}
+
+
+class BatchError(ValueError):
+    """A batch that cannot be run at all"""
+
+
+def _age(value):
+    """Age in years from a number or text such as "34" or "6 months", or None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value if 0 < value < MAX_AGE else None
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            number = float(text)
+        except ValueError:
+            return extract_patient_facts(text).age
+        return _age(int(number) if number == int(number) else number)
+    return None
+
+
+def _gender(value):
+    """"male" or "female" from text such as "F" or "woman", or None"""
+    if not isinstance(value, str):
+        return None
+    return extract_patient_facts(value.strip()).gender
+
+
+def _invalid(index, record_id, error):
+    return {"index": index, "id": record_id, "error": error}
+
+
+def parse_record(line, index):
+    """One JSONL line as a record for triage, or one carrying the reason it is invalid"""
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return _invalid(index, f"line-{index}", f"invalid JSON: {e}")
+    if not isinstance(data, dict):
+        return _invalid(index, f"line-{index}", "expected a JSON object")
+
+    record_id = data.get("id", data.get("request_id"))
+    if record_id is None:
+        record_id = f"line-{index}"
+    elif isinstance(record_id, (str, int)) and not isinstance(record_id, bool) and 0 < len(str(record_id)) <= MAX_ID_CHARS:
+        record_id = str(record_id)
+    else:
+        return _invalid(index, f"line-{index}", f"id must be a string of at most {MAX_ID_CHARS} characters")
+
+    message = data.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return _invalid(index, record_id, "message must be a non-empty string")
+    message = message.strip()
+    if len(message) > MAX_MESSAGE_CHARS:
+        return _invalid(index, record_id, f"message is longer than {MAX_MESSAGE_CHARS} characters")
+
+    facts = extract_patient_facts(message)
+    age = _age(data["age"]) if data.get("age") is not None else facts.age
+    gender = _gender(data["gender"]) if data.get("gender") is not None else facts.gender
+    if age is None:
+        return _invalid(index, record_id, "age is missing or not a plausible age")
+    if gender is None:
+        return _invalid(index, record_id, "gender is missing or not male or female")
+    return {
+        "index": index,
+        "id": record_id,
+        "message": message,
+        "age": age,
+        "gender": gender,
+        "temperature": facts.temperature,
+        "duration": facts.duration,
+    }
+
+
+def record_digest(record, line):
+    """Short hash of what a record's answer depends on, kept in the journal with its result"""
+    parts = [line.strip()] if "error" in record else [record["message"], record["age"], record["gender"]]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_records(lines, max_records=None):
+    """Records from JSONL lines, numbered from 1; blank lines are skipped and a repeated id is invalid"""
+    records = []
+    seen = set()
+    for index, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if max_records is not None and len(records) >= max_records:
+            raise BatchError(f"a batch holds at most {max_records} records")
+        record = parse_record(line, index)
+        if record["id"] in seen:
+            # Named after its line, so its result can't stand in for the first record's
+            record = _invalid(index, f"line-{index}", f"duplicate id {record['id']}")
+        record["digest"] = record_digest(record, line)
+        seen.add(record["id"])
+        records.append(record)
+    if not records:
+        raise BatchError("the batch has no records")
+    return records
+
+
+class MemoryJournal:
+    """Finished results per job, kept by this process for ttl seconds"""
+
+    def __init__(self, ttl=86400, max_jobs=256):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, job_id):
+        """Finished results of a job by record id"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return {}
+            expires, results = job
+            if expires < time.monotonic():
+                del self._jobs[job_id]
+                return {}
+            return dict(results)
+
+    def save(self, job_id, result):
+        with self._lock:
+            expires, results = self._jobs.pop(job_id, (None, {}))
+            results[result["id"]] = result
+            self._jobs[job_id] = (time.monotonic() + self.ttl, results)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "jobs": len(self._jobs), "ttl": self.ttl}
+
+
+class RedisJournal:
+    """Finished results per job in one Redis hash each, so any worker can resume a job"""
+
+    def __init__(self, redis_url, ttl=86400, prefix="curaai:", client=None):
+        self.ttl = ttl
+        self.prefix = prefix
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(redis_url)
+        self.redis = client
+
+    def _key(self, job_id):
+        return f"{self.prefix}batch:{job_id}"
+
+    def load(self, job_id):
+        try:
+            stored = self.redis.hgetall(self._key(job_id))
+        except Exception as e:
+            logger.warning(f"Batch journal unavailable, running job {job_id} from the start: {str(e)}")
+            return {}
+        return {record_id.decode("utf-8"): json.loads(result) for record_id, result in stored.items()}
+
+    def save(self, job_id, result):
+        key = self._key(job_id)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(key, result["id"], json.dumps(result))
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not journal record {result['id']} of batch {job_id}: {str(e)}")
+
+    def stats(self):
+        return {"backend": "redis", "ttl": self.ttl}
+
+
+class FileJournal:
+    """Finished results appended to a JSONL file, which is also the command line's output"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._handle = None
+
+    def load(self, job_id=None):
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        with open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # The last line of a run that was killed mid-write
+                    continue
+                if isinstance(result, dict) and result.get("status") in FINISHED:
+                    results[result["id"]] = result
+        return results
+
+    def save(self, job_id, result):
+        with self._lock:
+            if self._handle is None:
+                self._handle = open(self.path, "a+", encoding="utf-8")
+                self._handle.seek(0, os.SEEK_END)
+                if self._handle.tell():
+                    self._handle.seek(self._handle.tell() - 1)
+                    if self._handle.read(1) != "\n":
+                        self._handle.write("\n")
+            self._handle.write(json.dumps(result) + "\n")
+            self._handle.flush()
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+class BatchRunner:
+    """Answers batch records on a bounded pool, streaming and journaling each result"""
+
+    def __init__(self, triage, concurrency=4, journal=None):
+        self.triage = triage
+        self.concurrency = concurrency
+        self.journal = journal
+        self._lock = threading.Lock()
+        self.stats_counters = {"jobs": 0, "records": 0, "answered": 0, "invalid": 0, "failed": 0, "resumed": 0}
+        self.in_flight = 0
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats_counters[name] += amount
+
+    def process(self, record, job_id=None, journal=None):
+        """Result line for one record; journaled when it is finished"""
+        started = time.monotonic()
+        if "error" in record:
+            result = {"status": STATUS_INVALID, "error": record["error"]}
+        else:
+            with self._lock:
+                self.in_flight += 1
+            try:
+                result = self.triage(record)
+            except Exception as e:
+                logger.error(f"Batch record {record['id']} failed: {str(e)}")
+                result = {"status": "error", "error": "unexpected error"}
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        result = {
+            "id": record["id"],
+            "index": record["index"],
+            "digest": record["digest"],
+            **({"age": record["age"], "gender": record["gender"]} if "error" not in record else {}),
+            **result,
+            "latency_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        result.setdefault("cost", NO_COST)
+        if result["status"] == STATUS_OK:
+            self._count("answered")
+        elif result["status"] == STATUS_INVALID:
+            self._count("invalid")
+        else:
+            self._count("failed")
+        if journal is not None and result["status"] in FINISHED:
+            journal.save(job_id, result)
+        return result
+
+    def run(self, records, job_id=None, journal=None):
+        """Yield a result per record as it finishes, results journaled earlier first, then a summary"""
+        journal = journal if journal is not None else self.journal
+        started = time.monotonic()
+        finished = journal.load(job_id) if journal is not None else {}
+        self._count("jobs")
+        self._count("records", len(records))
+        summary = {"job_id": job_id, "records": len(records), "resumed": 0, "ok": 0, "invalid": 0, "failed": 0,
+                   "prompt_tokens": 0, "completion_tokens": 0, "attempts": 0}
+
+        def tally(result):
+            summary[result["status"] if result["status"] in FINISHED else "failed"] += 1
+            for field in ("prompt_tokens", "completion_tokens", "attempts"):
+                summary[field] += result["cost"][field]
+            return result
+
+        todo = []
+        for record in records:
+            done = finished.get(record["id"])
+            if done is None or done.get("digest") != record["digest"]:
+                # Not answered yet, or the id now names a different record
+                todo.append(record)
+                continue
+            summary["resumed"] += 1
+            yield tally({**done, "resumed": True})
+        self._count("resumed", summary["resumed"])
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch")
+        pending = set()
+        try:
+            # At most `concurrency` records are submitted at once, so a large batch doesn't queue in the pool
+            for record in todo:
+                if len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield tally(future.result())
+                pending.add(executor.submit(self.process, record, job_id, journal))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield tally(future.result())
+        finally:
+            # A client that went away leaves records already running to finish and be journaled
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        summary["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+        yield {"summary": summary}
+
+    def stats(self):
+        """Job and record counters for the /health endpoint"""
+        with self._lock:
+            stats = {"concurrency": self.concurrency, "in_flight": self.in_flight, **self.stats_counters}
+        if self.journal is not None:
+            stats["journal"] = self.journal.stats()
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("records", help="JSONL file of records to triage")
+    parser.add_argument("results", help="JSONL file the results are appended to; rerun with it to resume")
+    parser.add_argument("--concurrency", type=int, help="records answered at once (default: BATCH_CONCURRENCY_PER_KEY per API key)")
+    args = parser.parse_args()
+
+    # Built with the app, so the batch runs with the same keys, caches and limits as the server
+    from app import batch_runner
+
+    with open(args.records, encoding="utf-8") as handle:
+        try:
+            records = parse_records(handle)
+        except BatchError as e:
+            parser.error(str(e))
+
+    runner = batch_runner
+    if args.concurrency:
+        runner = BatchRunner(batch_runner.triage, concurrency=args.concurrency)
+    journal = FileJournal(args.results)
+    summary = None
+    try:
+        for result in runner.run(records, journal=journal):
+            if "summary" in result:
+                summary = result["summary"]
+                print(f"{summary['ok']} answered, {summary['invalid']} invalid, {summary['failed']} failed "
+                      f"({summary['resumed']} from an earlier run) in {summary['elapsed_ms'] / 1000:.1f}s; "
+                      f"{summary['prompt_tokens']} prompt and {summary['completion_tokens']} completion tokens", file=sys.stderr)
+                if summary["failed"]:
+                    print(f"Run the same command again to retry the {summary['failed']} failed record(s)", file=sys.stderr)
+            elif not result.get("resumed"):
+                detail = result.get("error", f"{result['latency_ms']:.0f} ms")
+                print(f"{result['id']}: {result['status']} ({detail})", file=sys.stderr)
+    finally:
+        journal.close()
+    return 0 if summary is not None and not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
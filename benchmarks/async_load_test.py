@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Load test of the sync (gunicorn) and async (uvicorn asgi:app) deployments against
+a local gRPC Gemini stub that takes --latency seconds per call.
+
+Each deployment runs as its own server process. --concurrency clients POST
+/chat in a loop for --duration seconds, each request from a fresh session whose
+message ("I am 30 and male") goes straight to the model. Reported per mode:
+requests/second, latency percentiles, errors, peak resident memory of the server
+processes, and the most LLM calls the stub saw in flight at once.
+
+Run from the repository root:
+    python benchmarks/async_load_test.py [--concurrency 200] [--duration 15] [--latency 1.0]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_gemini_grpc import FakeGeminiGrpc
+
+BODY = json.dumps({"message": "I am 30 and male"}).encode()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of pid and all its descendants, from /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+async def post_chat(port, timeout):
+    """One POST /chat over a fresh connection; returns the HTTP status"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), timeout)
+    try:
+        writer.write(
+            b"POST /chat HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+            b"Connection: close\r\nContent-Length: " + str(len(BODY)).encode() + b"\r\n\r\n" + BODY
+        )
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return int(response.split(b" ", 2)[1])
+    finally:
+        writer.close()
+
+
+async def load(port, pid, concurrency, duration, timeout):
+    latencies, errors = [], 0
+    peak_rss = process_tree_rss(pid)
+    deadline = time.monotonic() + duration
+
+    async def client():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                status = await post_chat(port, timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status = None
+            if time.monotonic() > deadline:
+                break
+            if status == 200:
+                latencies.append(time.monotonic() - started)
+            else:
+                errors += 1
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while time.monotonic() < deadline:
+            peak_rss = max(peak_rss, process_tree_rss(pid))
+            await asyncio.sleep(0.25)
+
+    started = time.monotonic()
+    tasks = [asyncio.create_task(client()) for _ in range(concurrency)]
+    memory = asyncio.create_task(sample_memory())
+    await asyncio.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, memory, return_exceptions=True)
+    elapsed = time.monotonic() - started
+
+    ordered = sorted(latencies)
+    return {
+        "completed": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": round(statistics.median(ordered) * 1000, 1) if ordered else None,
+        "latency_p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 1) if ordered else None,
+        "errors": errors,
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+    }
+
+
+def wait_until_up(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load per mode")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub seconds per LLM call")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers for the threaded sync mode")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker for the threaded sync mode")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    modes = {
+        "sync (Procfile: gunicorn app:app)": ["gunicorn", "app:app"],
+        f"sync gthread {args.workers}x{args.threads}": [
+            "gunicorn", "app:app", "-k", "gthread", "-w", str(args.workers), "--threads", str(args.threads)
+        ],
+        "async (uvicorn asgi:app)": ["uvicorn", "asgi:app", "--no-access-log", "--log-level", "warning"],
+    }
+
+    fake = FakeGeminiGrpc(latency=args.latency, jitter=args.latency / 20, seed=3).start()
+    env = {
+        **os.environ,
+        **fake.client_env(),
+        "GEMINI_API_KEY": "fake-key-0001",
+        "FLASK_ENV": "development",
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+
+    report = {}
+    for name, command in modes.items():
+        port = free_port()
+        bind = ["--bind", f"127.0.0.1:{port}"] if command[0] == "gunicorn" else ["--host", "127.0.0.1", "--port", str(port)]
+        process = subprocess.Popen(command + bind, cwd=ROOT, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(port, process)
+            fake.max_in_flight = 0
+            report[name] = asyncio.run(load(port, process.pid, args.concurrency, args.duration, args.timeout))
+            report[name]["max_llm_calls_in_flight"] = fake.max_in_flight
+        finally:
+            process.terminate()
+            process.wait()
+    fake.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.concurrency} clients, {args.duration:.0f}s per mode, stub latency {args.latency}s")
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<26} {value}")
+
+
+if __name__ == "__main__":
+    main()
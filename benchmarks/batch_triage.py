@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Bulk triage through /chat/batch against triaging the same records one /chat
+request at a time, on a local fake Gemini.
+
+  /chat, sequential   how a clinic's list goes through today: one consultation per
+                      record, its age and gender in the opening message
+  /chat/batch         the whole list in one request, at each --concurrency per key;
+                      seconds to the first result and to the last, record latency
+                      percentiles and the model calls in flight at the peak
+  resume              a batch whose connection is dropped halfway, sent again with
+                      the same job_id: model calls made over both requests
+
+Response caching is off, so every record reaches the model.
+
+Run from the repository root:
+    python benchmarks/batch_triage.py [--records 200] [--keys 4] [--latency 0.3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.async_load_test import free_port, wait_until_up
+from benchmarks.fake_gemini import FakeGemini
+from benchmarks.replay import Client, percentile
+
+TOKEN = "benchmark-token"
+COMPLAINTS = ["a headache", "a dry cough", "a sore throat", "back pain", "an upset stomach", "a runny nose"]
+
+
+def make_records(count):
+    return [
+        {"id": f"r{n}", "message": f"I have had {COMPLAINTS[n % len(COMPLAINTS)]} for {n % 9 + 1} days (case {n})",
+         "age": 18 + n % 60, "gender": "female" if n % 2 else "male"}
+        for n in range(count)
+    ]
+
+
+def start_server(fake, keys, concurrency_per_key):
+    port = free_port()
+    env = {
+        **os.environ,
+        **{f"GEMINI_API_KEY_{n + 1}": f"fake-key-{n + 1:04d}" for n in range(keys)},
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": fake.url,
+        "FLASK_ENV": "development",
+        "LOG_LEVEL": "WARNING",
+        "RATE_LIMIT_ENABLED": "false",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "BATCH_API_TOKEN": TOKEN,
+        "BATCH_CONCURRENCY_PER_KEY": str(concurrency_per_key),
+    }
+    env.pop("GEMINI_API_KEY", None)
+    process = subprocess.Popen(
+        ["gunicorn", "app:app", "-k", "gthread", "-w", "1", "--threads", "16", "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_until_up(port, process)
+    base_url = f"http://127.0.0.1:{port}"
+    # Loads the Gemini SDK, so the first records don't pay for it
+    Client(base_url, 60).chat("I'm 30 and male, I have a headache")
+    return process, base_url
+
+
+def post_batch(base_url, records, job_id, stop_after=None):
+    """(results, seconds to the first result, seconds to the end) of one /chat/batch request"""
+    body = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+    request = urllib.request.Request(f"{base_url}/chat/batch?job_id={job_id}", data=body, method="POST",
+                                     headers={"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/x-ndjson"})
+    started = time.monotonic()
+    first = None
+    results = []
+    with urllib.request.urlopen(request, timeout=600) as response:
+        for line in response:
+            first = first if first is not None else time.monotonic() - started
+            results.append(json.loads(line))
+            if stop_after is not None and len(results) >= stop_after:
+                break
+    return results, first, time.monotonic() - started
+
+
+def sequential_chat(base_url, records):
+    started = time.monotonic()
+    latencies = []
+    for record in records:
+        began = time.monotonic()
+        status, _, _ = Client(base_url, 60).chat(f"I'm {record['age']} and {record['gender']}, {record['message']}")
+        if status != 200:
+            raise RuntimeError(f"/chat returned {status}")
+        latencies.append(time.monotonic() - began)
+    latencies.sort()
+    elapsed = time.monotonic() - started
+    return {"seconds": round(elapsed, 2), "records_per_s": round(len(records) / elapsed, 1),
+            "p50_ms": percentile(latencies, 0.5), "p95_ms": percentile(latencies, 0.95)}
+
+
+def batch_run(base_url, records, fake, job_id):
+    fake.reset()
+    results, first, elapsed = post_batch(base_url, records, job_id)
+    summary = results[-1]["summary"]
+    latencies = sorted(result["latency_ms"] / 1000 for result in results[:-1])
+    return {"seconds": round(elapsed, 2), "records_per_s": round(len(records) / elapsed, 1),
+            "first_result_s": round(first, 2), "p50_ms": percentile(latencies, 0.5), "p95_ms": percentile(latencies, 0.95),
+            "answered": summary["ok"], "peak_model_calls": fake.max_in_flight,
+            "prompt_tokens": summary["prompt_tokens"], "completion_tokens": summary["completion_tokens"]}
+
+
+def resume_run(base_url, records, fake):
+    fake.reset()
+    half = len(records) // 2
+    post_batch(base_url, records, "resume", stop_after=half)
+    # Records still running when the connection dropped finish and are journaled
+    time.sleep(1)
+    results, _, _ = post_batch(base_url, records, "resume")
+    summary = results[-1]["summary"]
+    return {"records": len(records), "resumed": summary["resumed"], "answered": summary["ok"],
+            "model_calls": len(fake.requests)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--keys", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.3, help="fake Gemini seconds per reply")
+    parser.add_argument("--concurrency", default="1,2,4", help="comma-separated BATCH_CONCURRENCY_PER_KEY values")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    fake = FakeGemini(latency=args.latency, seed=23).start()
+    report = {"batch": {}}
+    try:
+        for per_key in [int(value) for value in args.concurrency.split(",")]:
+            process, base_url = start_server(fake, args.keys, per_key)
+            try:
+                if not report.get("sequential_chat"):
+                    report["sequential_chat"] = sequential_chat(base_url, records)
+                report["batch"][per_key] = batch_run(base_url, records, fake, f"run-{per_key}")
+                if "resume" not in report:
+                    report["resume"] = resume_run(base_url, records, fake)
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        fake.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.records} records, {args.keys} keys, {args.latency}s per model reply")
+    chat = report["sequential_chat"]
+    print(f"/chat one at a time: {chat['seconds']}s, {chat['records_per_s']} records/s, p50 {chat['p50_ms']} ms")
+    print(f"{'per key':>8} {'seconds':>8} {'rec/s':>7} {'first s':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak calls':>11}")
+    for per_key, run in report["batch"].items():
+        print(f"{per_key:>8} {run['seconds']:>8} {run['records_per_s']:>7} {run['first_result_s']:>8} "
+              f"{run['p50_ms']:>8} {run['p95_ms']:>8} {run['peak_model_calls']:>11}")
+    resume = report["resume"]
+    print(f"resume: {resume['resumed']} of {resume['records']} records replayed from the journal, "
+          f"{resume['model_calls']} model calls over both requests")
+
+
+if __name__ == "__main__":
+    main()
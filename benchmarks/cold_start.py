@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Cold start of the app for a git revision and the working tree.
+
+  import        `python -X importtime -c "import app"` in a fresh interpreter: the
+                total, whether it loads the Gemini SDK and the heaviest imports made
+                by app
+  first health  a gunicorn worker started from scratch: seconds from spawning it
+                until /health answers
+  first chat    seconds from spawning it until the first /chat reply from a local
+                fake Gemini, sent as soon as /health answered
+
+The working tree is measured twice, as gunicorn.conf.py runs it: by default, and
+with GUNICORN_PRELOAD=true. Every figure is the median of --runs.
+
+Run from the repository root:
+    python benchmarks/cold_start.py [--before HEAD~1] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.async_load_test import free_port
+from benchmarks.fake_gemini import FakeGemini
+from benchmarks.replay import Client
+
+OPENING = "I'm 30 and male, I have a headache"
+
+
+def app_env(fake_url=None, **extra):
+    env = {
+        **os.environ,
+        "GEMINI_API_KEY_1": "fake-key-0001",
+        "FLASK_ENV": "development",
+        "LOG_LEVEL": "WARNING",
+        "RATE_LIMIT_ENABLED": "false",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "GEMINI_TRANSPORT": "rest",
+        **extra,
+    }
+    env.pop("GEMINI_API_KEY", None)
+    if fake_url:
+        env["GEMINI_API_ENDPOINT"] = fake_url
+    return env
+
+
+def extract(revision, directory):
+    """Check out a git revision's tree into directory"""
+    archive = subprocess.run(["git", "archive", "--format=tar", revision], cwd=ROOT, check=True, capture_output=True).stdout
+    with tempfile.TemporaryFile() as handle:
+        handle.write(archive)
+        handle.seek(0)
+        with tarfile.open(fileobj=handle) as tar:
+            tar.extractall(directory)
+
+
+def import_profile(tree):
+    """Microseconds by module from one `python -X importtime -c "import app"`"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=tree,
+                            env=app_env(), capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # One space after the bar, then two per level of nesting
+        modules[name[1:].rstrip()] = int(cumulative)
+    return modules
+
+
+def measure_imports(tree, runs):
+    import_profile(tree)  # compile bytecode first
+    profiles = [import_profile(tree) for _ in range(runs)]
+    direct = {}
+    for profile in profiles:
+        # Imports made by app itself are indented one level under it
+        for name, cumulative in profile.items():
+            if name.startswith("  ") and not name.startswith("   "):
+                direct.setdefault(name.strip(), []).append(cumulative)
+    heaviest = sorted(direct.items(), key=lambda item: -statistics.median(item[1]))[:5]
+    return {
+        "import_ms": round(statistics.median(profile["app"] for profile in profiles) / 1000, 1),
+        "loads_gemini_sdk": any(name.strip() == "google.generativeai" for name in profiles[0]),
+        "heaviest_ms": {name: round(statistics.median(values) / 1000, 1) for name, values in heaviest},
+    }
+
+
+def first_requests(tree, fake, extra_env):
+    """(seconds to the first /health answer, seconds to the first chat reply) for one fresh server"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    process = subprocess.Popen(
+        ["gunicorn", "app:app", "-k", "gthread", "-w", "1", "--threads", "8", "--bind", f"127.0.0.1:{port}"],
+        cwd=tree, env=app_env(fake.url, **extra_env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with status {process.returncode}")
+            if time.monotonic() - started > 60:
+                raise RuntimeError("server did not start")
+            try:
+                with urllib.request.urlopen(f"{base_url}/health", timeout=5) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                time.sleep(0.005)
+        health = time.monotonic() - started
+        status, payload, _ = Client(base_url, 60).chat(OPENING)
+        if status != 200:
+            raise RuntimeError(f"first chat failed with {status}: {payload}")
+        return health, time.monotonic() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def measure_server(tree, fake, runs, extra_env=None):
+    samples = [first_requests(tree, fake, extra_env or {}) for _ in range(runs)]
+    return {
+        "first_health_ms": round(statistics.median(health for health, _ in samples) * 1000),
+        "first_chat_ms": round(statistics.median(chat for _, chat in samples) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--before", default="HEAD~1", help="git revision to compare the working tree against")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    fake = FakeGemini(latency=0.05, seed=5).start()
+    report = {}
+    try:
+        with tempfile.TemporaryDirectory() as before_tree:
+            extract(args.before, before_tree)
+            report[args.before] = {**measure_imports(before_tree, args.runs), **measure_server(before_tree, fake, args.runs)}
+        report["working tree"] = {**measure_imports(ROOT, args.runs), **measure_server(ROOT, fake, args.runs)}
+        report["working tree, preload"] = measure_server(ROOT, fake, args.runs, {"GUNICORN_PRELOAD": "true"})
+    finally:
+        fake.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<16} {value}")
+
+
+if __name__ == "__main__":
+    main()
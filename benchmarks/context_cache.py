@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compare input tokens per chat request with and without server-side context
+caching, using the local fake Gemini server.
+
+Run from the repository root:
+    python benchmarks/context_cache.py
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_gemini import FakeGemini
+
+CONVERSATION = ["I have a headache", "I am 30", "male", "It started this morning", "Can I take paracetamol?"]
+
+
+def run_conversation(app_module):
+    """Send CONVERSATION through /chat in a fresh session"""
+    client = app_module.app.test_client()
+    for message in CONVERSATION:
+        client.post("/chat", json={"message": message})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--min-cache-tokens", type=int, default=0,
+                        help="make the fake reject small caches (the real API minimum is 32768) to exercise the fallback")
+    args = parser.parse_args()
+
+    fake = FakeGemini(latency=0.01, min_cache_tokens=args.min_cache_tokens).start()
+    os.environ.update({
+        "GEMINI_API_KEY": "fake-key-0001",
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": fake.url,
+        "CONTEXT_CACHE_ENABLED": "true",
+        "FLASK_ENV": "development",
+        "RATE_LIMIT_ENABLED": "false",
+    })
+    import app as app_module
+
+    results = {}
+    manager = app_module.context_cache
+    for mode, cache in (("inline", None), ("cached", manager)):
+        app_module.context_cache = cache
+        fake.reset()
+        run_conversation(app_module)
+        calls = [r for r in fake.requests if r["path"].startswith("models/")]
+        results[mode] = {
+            "requests": len(calls),
+            "input_tokens_per_request": [r["input_tokens"] for r in calls],
+            "cached_tokens_per_request": [r["cached_tokens"] for r in calls],
+            "cache_creates": sum(1 for r in fake.requests if r["path"] == "cachedContents.create"),
+        }
+    fake.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for mode, stats in results.items():
+        print(f"{mode:<7} requests {stats['requests']}  input tokens/request {stats['input_tokens_per_request']}  "
+              f"cached tokens/request {stats['cached_tokens_per_request']}  cache creates {stats['cache_creates']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Accuracy, throughput and round trips of the patient fact extractor against the
+split()/isdigit() parser it replaced.
+
+  accuracy      age and gender over the labelled corpus in data/demographics_corpus.json
+  throughput    messages per second over the corpus
+  round trips   scripted consultations played through the age/gender gate; counts
+                the turns before the question reaches the model, and consultations
+                that reach it with the wrong age or gender
+
+Run from the repository root:
+    python benchmarks/demographics.py [--repeat 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from demographics import extract_patient_facts
+from health_detector import is_health_concern
+
+CORPUS_PATH = os.path.join(ROOT, "data", "demographics_corpus.json")
+
+# Opening message, reply to "may I know your age?", reply to the gender question, true age and gender
+CONSULTATIONS = [
+    ("I have a headache", "30", "female", 30, "female"),
+    ("I have a headache", "I'm 30", "I am female", 30, "female"),
+    ("I have had a fever for 3 days", "42", "male", 42, "male"),
+    ("I'm 30 and female, I have a headache", "30", "female", 30, "female"),
+    ("34F with period pain", "34", "female", 34, "female"),
+    ("I'm a 45 year old man with back pain", "45", "male", 45, "male"),
+    ("female 28, sore throat for 2 days", "28", "female", 28, "female"),
+    ("my baby has a cough", "6 months", "boy", 0.5, "male"),
+    ("I am 62 male with acidity", "62", "male", 62, "male"),
+    ("rash on my arm", "I am 25 years old", "woman", 25, "female"),
+    ("stomach pain since 2 days", "I'm 19", "F", 19, "female"),
+    ("cough and cold", "51", "female", 51, "female"),
+]
+
+
+def legacy_facts(text):
+    """The parser app.py used before: first bare number, 'male' substring before 'female'"""
+    age = gender = None
+    for word in text.split():
+        if word.isdigit() and 0 < int(word) < 120:
+            age = int(word)
+            break
+    if "male" in text.lower():
+        gender = "male"
+    elif "female" in text.lower():
+        gender = "female"
+    return age, gender
+
+
+def new_facts(text):
+    facts = extract_patient_facts(text)
+    return facts.age, facts.gender
+
+
+def play(consultation, parse, parse_first):
+    """Turns until the model is reached, and the age and gender it is given"""
+    opening, age_reply, gender_reply, _, _ = consultation
+    context = {"age": None, "gender": None}
+    pending = [opening]
+    turns = 0
+    while pending and turns < 6:
+        message = pending.pop(0)
+        turns += 1
+        health = is_health_concern(message)
+        if parse_first:
+            age, gender = parse(message)
+            context["age"] = context["age"] or age
+            context["gender"] = context["gender"] or gender
+        if health and not context["age"]:
+            pending.append(age_reply)
+            continue
+        if health and not context["gender"]:
+            pending.append(gender_reply)
+            continue
+        if not parse_first:
+            age, gender = parse(message)
+            context["age"] = context["age"] or age
+            context["gender"] = context["gender"] or gender
+        if not context["age"]:
+            pending.append(age_reply)
+        elif not context["gender"]:
+            pending.append(gender_reply)
+    return turns, context["age"], context["gender"]
+
+
+def round_trips(parse, parse_first):
+    total_turns = wrong = 0
+    for consultation in CONSULTATIONS:
+        turns, age, gender = play(consultation, parse, parse_first)
+        total_turns += turns
+        wrong += (age, gender) != consultation[3:]
+    return {
+        "turns_per_consultation": round(total_turns / len(CONSULTATIONS), 2),
+        "wrong_demographics": wrong,
+        "consultations": len(CONSULTATIONS),
+    }
+
+
+def accuracy(parse, corpus):
+    labelled = [(example["text"], example["age"], example["gender"]) for example in corpus]
+    correct = sum(parse(text) == (age, gender) for text, age, gender in labelled)
+    return round(correct / len(labelled), 3)
+
+
+def throughput(parse, corpus, repeat):
+    texts = [example["text"] for example in corpus]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            parse(text)
+    return round(repeat * len(texts) / (time.perf_counter() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="passes over the corpus for the throughput figure")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding="utf-8") as handle:
+        corpus = json.load(handle)
+
+    report = {}
+    for name, parse, parse_first in (("legacy", legacy_facts, False), ("extractor", new_facts, True)):
+        report[name] = {
+            "age_gender_accuracy": accuracy(parse, corpus),
+            "messages_per_second": throughput(parse, corpus, args.repeat),
+            **round_trips(parse, parse_first),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(corpus)} labelled messages, {len(CONSULTATIONS)} scripted consultations")
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
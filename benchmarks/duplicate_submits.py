@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Duplicate submits against a slow local Gemini stub, with and without
+single-flight coalescing (SINGLE_FLIGHT_ENABLED).
+
+Each round opens a consultation, then sends the same follow-up the way a
+browser can while the first reply is still coming:
+  - the original, streamed, with an Idempotency-Key
+  - a double submit of it (same key) a moment later
+  - the Retry button (same key) and a reload-and-resend (new key, /chat)
+  - once everything has been answered, the Retry button again (same key)
+and counts the paid LLM calls, the messages counted against the session's
+allowance and the time until every duplicate had its reply.
+
+Run from the repository root:
+    python benchmarks/duplicate_submits.py [--rounds 5] [--latency 1.5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.async_load_test import free_port, wait_until_up
+from benchmarks.fake_gemini import FakeGemini
+from benchmarks.replay import Client
+
+OPENING = "I'm 30 and male, I have a headache"
+FOLLOW_UP = "what medicine can I take?"
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def message_count(client):
+    request = urllib.request.Request(f"{client.base_url}/message-count")
+    with client.opener.open(request, timeout=10) as response:
+        return json.loads(response.read())["count"]
+
+
+def llm_calls(fake):
+    return sum(1 for entry in fake.requests if entry["path"].startswith("models/"))
+
+
+def duplicate_round(base_url, fake, timeout):
+    client = Client(base_url, timeout)
+    client.chat(OPENING)
+    counted_before = message_count(client)
+    calls_before = llm_calls(fake)
+
+    key = str(uuid.uuid4())
+    # (delay in seconds, route, Idempotency-Key)
+    sends = [
+        (0.0, "/chat/stream", key),
+        (0.1, "/chat/stream", key),
+        (0.3, "/chat/stream", key),
+        (0.5, "/chat", str(uuid.uuid4())),
+    ]
+    statuses = []
+
+    def send(delay, path, idempotency_key):
+        time.sleep(delay)
+        status, _, _ = client.chat(FOLLOW_UP, path=path, headers={"Idempotency-Key": idempotency_key})
+        statuses.append(status)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=send, args=args) for args in sends]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    burst_seconds = time.monotonic() - started
+
+    # The Retry button after the reply was already given
+    status, payload, retry_seconds = client.chat(FOLLOW_UP, path="/chat/stream", headers={"Idempotency-Key": key})
+    statuses.append(status)
+
+    return {
+        "llm_calls": llm_calls(fake) - calls_before,
+        "messages_counted": message_count(client) - counted_before,
+        "burst_seconds": burst_seconds,
+        "late_retry_seconds": retry_seconds,
+        "late_retry_replayed": bool(payload and payload.get("deduplicated")),
+        "errors": sum(1 for status in statuses if status != 200),
+    }
+
+
+def run_mode(enabled, args):
+    fake = FakeGemini(latency=args.latency, first_token_latency=args.latency, seed=3).start()
+    env = {
+        **os.environ,
+        "GEMINI_API_KEY": "fake-key-0001",
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": fake.url,
+        "FLASK_ENV": "development",
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+        "SINGLE_FLIGHT_ENABLED": "true" if enabled else "false",
+    }
+    port = free_port()
+    process = subprocess.Popen(
+        ["gunicorn", "app:app", "-k", "gthread", "-w", "1", "--threads", "16", "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(port, process)
+        rounds = [duplicate_round(base_url, fake, args.timeout) for _ in range(args.rounds)]
+        health = get_json(f"{base_url}/health")["single_flight"]
+    finally:
+        process.terminate()
+        process.wait()
+        fake.stop()
+
+    return {
+        "llm_calls_per_round": sum(r["llm_calls"] for r in rounds) / len(rounds),
+        "messages_counted_per_round": sum(r["messages_counted"] for r in rounds) / len(rounds),
+        "burst_seconds": round(sum(r["burst_seconds"] for r in rounds) / len(rounds), 2),
+        "late_retry_ms": round(sum(r["late_retry_seconds"] for r in rounds) / len(rounds) * 1000, 1),
+        "late_retries_replayed": sum(r["late_retry_replayed"] for r in rounds),
+        "errors": sum(r["errors"] for r in rounds),
+        "single_flight": health,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=1.5, help="stub seconds per LLM call")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    report = {
+        "without coalescing": run_mode(False, args),
+        "single flight": run_mode(True, args),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.rounds} rounds of 4 concurrent duplicates plus a late retry, stub latency {args.latency}s")
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<28} {value}")
+
+
+if __name__ == "__main__":
+    main()
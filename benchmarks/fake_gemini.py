@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini REST API used by the benchmarks.
+
+It implements generateContent, streamGenerateContent, countTokens and the
+cachedContents resource closely enough for google-generativeai's REST
+transport, and records every request (API key, input tokens, cached tokens,
+latency) so benchmarks can inspect what the app actually sent.
+
+Point the app at it with:
+    GEMINI_TRANSPORT=rest GEMINI_API_ENDPOINT=http://127.0.0.1:8765
+
+Run standalone:
+    python benchmarks/fake_gemini.py --port 8765 --latency 0.8 --error-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Possible Cause: Tension headache, likely from stress or poor sleep.\n"
+    "Recommended Steps: Rest in a quiet room, drink water and avoid screens for a while.\n"
+    "Medications: Paracetamol 500-1000mg every 4-6 hours (Crocin, Dolo).\n"
+    "When to See a Doctor: If the pain is sudden and severe, or lasts more than 2-3 days."
+)
+
+_MODEL_PATH = re.compile(r"^/v1beta/(models/[^:]+):(generateContent|streamGenerateContent|countTokens)$")
+
+
+def count_tokens(payload):
+    """Approximate token count (~4 characters per token) of every text part"""
+    chars = 0
+
+    def walk(node):
+        nonlocal chars
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "text" and isinstance(value, str):
+                    chars += len(value)
+                else:
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(payload)
+    return chars // 4
+
+
+class FakeGemini:
+    """Threaded fake Gemini server with configurable latency, errors and rate limits"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit_rpm=None, max_concurrent_per_key=None, retry_after=30, stall_rate=0.0, stall_seconds=30.0,
+                 first_token_latency=None, chunk_delay=0.02, reply=DEFAULT_REPLY, echo_key=False, min_cache_tokens=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rpm = rate_limit_rpm
+        self.max_concurrent_per_key = max_concurrent_per_key
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.first_token_latency = first_token_latency
+        self.chunk_delay = chunk_delay
+        self.reply = reply
+        self.echo_key = echo_key
+        self.min_cache_tokens = min_cache_tokens
+        self.random = random.Random(seed)
+        self.requests = []
+        self.cached_contents = {}
+        self._key_windows = {}
+        self._in_flight = 0
+        self._key_in_flight = {}
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self._key_windows.clear()
+            self.max_in_flight = 0
+
+    def _record(self, **entry):
+        with self._lock:
+            self.requests.append(entry)
+
+    def _rate_limited(self, api_key):
+        """Sliding one-minute window per key; returns True when over the limit"""
+        if not self.rate_limit_rpm:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            window = [t for t in self._key_windows.get(api_key, []) if now - t < 60]
+            limited = len(window) >= self.rate_limit_rpm
+            if not limited:
+                window.append(now)
+            self._key_windows[api_key] = window
+        return limited
+
+    def reply_for(self, api_key):
+        """The canned reply, prefixed with the calling key when echo_key is set"""
+        return f"[key={api_key}] {self.reply}" if self.echo_key else self.reply
+
+    def _delay(self, base=None):
+        base = self.latency if base is None else base
+        return max(0.0, base + self.random.uniform(-self.jitter, self.jitter))
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status, message, headers=None):
+                self._send(status, {"error": {"code": status, "message": message}}, headers)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/_stats":
+                    with fake._lock:
+                        return self._send(200, {"requests": list(fake.requests), "max_in_flight": fake.max_in_flight})
+                match = re.match(r"^/v1beta/(cachedContents/[^/]+)$", path)
+                if match and match.group(1) in fake.cached_contents:
+                    return self._send(200, fake.cached_contents[match.group(1)]["resource"])
+                self._error(404, "not found")
+
+            def do_DELETE(self):
+                match = re.match(r"^/v1beta/(cachedContents/[^/?]+)", self.path)
+                if match:
+                    fake.cached_contents.pop(match.group(1), None)
+                    return self._send(200, {})
+                self._error(404, "not found")
+
+            def do_PATCH(self):
+                match = re.match(r"^/v1beta/(cachedContents/[^/?]+)", self.path)
+                if not match or match.group(1) not in fake.cached_contents:
+                    return self._error(404, "cached content not found")
+                body = self._body()
+                entry = fake.cached_contents[match.group(1)]
+                ttl = float(str(body.get("ttl", "3600s")).rstrip("s"))
+                entry["resource"]["expireTime"] = self._expire(ttl)
+                entry["resource"]["updateTime"] = self._now()
+                fake._record(path="cachedContents.update", api_key=self.headers.get("x-goog-api-key"),
+                             input_tokens=0, cached_tokens=0, status=200, latency=0.0, time=time.time())
+                self._send(200, entry["resource"])
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                api_key = self.headers.get("x-goog-api-key")
+                if path == "/v1beta/cachedContents":
+                    return self._create_cache(api_key)
+                match = _MODEL_PATH.match(path)
+                if not match:
+                    return self._error(404, "not found")
+                model, method = match.groups()
+                body = self._body()
+                if method == "countTokens":
+                    return self._send(200, {"totalTokens": count_tokens(body)})
+                self._generate(api_key, model, body, stream=(method == "streamGenerateContent"))
+
+            @staticmethod
+            def _now():
+                return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+            @staticmethod
+            def _expire(ttl):
+                return (datetime.now(timezone.utc) + timedelta(seconds=ttl)).isoformat().replace("+00:00", "Z")
+
+            def _create_cache(self, api_key):
+                body = self._body()
+                name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+                ttl = float(str(body.get("ttl", "3600s")).rstrip("s"))
+                tokens = count_tokens(body)
+                if tokens < fake.min_cache_tokens:
+                    return self._error(400, f"Cached content is too small. total_token_count={tokens}, "
+                                            f"min_total_token_count={fake.min_cache_tokens}")
+                resource = {
+                    "name": name,
+                    "model": body.get("model"),
+                    "createTime": self._now(),
+                    "updateTime": self._now(),
+                    "expireTime": self._expire(ttl),
+                    "usageMetadata": {"totalTokenCount": tokens},
+                }
+                fake.cached_contents[name] = {"resource": resource, "tokens": tokens, "api_key": api_key}
+                fake._record(path="cachedContents.create", api_key=api_key, input_tokens=tokens,
+                             cached_tokens=0, status=200, latency=0.0, time=time.time())
+                self._send(200, resource)
+
+            def _generate(self, api_key, model, body, stream):
+                started = time.monotonic()
+                input_tokens = count_tokens(body)
+                cached_tokens = 0
+                status = 200
+                with fake._lock:
+                    fake._in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake._in_flight)
+                    key_in_flight = fake._key_in_flight[api_key] = fake._key_in_flight.get(api_key, 0) + 1
+                try:
+                    cache_name = body.get("cachedContent")
+                    if cache_name:
+                        entry = fake.cached_contents.get(cache_name)
+                        if entry is None:
+                            status = 404
+                            return self._error(404, f"{cache_name} not found")
+                        cached_tokens = entry["tokens"]
+                    if fake._rate_limited(api_key) or (fake.max_concurrent_per_key and key_in_flight > fake.max_concurrent_per_key):
+                        status = 429
+                        return self._error(429, "Resource has been exhausted (e.g. check quota).",
+                                           {"Retry-After": str(fake.retry_after)})
+                    if fake.stall_rate and fake.random.random() < fake.stall_rate:
+                        time.sleep(fake.stall_seconds)
+                    if fake.error_rate and fake.random.random() < fake.error_rate:
+                        status = 500
+                        time.sleep(fake._delay())
+                        return self._error(500, "Internal error encountered.")
+                    if stream:
+                        self._stream(fake.reply_for(api_key), input_tokens + cached_tokens, cached_tokens)
+                    else:
+                        time.sleep(fake._delay())
+                        self._send(200, self._response(fake.reply_for(api_key), input_tokens + cached_tokens, cached_tokens))
+                finally:
+                    with fake._lock:
+                        fake._in_flight -= 1
+                        fake._key_in_flight[api_key] -= 1
+                    fake._record(path=model, api_key=api_key, input_tokens=input_tokens,
+                                 cached_tokens=cached_tokens, status=status, stream=stream,
+                                 latency=round(time.monotonic() - started, 4), time=time.time())
+
+            @staticmethod
+            def _response(text, prompt_tokens, cached_tokens, finished=True, completion_tokens=None):
+                candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+                if finished:
+                    candidate["finishReason"] = 1
+                if completion_tokens is None:
+                    completion_tokens = len(text) // 4
+                usage = {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": completion_tokens,
+                    "totalTokenCount": prompt_tokens + completion_tokens,
+                }
+                if cached_tokens:
+                    usage["cachedContentTokenCount"] = cached_tokens
+                return {"candidates": [candidate], "usageMetadata": usage}
+
+            def _stream(self, text, prompt_tokens, cached_tokens):
+                """Send the reply as a chunked JSON array, one chunk per few words"""
+                words = text.split(" ")
+                chunks = [" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "") for i in range(0, len(words), 4)]
+                first = fake._delay(fake.first_token_latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def write(data):
+                    raw = data.encode("utf-8")
+                    self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                    self.wfile.flush()
+
+                time.sleep(first)
+                write("[")
+                sent = 0
+                for position, chunk in enumerate(chunks):
+                    last = position == len(chunks) - 1
+                    # Like Gemini, each chunk reports the usage of the reply so far
+                    sent += len(chunk)
+                    payload = self._response(chunk, prompt_tokens, cached_tokens, finished=last, completion_tokens=sent // 4)
+                    write(("," if position else "") + json.dumps(payload))
+                    if not last:
+                        time.sleep(fake.chunk_delay)
+                write("]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per generateContent call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rpm", type=int, default=None, help="429 after this many requests/minute per key")
+    parser.add_argument("--max-concurrent-per-key", type=int, default=None, help="429 beyond this many calls in flight per key")
+    parser.add_argument("--retry-after", type=int, default=30)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--first-token-latency", type=float, default=None,
+                        help="seconds before the first streamed chunk (default: --latency)")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--min-cache-tokens", type=int, default=0, help="reject smaller cachedContents like the real API")
+    args = parser.parse_args()
+
+    fake = FakeGemini(args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      rate_limit_rpm=args.rate_limit_rpm, max_concurrent_per_key=args.max_concurrent_per_key,
+                      retry_after=args.retry_after,
+                      stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+                      first_token_latency=args.first_token_latency, chunk_delay=args.chunk_delay,
+                      min_cache_tokens=args.min_cache_tokens)
+    print(f"Fake Gemini listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
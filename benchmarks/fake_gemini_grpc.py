@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini gRPC API, for load tests of the async serving mode.
+
+google-generativeai's asyncio client only speaks gRPC, so the REST fake in
+fake_gemini.py cannot serve it. This implements GenerateContent and
+StreamGenerateContent on a grpc.aio server with a fixed per-call delay. It serves
+TLS with a throwaway self-signed certificate because the SDK always opens a secure
+channel; point clients at it with:
+
+    GEMINI_TRANSPORT=grpc GEMINI_API_ENDPOINT=localhost:<port>
+    GRPC_DEFAULT_SSL_ROOTS_FILE_PATH=<cert_path>
+
+Run standalone:
+    python benchmarks/fake_gemini_grpc.py --port 8766 --latency 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import grpc
+from google.ai.generativelanguage_v1beta.types import generative_service
+
+from benchmarks.fake_gemini import DEFAULT_REPLY
+
+SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+
+def self_signed_certificate(directory):
+    """Write a localhost certificate and key with openssl; returns (cert_path, key_path)"""
+    cert_path = os.path.join(directory, "fake_gemini.crt")
+    key_path = os.path.join(directory, "fake_gemini.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+         "-keyout", key_path, "-out", cert_path],
+        check=True, capture_output=True,
+    )
+    return cert_path, key_path
+
+
+class FakeGeminiGrpc:
+    """grpc.aio fake of the generative service, run on a background event loop"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=1.0, jitter=0.0, first_token_latency=None,
+                 chunk_delay=0.02, reply=DEFAULT_REPLY, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.first_token_latency = first_token_latency
+        self.chunk_delay = chunk_delay
+        self.reply = reply
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.api_keys = set()
+        self._directory = tempfile.mkdtemp(prefix="fake-gemini-")
+        self.cert_path, self._key_path = self_signed_certificate(self._directory)
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+
+    @property
+    def endpoint(self):
+        return f"localhost:{self.port}"
+
+    def client_env(self):
+        """Environment variables that point the app at this fake"""
+        return {
+            "GEMINI_TRANSPORT": "grpc",
+            "GEMINI_API_ENDPOINT": self.endpoint,
+            "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": self.cert_path,
+        }
+
+    def start(self):
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), daemon=True).start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._server.stop(0), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._serve())
+        ready.set()
+        self._loop.run_forever()
+
+    async def _serve(self):
+        with open(self.cert_path, "rb") as cert, open(self._key_path, "rb") as key:
+            credentials = grpc.ssl_server_credentials([(key.read(), cert.read())])
+        self._server = grpc.aio.server()
+        self._server.add_generic_rpc_handlers([grpc.method_handlers_generic_handler(SERVICE, {
+            "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                self._generate,
+                request_deserializer=generative_service.GenerateContentRequest.deserialize,
+                response_serializer=generative_service.GenerateContentResponse.serialize,
+            ),
+            "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+                self._stream,
+                request_deserializer=generative_service.GenerateContentRequest.deserialize,
+                response_serializer=generative_service.GenerateContentResponse.serialize,
+            ),
+        })])
+        self.port = self._server.add_secure_port(f"{self.host}:{self.port}", credentials)
+        await self._server.start()
+
+    def _delay(self, base=None):
+        base = self.latency if base is None else base
+        return max(0.0, base + self.random.uniform(-self.jitter, self.jitter))
+
+    def _enter(self, context):
+        metadata = dict(context.invocation_metadata())
+        self.api_keys.add(metadata.get("x-goog-api-key"))
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    @staticmethod
+    def _response(text, finished=True):
+        return generative_service.GenerateContentResponse(
+            candidates=[{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finish_reason": 1 if finished else 0,
+                "index": 0,
+            }],
+            usage_metadata={"prompt_token_count": 0, "candidates_token_count": len(text) // 4},
+        )
+
+    async def _generate(self, request, context):
+        self._enter(context)
+        try:
+            await asyncio.sleep(self._delay())
+            return self._response(self.reply)
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request, context):
+        self._enter(context)
+        try:
+            words = self.reply.split(" ")
+            chunks = [" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "") for i in range(0, len(words), 4)]
+            await asyncio.sleep(self._delay(self.first_token_latency))
+            for position, chunk in enumerate(chunks):
+                if position:
+                    await asyncio.sleep(self.chunk_delay)
+                yield self._response(chunk, finished=position == len(chunks) - 1)
+        finally:
+            self.in_flight -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per GenerateContent call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeGeminiGrpc(args.host, args.port, latency=args.latency, jitter=args.jitter).start()
+    for name, value in fake.client_env().items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
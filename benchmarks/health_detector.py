@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Precision and CPU microbenchmark for the health-concern detector against the old
+per-request keyword list loop from chat().
+
+Run from the repository root:
+    python benchmarks/health_detector.py [--iterations 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from health_detector import detector
+
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "health_detector_corpus.jsonl")
+
+
+def legacy_is_health_concern(user_msg):
+    """The detection code chat() used to run on every request"""
+    health_keywords = [
+        "headache", "pain", "fever", "sick", "ill", "symptom", "problem", "hurt", "ache",
+        "nausea", "dizzy", "cough", "cold", "flu", "stomach", "chest", "back", "joint",
+        "muscle", "throat", "ear", "eye", "nose", "skin", "rash", "allergy", "medicine",
+        "medication", "pill", "tablet", "dose", "dosage", "vomit", "diarrhea", "constipation",
+        "bloating", "gas", "heartburn", "acid", "indigestion", "swelling", "inflammation",
+        "infection", "bacterial", "viral", "fungal", "itchy", "burning", "tingling", "numbness",
+        "weakness", "fatigue", "tired", "exhausted", "insomnia", "sleep", "appetite", "hungry",
+        "thirsty", "dehydrated", "bleeding", "bruise", "cut", "wound", "burn", "sprain", "strain",
+        "fracture", "broken", "dislocation", "arthritis", "diabetes", "hypertension", "asthma",
+        "allergic", "reaction", "anaphylaxis", "seizure", "convulsion", "migraine", "cluster",
+        "tension", "sinus", "bronchitis", "pneumonia", "tonsillitis", "laryngitis", "pharyngitis",
+        "gastritis", "ulcer", "colitis", "hepatitis", "kidney", "bladder", "urinary", "uti",
+        "yeast", "candida", "herpes", "warts", "mole", "cyst", "tumor", "cancer", "benign",
+        "malignant", "metastasis", "remission", "relapse", "chronic", "acute", "subacute", "first aid kit",
+        "tummy", "belly", "abdomen", "gut", "digestive", "upset", "unwell", "feeling bad", "not feeling well"
+    ]
+    return any(keyword in user_msg.lower() for keyword in health_keywords)
+
+
+def load_corpus(path=CORPUS_PATH):
+    """Labelled messages: {"text": ..., "health": bool} per line"""
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def score(predict, corpus):
+    """Confusion counts, precision and recall for a predicate on the corpus"""
+    tp = fp = fn = 0
+    false_positives = []
+    for record in corpus:
+        predicted = predict(record["text"])
+        if predicted and record["health"]:
+            tp += 1
+        elif predicted:
+            fp += 1
+            false_positives.append(record["text"])
+        elif record["health"]:
+            fn += 1
+    return {
+        "true_positives": tp,
+        "false_positives": fp,
+        "false_negatives": fn,
+        "precision": round(tp / (tp + fp), 3) if tp + fp else 0.0,
+        "recall": round(tp / (tp + fn), 3) if tp + fn else 0.0,
+        "false_positive_examples": false_positives,
+    }
+
+
+def cpu_per_call(predict, corpus, iterations):
+    """Average microseconds of CPU time per message"""
+    texts = [record["text"] for record in corpus]
+    start = time.process_time()
+    for _ in range(iterations):
+        for text in texts:
+            predict(text)
+    return round((time.process_time() - start) / (iterations * len(texts)) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    results = {}
+    for name, predict in (("legacy", legacy_is_health_concern), ("detector", lambda text: bool(detector.detect(text)))):
+        results[name] = score(predict, corpus)
+        results[name]["cpu_us_per_message"] = cpu_per_call(predict, corpus, args.iterations)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Corpus: {len(corpus)} labelled messages")
+    for name, stats in results.items():
+        print(f"{name:<9} precision {stats['precision']:<6} recall {stats['recall']:<6} "
+              f"false positives {stats['false_positives']:<3} cpu {stats['cpu_us_per_message']} us/message")
+        for text in stats["false_positive_examples"]:
+            print(f"    FP: {text}")
+
+
+if __name__ == "__main__":
+    main()
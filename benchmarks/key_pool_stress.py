@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for API key selection against the local fake Gemini server.
+
+Many threads issue LLM calls at once. The fake echoes the API key it received, so
+every reply can be checked against the key the request meant to use. Two modes run:
+
+  legacy    the old global genai.configure() + switch_to_next_api_key() scheme
+  key_pool  per-request leases from KeyPool with per-key clients from ModelPool
+
+Run from the repository root:
+    python benchmarks/key_pool_stress.py [--threads 32] [--requests 20] [--keys 4]
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import google.generativeai as genai
+
+from benchmarks.fake_gemini import FakeGemini
+from key_pool import KeyPool
+from model_pool import ModelPool
+
+MODEL = "gemini-1.5-flash"
+KEY_IN_REPLY = re.compile(r"^\[key=([^\]]+)\]")
+
+
+def run_threads(threads, worker):
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def legacy(fake, keys, threads, requests):
+    """Global configure with key switching on failure, as app.py used to do"""
+    state = {"index": 0}
+    lock = threading.Lock()
+    results = collections.Counter()
+
+    def configure(index):
+        genai.configure(api_key=keys[index], transport="rest", client_options={"api_endpoint": fake.url})
+
+    def switch():
+        state["index"] = (state["index"] + 1) % len(keys)
+        configure(state["index"])
+
+    configure(0)
+
+    def worker(_):
+        for _ in range(requests):
+            for _ in range(len(keys)):
+                intended = keys[state["index"]]
+                try:
+                    reply = genai.GenerativeModel(MODEL).generate_content("hello").text
+                except Exception:
+                    switch()
+                    with lock:
+                        results["errors"] += 1
+                    continue
+                used = KEY_IN_REPLY.match(reply).group(1)
+                with lock:
+                    results["ok"] += 1
+                    results["key_mismatches"] += used != intended
+                    # Another request's failure moved the global key while this one was in flight
+                    results["key_changed_in_flight"] += keys[state["index"]] != intended
+                break
+
+    elapsed = run_threads(threads, worker)
+    return elapsed, results
+
+
+def pooled(fake, keys, threads, requests):
+    """Per-request key leases from KeyPool"""
+    key_pool = KeyPool(keys)
+    model_pool = ModelPool({"api_endpoint": fake.url}, "rest")
+    lock = threading.Lock()
+    results = collections.Counter()
+
+    def worker(_):
+        for _ in range(requests):
+            tried = set()
+            while True:
+                lease = key_pool.acquire(exclude=tried)
+                if lease is None:
+                    if len(tried) < len(keys):
+                        time.sleep(min(key_pool.next_available_in(), 0.5))
+                        continue
+                    with lock:
+                        results["gave_up"] += 1
+                    break
+                tried.add(lease.index)
+                try:
+                    with lease:
+                        reply = model_pool.get(lease.api_key, MODEL).generate_content("hello").text
+                except Exception:
+                    with lock:
+                        results["errors"] += 1
+                    continue
+                used = KEY_IN_REPLY.match(reply).group(1)
+                with lock:
+                    results["ok"] += 1
+                    results["key_mismatches"] += used != lease.api_key
+                break
+
+    elapsed = run_threads(threads, worker)
+    results["keys_benched"] = sum(1 for state in key_pool.stats()["keys"] if state["rate_limited"])
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20, help="LLM calls per thread")
+    parser.add_argument("--keys", type=int, default=4)
+    parser.add_argument("--rpm", type=int, default=200, help="fake per-key rate limit (requests/minute)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    logging.getLogger("key_pool").setLevel(logging.ERROR)
+    keys = [f"fake-key-{n:04d}" for n in range(1, args.keys + 1)]
+    report = {}
+    for name, mode in (("legacy", legacy), ("key_pool", pooled)):
+        fake = FakeGemini(latency=0.02, jitter=0.01, rate_limit_rpm=args.rpm, retry_after=2, echo_key=True, seed=1).start()
+        elapsed, results = mode(fake, keys, args.threads, args.requests)
+        calls = [r for r in fake.requests if r["path"].startswith("models/")]
+        fake.stop()
+        per_key = collections.Counter(r["api_key"] for r in calls if r["status"] == 200)
+        report[name] = {
+            "seconds": round(elapsed, 2),
+            **results,
+            "rate_limited_responses": sum(1 for r in calls if r["status"] == 429),
+            "successful_calls_per_key": {key: per_key.get(key, 0) for key in keys},
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<26} {value}")
+
+
+if __name__ == "__main__":
+    main()
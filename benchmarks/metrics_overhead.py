@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Cost of the chat pipeline instrumentation in each METRICS_MODE.
+
+Times an empty metrics.stage() span, and a full request's worth of
+instrumentation (the spans, LLM attempt and reply counter one model-backed /chat
+records), against the same loop with no instrumentation at all.
+
+Run from the repository root:
+    python benchmarks/metrics_overhead.py [--iterations 200000]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics
+
+# The stages a model-backed /chat request passes through
+REQUEST_STAGES = (
+    "parse", "session_load", "keyword_detection", "fact_extraction", "catalogue_fast_path",
+    "response_cache", "session_save", "model_init", "prompt_build", "history_update",
+    "session_save", "reply_structure", "serialization",
+)
+
+
+def one_request():
+    token = metrics.begin_trace()
+    for name in REQUEST_STAGES:
+        with metrics.stage(name):
+            pass
+    metrics.observe_llm_attempt(0, 0.5, ok=True)
+    metrics.count_reply("model")
+    metrics.observe_request("chat", 200, 0.5)
+    metrics.end_trace(token, "POST /chat")
+
+
+def per_call_us(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    # Trace lines would otherwise dominate the timing with terminal output
+    logging.getLogger("metrics").setLevel(logging.WARNING)
+
+    def empty_span():
+        with metrics.stage("bench"):
+            pass
+
+    report = {}
+    for mode in metrics.MODES:
+        metrics.configure(mode)
+        report[mode] = {
+            "span_us": round(per_call_us(empty_span, args.iterations), 3),
+            "per_request_us": round(per_call_us(one_request, args.iterations // 10), 2),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(REQUEST_STAGES)} spans per request")
+    for mode, stats in report.items():
+        print(f"{mode:<6} span {stats['span_us']:.3f}us   whole request {stats['per_request_us']:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Token-count report comparing the old prompt (whole catalogue embedded in the
+system prompt) with the retrieval-based prompt on a fixed set of conversations.
+
+Run from the repository root:
+    python benchmarks/prompt_tokens.py            # offline estimate (~4 chars/token)
+    python benchmarks/prompt_tokens.py --api      # exact counts via Gemini count_tokens
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalogue import get_catalogue
+from prompts import system_prompt
+from retrieval import build_medication_context
+
+MODEL_REPLY = (
+    "Possible Cause: Likely a mild, self-limiting problem. "
+    "Recommended Steps: Rest, fluids and monitor symptoms for the next 48 hours. "
+    "Medications: See the recommended option and dosage from the database. "
+    "When to See a Doctor: If symptoms worsen or last more than 2-3 days."
+)
+
+CONVERSATIONS = [
+    {"name": "headache", "age": 30, "gender": "male",
+     "turns": ["I have a headache", "It started this morning", "Is paracetamol okay?"]},
+    {"name": "first-aid-kit", "age": 40, "gender": "female",
+     "turns": ["I need a first aid kit for home", "Anything for kids too?"]},
+    {"name": "child-diarrhea", "age": 5, "gender": "male",
+     "turns": ["My son has loose motion and tummy pain", "Since yesterday", "He is drinking water"]},
+    {"name": "period-pain", "age": 22, "gender": "female",
+     "turns": ["Bad period cramps", "Also bloating", "What can I take?"]},
+    {"name": "cough-cold", "age": 67, "gender": "female",
+     "turns": ["Cough and runny nose", "Dry cough, 4 days", "No fever", "Can I take a syrup?"]},
+    {"name": "travel", "age": 35, "gender": "male",
+     "turns": ["What should I pack for a trip abroad?", "We go hiking as well"]},
+]
+
+
+def estimate_tokens(text):
+    """Rough token estimate used by Gemini docs for English text"""
+    return max(1, len(text) // 4)
+
+
+def api_counter():
+    """Return a token counter backed by the Gemini count_tokens endpoint"""
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY_1") or os.getenv("GEMINI_API_KEY"))
+    model = genai.GenerativeModel("gemini-1.5-flash")
+    return lambda text: model.count_tokens(text).total_tokens
+
+
+def replay(conversation, count, legacy):
+    """Count the prompt tokens sent on each turn of a conversation"""
+    legacy_prompt = f"{system_prompt}\n{get_catalogue().current().data}"
+    history = []
+    per_turn = []
+    for message in conversation["turns"]:
+        preface = (
+            f"The user is a {conversation['age']} year old {conversation['gender']}. "
+            "DO NOT ask for age or gender again as this information has already been provided."
+        )
+        if legacy:
+            prompt = legacy_prompt
+        else:
+            prompt = system_prompt
+            preface += "\n\n" + build_medication_context(message, conversation["age"], history[0::2])
+        history_text = "\n".join(history)
+        per_turn.append(count(f"{prompt}\n{history_text}\n{preface}\nUser: {message}"))
+        history += [message, MODEL_REPLY]
+    return per_turn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", action="store_true", help="count tokens with the Gemini API")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    count = api_counter() if args.api else estimate_tokens
+    results = []
+    for conversation in CONVERSATIONS:
+        old = replay(conversation, count, legacy=True)
+        new = replay(conversation, count, legacy=False)
+        results.append({"conversation": conversation["name"], "old": old, "new": new})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'conversation':<16}{'turns':>6}{'old tokens':>12}{'new tokens':>12}{'saved':>8}")
+    total_old = total_new = 0
+    for result in results:
+        old, new = sum(result["old"]), sum(result["new"])
+        total_old += old
+        total_new += new
+        print(f"{result['conversation']:<16}{len(result['old']):>6}{old:>12}{new:>12}{1 - new / old:>8.0%}")
+    print(f"{'total':<16}{'':>6}{total_old:>12}{total_new:>12}{1 - total_new / total_old:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark: multi-turn conversations from a JSONL corpus played against the
+app, with Gemini replaced by benchmarks/fake_gemini.py.
+
+  synthesize   write a seeded corpus of scripted consultations, one per line:
+                 {"id": "c0001", "messages": ["I have a headache", "30", "female", ...]}
+               Conversations exported from real sessions in the same shape replay as well.
+  run          start the stub (--latency, --error-rate, --rate-limit-rpm, --retry-after)
+               and a gunicorn server, then
+                 1. profile: each conversation of --profile-sample played serially on the
+                    fresh server, attributing the stub's requests to the turn that made them
+                    (prompt tokens and LLM calls per turn index)
+                 2. load: the whole corpus replayed by --concurrency clients, each
+                    conversation in its own cookie session
+               and report throughput, latency percentiles, statuses, reply sources (from
+               /metrics), prompt tokens per turn and server memory before/after/peak.
+               --output saves the report as JSON, tagged with the git commit.
+  compare      diff two saved reports and exit 1 when a metric regressed by more than
+               --tolerance.
+
+Run from the repository root:
+    python benchmarks/replay.py synthesize [--conversations 200] [--seed 7]
+    python benchmarks/replay.py run --output benchmarks/results/$(git rev-parse --short HEAD).json
+    python benchmarks/replay.py compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+
+import argparse
+import hashlib
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.async_load_test import free_port, process_tree_rss, wait_until_up
+from benchmarks.fake_gemini import FakeGemini
+
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "replay_corpus.jsonl")
+UNAVAILABLE_PREFIX = "⚠️ Sorry, I'm temporarily unavailable"
+
+CONCERNS = [
+    "I have a headache", "I have had a fever since yesterday", "my stomach hurts after eating",
+    "I have a dry cough", "sore throat and runny nose", "I feel acidity and heartburn",
+    "I have loose motions", "back pain after lifting something heavy", "itchy rash on my arm",
+    "I can't sleep at night", "my knee hurts when I climb stairs", "I feel dizzy when I stand up",
+    "burning when I urinate", "period cramps", "my eyes are red and watery", "toothache on the left side",
+]
+FOLLOW_UPS = [
+    "what medicine can I take?", "how long will it last?", "should I see a doctor?",
+    "can I take paracetamol?", "is it serious?", "what should I eat?", "it got worse since morning",
+    "I also have a mild fever", "can I go to work?", "thanks",
+]
+AGE_REPLIES = ["{age}", "I'm {age}", "{age} years old", "age {age}"]
+GENDER_REPLIES = {"male": ["male", "m", "I am a man"], "female": ["female", "f", "I am a woman"]}
+OPENERS_WITH_FACTS = ["I'm {age} and {gender}, {concern}", "{age}{letter} - {concern}", "{concern}. {gender} {age}"]
+
+# Report fields compared by `compare`: (path in the report, True when higher is better)
+COMPARED = [
+    (("throughput", "turns_per_second"), True),
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("latency_ms", "p99"), False),
+    (("prompt_tokens", "mean_per_model_turn"), False),
+    (("memory", "growth_mb"), False),
+    (("memory", "peak_mb"), False),
+    (("unavailable_replies",), False),
+]
+
+
+def synthesize_conversation(rng, index, max_turns):
+    age = rng.choice([rng.randint(18, 45), rng.randint(46, 80), rng.randint(13, 17)])
+    gender = rng.choice(["male", "female"])
+    concern = rng.choice(CONCERNS)
+    if rng.random() < 0.4:
+        opener = rng.choice(OPENERS_WITH_FACTS).format(age=age, gender=gender, letter=gender[0].upper(), concern=concern)
+        messages = [opener]
+    else:
+        messages = [concern, rng.choice(AGE_REPLIES).format(age=age), rng.choice(GENDER_REPLIES[gender])]
+    follow_ups = rng.sample(FOLLOW_UPS, k=min(len(FOLLOW_UPS), max(0, rng.randint(1, max_turns) - len(messages))))
+    return {"id": f"c{index:04d}", "messages": messages + follow_ups}
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def file_sha256(path):
+    with open(path, "rb") as handle:
+        return hashlib.sha256(handle.read()).hexdigest()[:16]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def percentile(ordered, fraction):
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1) if ordered else None
+
+
+class Client:
+    """One conversation's HTTP session; the cookie jar carries the Flask session between turns"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def chat(self, message, path="/chat", headers=None):
+        """(status, reply payload or None, seconds); the payload is None for a streamed reply"""
+        request = urllib.request.Request(
+            f"{self.base_url}{path}", data=json.dumps({"message": message}).encode(),
+            headers={"Content-Type": "application/json", **(headers or {})}, method="POST",
+        )
+        started = time.monotonic()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, body = error.code, error.read()
+        except OSError:
+            return None, None, time.monotonic() - started
+        elapsed = time.monotonic() - started
+        try:
+            return status, json.loads(body), elapsed
+        except ValueError:
+            return status, None, elapsed
+
+
+def profile(base_url, fake, conversations, timeout):
+    """Prompt tokens and LLM calls per turn index, from conversations played one at a time"""
+    tokens_by_turn, calls_by_turn = {}, {}
+    for conversation in conversations:
+        client = Client(base_url, timeout)
+        for turn, message in enumerate(conversation["messages"], 1):
+            seen = len(fake.requests)
+            client.chat(message)
+            made = [entry for entry in fake.requests[seen:] if "input_tokens" in entry and entry["path"].startswith("models/")]
+            calls_by_turn[turn] = calls_by_turn.get(turn, 0) + len(made)
+            tokens_by_turn.setdefault(turn, []).extend(
+                entry["input_tokens"] + entry["cached_tokens"] for entry in made if entry["status"] == 200
+            )
+    samples = [tokens for per_turn in tokens_by_turn.values() for tokens in per_turn]
+    return {
+        "conversations": len(conversations),
+        "mean_per_model_turn": round(sum(samples) / len(samples), 1) if samples else None,
+        "max": max(samples) if samples else None,
+        "mean_by_turn": {turn: round(sum(values) / len(values), 1) if values else None for turn, values in sorted(tokens_by_turn.items())},
+        "llm_calls_by_turn": dict(sorted(calls_by_turn.items())),
+    }
+
+
+def load(base_url, pid, conversations, concurrency, timeout):
+    latencies, statuses = [], {}
+    unavailable = 0
+    lock = threading.Lock()
+    peak_rss = process_tree_rss(pid)
+    done = threading.Event()
+
+    def play(conversation):
+        nonlocal unavailable
+        client = Client(base_url, timeout)
+        for message in conversation["messages"]:
+            status, payload, seconds = client.chat(message)
+            with lock:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status is not None:
+                    latencies.append(seconds)
+                if payload and str(payload.get("reply", "")).startswith(UNAVAILABLE_PREFIX):
+                    unavailable += 1
+
+    def sample_memory():
+        nonlocal peak_rss
+        while not done.wait(0.25):
+            peak_rss = max(peak_rss, process_tree_rss(pid))
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(play, conversations))
+    elapsed = time.monotonic() - started
+    done.set()
+    sampler.join()
+
+    ordered = sorted(latencies)
+    turns = sum(statuses.values())
+    return {
+        "throughput": {
+            "elapsed_s": round(elapsed, 2),
+            "turns": turns,
+            "turns_per_second": round(turns / elapsed, 1),
+            "conversations_per_second": round(len(conversations) / elapsed, 2),
+        },
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 1) if ordered else None,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+            "max": round(ordered[-1] * 1000, 1) if ordered else None,
+        },
+        "statuses": dict(sorted(statuses.items())),
+        "unavailable_replies": unavailable,
+        "peak_rss": peak_rss,
+    }
+
+
+def scrape_reply_sources(base_url):
+    """curaai_chat_replies_total by source, from the server's /metrics"""
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+            text = response.read().decode()
+    except OSError:
+        return None
+    sources = {}
+    for line in text.splitlines():
+        if line.startswith('curaai_chat_replies_total{source="'):
+            labels, value = line.rsplit(" ", 1)
+            sources[labels.split('"')[1]] = int(float(value))
+    return sources
+
+
+def llm_summary(fake):
+    calls = [entry for entry in fake.requests if entry["path"].startswith("models/")]
+    by_status = {}
+    for entry in calls:
+        by_status[str(entry["status"])] = by_status.get(str(entry["status"]), 0) + 1
+    return {"calls": len(calls), "by_status": dict(sorted(by_status.items())), "max_in_flight": fake.max_in_flight}
+
+
+def run(args):
+    conversations = load_corpus(args.corpus)
+    if args.limit:
+        conversations = conversations[:args.limit]
+    fake = FakeGemini(latency=args.latency, jitter=args.latency / 10, error_rate=args.error_rate,
+                      rate_limit_rpm=args.rate_limit_rpm, retry_after=args.retry_after, seed=args.seed).start()
+    env = {
+        **os.environ,
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": fake.url,
+        "FLASK_ENV": "development",
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+        "METRICS_MODE": "basic",
+    }
+    env.pop("GEMINI_API_KEY", None)
+    for index in range(1, args.keys + 1):
+        env[f"GEMINI_API_KEY_{index}"] = f"fake-key-{index:04d}"
+    env.pop(f"GEMINI_API_KEY_{args.keys + 1}", None)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        ["gunicorn", "app:app", "-k", "gthread", "-w", "1", "--threads", str(args.threads), "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(port, process)
+        rss_start = process_tree_rss(process.pid)
+
+        # The profile pass runs first so its cold caches are the same on every run
+        prompt_tokens = profile(base_url, fake, conversations[:args.profile_sample], args.timeout)
+        fake.reset()
+
+        result = load(base_url, process.pid, conversations, args.concurrency, args.timeout)
+        rss_end = process_tree_rss(process.pid)
+        sources = scrape_reply_sources(base_url)
+    finally:
+        process.terminate()
+        process.wait()
+        fake.stop()
+
+    commit, dirty = git_commit()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": {
+            "corpus": os.path.relpath(args.corpus, ROOT),
+            "corpus_sha256": file_sha256(args.corpus),
+            "conversations": len(conversations),
+            "concurrency": args.concurrency,
+            "threads": args.threads,
+            "keys": args.keys,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "rate_limit_rpm": args.rate_limit_rpm,
+            "retry_after": args.retry_after,
+        },
+        "throughput": result["throughput"],
+        "latency_ms": result["latency_ms"],
+        "statuses": result["statuses"],
+        "unavailable_replies": result["unavailable_replies"],
+        # Includes the profile pass
+        "replies_by_source": sources,
+        "llm": llm_summary(fake),
+        "prompt_tokens": prompt_tokens,
+        "memory": {
+            "start_mb": round(rss_start / 2 ** 20, 1),
+            "end_mb": round(rss_end / 2 ** 20, 1),
+            "peak_mb": round(result["peak_rss"] / 2 ** 20, 1),
+            "growth_mb": round((rss_end - rss_start) / 2 ** 20, 1),
+        },
+    }
+
+
+def lookup(report, path):
+    for key in path:
+        report = report.get(key) if isinstance(report, dict) else None
+    return report
+
+
+def compare(old, new, tolerance):
+    """(field, old, new, relative change, regressed) for every compared field present in both reports"""
+    rows = []
+    for path, higher_is_better in COMPARED:
+        before, after = lookup(old, path), lookup(new, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / abs(before) if before else (0.0 if after == before else float("inf"))
+        worse = -change if higher_is_better else change
+        # Memory growth is a few MB either way; ignore changes under 1 MB
+        small = path[0] == "memory" and abs(after - before) < 1.0
+        rows.append((".".join(path), before, after, change, worse > tolerance and not small))
+    return rows
+
+
+def print_report(report):
+    settings = report["settings"]
+    print(f"commit {report['commit']}{' (dirty)' if report['dirty'] else ''}, {settings['conversations']} conversations, "
+          f"{settings['concurrency']} clients, stub latency {settings['latency']}s, error rate {settings['error_rate']}, "
+          f"rate limit {settings['rate_limit_rpm'] or 'none'} rpm")
+    for section in ("throughput", "latency_ms", "statuses", "replies_by_source", "llm", "memory"):
+        print(f"{section}: {json.dumps(report[section])}")
+    print(f"unavailable_replies: {report['unavailable_replies']}")
+    tokens = report["prompt_tokens"]
+    print(f"prompt tokens: mean {tokens['mean_per_model_turn']} per model turn, max {tokens['max']} "
+          f"({tokens['conversations']} conversations profiled)")
+    for turn, mean in tokens["mean_by_turn"].items():
+        print(f"    turn {turn:>2}: {mean if mean is not None else '-':>7}   llm calls {tokens['llm_calls_by_turn'][turn]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    synthesize = commands.add_parser("synthesize", help="write a seeded conversation corpus")
+    synthesize.add_argument("--conversations", type=int, default=200)
+    synthesize.add_argument("--max-turns", type=int, default=7, help="turns per conversation, at most")
+    synthesize.add_argument("--seed", type=int, default=7)
+    synthesize.add_argument("--output", default=CORPUS_PATH)
+
+    replay = commands.add_parser("run", help="replay a corpus against the app and a fake Gemini")
+    replay.add_argument("--corpus", default=CORPUS_PATH)
+    replay.add_argument("--limit", type=int, default=0, help="replay only the first N conversations")
+    replay.add_argument("--concurrency", type=int, default=16, help="conversations replayed at once")
+    replay.add_argument("--threads", type=int, default=16, help="gunicorn gthread threads (one worker)")
+    replay.add_argument("--keys", type=int, default=3, help="fake API keys given to the app")
+    replay.add_argument("--latency", type=float, default=0.2, help="stub seconds per LLM call")
+    replay.add_argument("--error-rate", type=float, default=0.0, help="share of LLM calls failing with a 500")
+    replay.add_argument("--rate-limit-rpm", type=int, default=None, help="stub requests per minute per key before 429s")
+    replay.add_argument("--retry-after", type=int, default=30, help="Retry-After seconds on the stub's 429s")
+    replay.add_argument("--profile-sample", type=int, default=20, help="conversations played serially for prompt tokens")
+    replay.add_argument("--timeout", type=float, default=60.0, help="client timeout per turn")
+    replay.add_argument("--seed", type=int, default=3, help="seed for the stub's jitter and errors")
+    replay.add_argument("--output", help="save the report as JSON to this path")
+    replay.add_argument("--json", action="store_true", help="print machine-readable results")
+
+    diff = commands.add_parser("compare", help="compare two saved reports")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    diff.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    if args.command == "synthesize":
+        rng = random.Random(args.seed)
+        with open(args.output, "w", encoding="utf-8") as handle:
+            for index in range(1, args.conversations + 1):
+                handle.write(json.dumps(synthesize_conversation(rng, index, args.max_turns)) + "\n")
+        print(f"wrote {args.conversations} conversations to {os.path.relpath(args.output)}")
+
+    elif args.command == "run":
+        report = run(args)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+
+    else:
+        with open(args.old, encoding="utf-8") as handle:
+            old = json.load(handle)
+        with open(args.new, encoding="utf-8") as handle:
+            new = json.load(handle)
+        rows = compare(old, new, args.tolerance)
+        regressed = [row for row in rows if row[4]]
+        if args.json:
+            print(json.dumps([
+                {"field": field, "old": before, "new": after, "change": round(change, 3), "regressed": bad}
+                for field, before, after, change, bad in rows
+            ], indent=2))
+        else:
+            print(f"{old.get('commit')} -> {new.get('commit')}, tolerance {args.tolerance:.0%}")
+            changed = sorted(key for key in set(old["settings"]) | set(new["settings"])
+                             if old["settings"].get(key) != new["settings"].get(key))
+            if changed:
+                print(f"    note: the runs used different settings ({', '.join(changed)})")
+            for field, before, after, change, bad in rows:
+                print(f"    {field:<34} {before:>10} -> {after:<10} {change:+.1%}{'   REGRESSION' if bad else ''}")
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Cost of the reply post-processing stage (reply_structure.structure_reply) per
+model reply, against the 1 ms budget.
+
+Replies are generated from the catalogue the way Gemini writes them: the four
+headings (plain, bold or numbered), two to five medicines named by generic name
+or brand with a dose, sometimes a medicine the catalogue doesn't carry, and the
+canned reply of the fake Gemini server. Each is post-processed for a random age.
+
+The indexed lookup is compared with scanning every catalogue name and brand for
+each reply, on the shipped catalogue and on one grown --scale times with renamed
+copies of its entries, to show the lookup stays flat as the catalogue grows.
+
+Run from the repository root:
+    python benchmarks/reply_structure.py [--replies 5000] [--scale 10]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_gemini import DEFAULT_REPLY
+from catalogue import CATALOGUE_PATH, Snapshot, parse
+from reply_structure import MedicationLookup, _brand_aliases, _name_aliases, parse_reply
+from retrieval import age_group_allows
+import reply_structure
+
+BUDGET_US = 1000
+HEADINGS = (
+    ("Possible Cause:", "Recommended Steps:", "Medications:", "When to See a Doctor:"),
+    ("**Possible Cause:**", "**Recommended Steps:**", "**Medications:**", "**When to See a Doctor:**"),
+    ("1. Possible Cause:", "2. Recommended Steps:", "3. Medications:", "4. When to See a Doctor:"),
+)
+UNKNOWN = ("Azithromycin 500 mg once daily", "Amoxicillin 250mg three times daily", "Prednisolone 10 mg in the morning")
+
+
+def load_catalogue(scale):
+    with open(CATALOGUE_PATH, encoding="utf-8") as handle:
+        data = parse(handle.read())
+    if scale > 1:
+        # Renamed copies, so the tables grow the way a larger formulary would
+        data = [
+            {"category": f"{category['category']} {copy}",
+             "entries": [{**entry, "medicine": f"{entry['medicine']} V{copy}", "examples": f"{entry['examples']} V{copy}"}
+                         for entry in category["entries"]]}
+            for copy in range(scale) for category in data
+        ]
+    return Snapshot(data, f"x{scale}")
+
+
+def make_replies(data, count, seed):
+    rng = random.Random(seed)
+    entries = [entry for category in data for entry in category["entries"]]
+    replies = [DEFAULT_REPLY]
+    while len(replies) < count:
+        cause, steps, medications, doctor = rng.choice(HEADINGS)
+        items = []
+        for entry in rng.sample(entries, rng.randint(2, 5)):
+            brands = [brand.strip() for brand in entry["examples"].split(",")]
+            name = entry["medicine"] if rng.random() < 0.7 else rng.choice(brands)
+            items.append(f"- {name}: {entry['dosage']} ({', '.join(brands[:2])})")
+        if rng.random() < 0.3:
+            items.append(f"- {rng.choice(UNKNOWN)}")
+        replies.append(
+            f"{cause} A viral infection is the most likely cause, given the symptoms you describe.\n"
+            f"{steps} Rest, drink plenty of fluids and keep a note of your temperature twice a day.\n"
+            f"{medications}\n" + "\n".join(items) + "\n"
+            f"{doctor} If symptoms last more than 3 days, get worse, or you notice breathing difficulty."
+        )
+    return replies
+
+
+def scan_structure(text, age, names):
+    """The same result by scanning every catalogue name and brand for each reply"""
+    sections = parse_reply(text)
+    if sections is None or not sections["medications"]:
+        return sections
+    padded = f' {" ".join(re.findall(r"[a-z0-9]+", sections["medications"].lower()))} '
+    found = []
+    for alias, entries in names:
+        if f" {alias} " in padded:
+            found.append([entry for entry in entries if age_group_allows(entry["age_group"], age)])
+    return {**sections, "medicines": found}
+
+
+def scan_table(data):
+    names = {}
+    for category in data:
+        for entry in category["entries"]:
+            for alias in _name_aliases(entry["medicine"]) + _brand_aliases(entry["examples"]):
+                names.setdefault(" ".join(alias), []).append(entry)
+    return list(names.items())
+
+
+def timed(function, replies, ages):
+    samples = []
+    for text, age in zip(replies, ages):
+        started = time.perf_counter()
+        function(text, age)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+        "max_us": round(samples[-1] * 1e6, 1),
+    }
+
+
+def measure(scale, count, seed):
+    snapshot = load_catalogue(scale)
+    replies = make_replies(snapshot.data, count, seed)
+    ages = [random.Random(seed + n).choice((1, 5, 9, 16, 30, 45, 70)) for n in range(count)]
+    started = time.perf_counter()
+    snapshot.derived("medication_lookup", MedicationLookup)
+    build_ms = (time.perf_counter() - started) * 1000
+    names = scan_table(snapshot.data)
+
+    def indexed(text, age):
+        return reply_structure.structure_reply(text, age, snapshot)
+
+    def scanning(text, age):
+        return scan_structure(text, age, names)
+
+    # One pass to warm caches and compiled patterns
+    for text, age in zip(replies[:200], ages):
+        indexed(text, age)
+        scanning(text, age)
+    checked = [indexed(text, age) for text, age in zip(replies, ages)]
+    return {
+        "entries": snapshot.entry_count,
+        "aliases": len(snapshot.derived("medication_lookup", MedicationLookup).names),
+        "lookup_build_ms": round(build_ms, 2),
+        "indexed": timed(indexed, replies, ages),
+        "scan": timed(scanning, replies, ages),
+        "medicines_per_reply": round(sum(len(result["medicines"]) for result in checked) / count, 2),
+        "unverified_replies": sum(bool(result["unverified"]) for result in checked),
+        "warning_replies": sum(bool(result["warnings"]) for result in checked),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=5000)
+    parser.add_argument("--scale", type=int, default=10, help="copies of the catalogue in the grown run")
+    parser.add_argument("--seed", type=int, default=24)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    report = {f"catalogue x{scale}": measure(scale, args.replies, args.seed) for scale in (1, args.scale)}
+    within = all(run["indexed"]["p99_us"] < BUDGET_US for run in report.values())
+    report["within_budget"] = within
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.replies} replies; budget {BUDGET_US} us per reply")
+        print(f"{'catalogue':<15} {'entries':>8} {'aliases':>8} {'method':>8} {'mean us':>8} {'p50 us':>8} {'p99 us':>8} {'max us':>8}")
+        for name, run in report.items():
+            if name == "within_budget":
+                continue
+            for method in ("indexed", "scan"):
+                stats = run[method]
+                print(f"{name:<15} {run['entries']:>8} {run['aliases']:>8} {method:>8} {stats['mean_us']:>8} "
+                      f"{stats['p50_us']:>8} {stats['p99_us']:>8} {stats['max_us']:>8}")
+            print(f"{'':<15} lookup built in {run['lookup_build_ms']} ms; {run['medicines_per_reply']} medicines per reply, "
+                  f"{run['unverified_replies']} replies with unverified items, {run['warning_replies']} with age warnings")
+        print("p99 within budget" if within else "p99 OVER budget")
+    sys.exit(0 if within else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark the inverted medicine index against the linear search_medicine scan
+on a synthetically scaled catalogue.
+
+Run from the repository root:
+    python benchmarks/search_index.py [--entries 100000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import medicine
+from catalogue import get_catalogue
+from search_index import MedicineIndex
+
+QUERIES = ["paracetamol", "cough", "stomach pain", "cetirizine", "burn", "fungal infection",
+           "eye drops", "zyrtec", "period", "loperamide"]
+
+SYLLABLES = ["ra", "to", "mex", "lin", "dol", "fen", "zor", "vi", "cal", "pra", "nex", "ol"]
+
+
+def scaled_catalogue(size, seed=7):
+    """Replicate the catalogue to size entries with synthetic brand names"""
+    rng = random.Random(seed)
+    base = [(category["category"], entry) for category in get_catalogue().current().data for entry in category["entries"]]
+    categories = {}
+    for i in range(size):
+        name, entry = base[i % len(base)]
+        brand = "".join(rng.choice(SYLLABLES) for _ in range(3)).title()
+        categories.setdefault(f"{name} #{i % 50}", []).append({
+            **entry,
+            "medicine": f"{entry['medicine']} {brand}",
+            "examples": f"{entry['examples']}, {brand}",
+        })
+    return [{"category": name, "entries": entries} for name, entries in categories.items()]
+
+
+def timed(func, repeat):
+    """Run func repeat times and return latencies in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    """p50/p95 of a latency sample"""
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    data = scaled_catalogue(args.entries)
+
+    start = time.perf_counter()
+    index = MedicineIndex(data)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    linear = [s for q in QUERIES for s in timed(lambda q=q: medicine.search_medicine(q, data), args.repeat)]
+    indexed = [s for q in QUERIES for s in timed(lambda q=q: index.search(q), args.repeat)]
+    filtered = [s for q in QUERIES for s in timed(lambda q=q: index.search(q, form="tablet", age=30), args.repeat)]
+
+    results = {
+        "entries": args.entries,
+        "index_build_ms": round(build_ms, 1),
+        "search_medicine": summarize(linear),
+        "index_search": summarize(indexed),
+        "index_search_filtered": summarize(filtered),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Catalogue size:        {args.entries} entries")
+    print(f"Index build time:      {results['index_build_ms']} ms")
+    for label in ("search_medicine", "index_search", "index_search_filtered"):
+        stats = results[label]
+        print(f"{label:<22} p50 {stats['p50_ms']:>9} ms   p95 {stats['p95_ms']:>9} ms")
+
+
+if __name__ == "__main__":
+    main()
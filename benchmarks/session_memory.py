@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Resident memory of idle sessions in MemorySessionStore, before and after a change
+to the session state.
+
+Each measurement runs in a fresh interpreter that imports session_store.py and
+history_manager.py from one revision (the working tree, or --before, extracted
+with git show), fills a store with N idle consultations and reports how much RSS
+grew. Every session has its own age, gender and a couple of exchanges recorded
+through HistoryManager, with texts unique to it, as real sessions would.
+
+Run from the repository root:
+    python benchmarks/session_memory.py [--before HEAD~1] [--sessions 10000,100000,1000000]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODULES = ("session_store.py", "history_manager.py")
+
+# Runs in the child: argv is the module directory, session count and exchanges per session
+CHILD = r"""
+import gc, json, sys
+sys.path.insert(0, sys.argv[1])
+from history_manager import HistoryManager
+from session_store import MemorySessionStore, new_context
+
+def rss_bytes():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+
+def set_field(context, name, value):
+    # Older revisions keep the state in a dict
+    if isinstance(context, dict):
+        context[name] = value
+    else:
+        setattr(context, name, value)
+
+sessions, turns = int(sys.argv[2]), int(sys.argv[3])
+manager = HistoryManager()
+store = MemorySessionStore(max_sessions=sessions, max_bytes=2 ** 62)
+gc.collect()
+before = rss_bytes()
+for n in range(sessions):
+    context = new_context()
+    set_field(context, "age", 18 + n % 60)
+    set_field(context, "gender", "female" if n % 2 else "male")
+    for turn in range(turns):
+        manager.record(
+            context,
+            f"I have had a headache for {n % 7 + 1} days, turn {turn} of session {n}",
+            f"Possible Cause: Tension headache ({n}/{turn}).\nRecommended Steps: Rest in a quiet room and drink water.\n"
+            "Medications: Paracetamol 500-1000mg every 4-6 hours.\nWhen to See a Doctor: If it lasts more than 3 days.",
+        )
+    store.save_context(f"user-{n:07d}", context)
+    store.increment_message_count(f"user-{n:07d}")
+gc.collect()
+after = rss_bytes()
+print(json.dumps({"rss_bytes": after - before, "store_bytes": store.stats()["bytes"]}))
+"""
+
+
+def extract(revision, directory):
+    """Write the session modules of a git revision into directory"""
+    for name in MODULES:
+        source = subprocess.run(["git", "show", f"{revision}:{name}"], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        with open(os.path.join(directory, name), "w") as module:
+            module.write(source)
+
+
+def measure(directory, sessions, turns):
+    result = subprocess.run([sys.executable, "-c", CHILD, directory, str(sessions), str(turns)],
+                            cwd=ROOT, check=True, capture_output=True, text=True)
+    stats = json.loads(result.stdout)
+    return {
+        "rss_mb": round(stats["rss_bytes"] / 2 ** 20, 1),
+        "rss_bytes_per_session": round(stats["rss_bytes"] / sessions),
+        "accounted_bytes_per_session": round(stats["store_bytes"] / sessions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--before", default="HEAD~1", help="git revision to compare the working tree against")
+    parser.add_argument("--sessions", default="10000,100000,1000000", help="comma-separated session counts")
+    parser.add_argument("--turns", type=int, default=2, help="exchanges recorded per session")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.sessions.split(",")]
+    report = {"before": {}, "after": {}}
+    with tempfile.TemporaryDirectory() as before_dir:
+        extract(args.before, before_dir)
+        for count in counts:
+            report["before"][count] = measure(before_dir, count, args.turns)
+            report["after"][count] = measure(ROOT, count, args.turns)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Idle sessions with {args.turns} exchanges each, {args.before} vs working tree")
+    print(f"{'sessions':>10} {'before MB':>10} {'after MB':>10} {'before B/session':>17} {'after B/session':>16}")
+    for count in counts:
+        before, after = report["before"][count], report["after"][count]
+        print(f"{count:>10} {before['rss_mb']:>10} {after['rss_mb']:>10} "
+              f"{before['rss_bytes_per_session']:>17} {after['rss_bytes_per_session']:>16}")
+
+
+if __name__ == "__main__":
+    main()
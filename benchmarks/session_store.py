@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Lookup latency and memory per 100k sessions for the session store backends.
+
+Every session holds a realistic consultation context (age, gender and a few
+question/answer exchanges). Backends measured:
+
+  dict      the old module-level user_context / user_message_counts dicts
+  memory    MemorySessionStore (SessionState entries, LRU/TTL bounded)
+  redis     RedisSessionStore against --redis-url, or in-process fakeredis if none is given
+
+Run from the repository root:
+    python benchmarks/session_store.py [--sessions 100000] [--redis-url redis://127.0.0.1:6379/15]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_gemini import DEFAULT_REPLY
+from session_store import MemorySessionStore, RedisSessionStore, SessionState, new_context
+
+QUESTIONS = ["I have a headache", "It started this morning", "Can I take paracetamol?", "What about my fever?"]
+
+
+def sample_context(turns):
+    context = new_context()
+    context.age, context.gender, context.has_addressed_initial_concern = 34, "female", True
+    for question in QUESTIONS[:turns]:
+        context.add_exchange(question, DEFAULT_REPLY)
+    return context
+
+
+def rss_bytes():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class DictStore:
+    """The pre-store behaviour: two unbounded module-level dicts"""
+
+    def __init__(self):
+        self.contexts = {}
+        self.counts = {}
+
+    def get_context(self, user_id):
+        return self.contexts.get(user_id)
+
+    def save_context(self, user_id, context):
+        self.contexts[user_id] = context
+
+    def increment_message_count(self, user_id, limit=None):
+        count = self.counts.get(user_id, 0)
+        if limit is not None and count >= limit:
+            return None
+        self.counts[user_id] = count + 1
+        return count + 1
+
+
+def timed(operation, user_ids):
+    samples = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        operation(user_id)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "p50_us": round(statistics.median(samples) * 1e6, 1),
+        "p95_us": round(samples[int(0.95 * (len(samples) - 1))] * 1e6, 1),
+    }
+
+
+def measure(store, sessions, turns, lookups, server_memory=None):
+    context = sample_context(turns)
+    user_ids = [f"user-{n:07d}" for n in range(sessions)]
+
+    gc.collect()
+    before = server_memory() if server_memory else rss_bytes()
+    started = time.perf_counter()
+    if isinstance(store, RedisSessionStore):
+        # Populate in pipelined batches; the per-call API would take minutes over the network
+        data = json.dumps(context.to_dict(), separators=(",", ":"))
+        for offset in range(0, sessions, 1000):
+            pipe = store.redis.pipeline(transaction=False)
+            for user_id in user_ids[offset:offset + 1000]:
+                pipe.set(store._context_key(user_id), data, ex=store.idle_ttl)
+                pipe.set(store._count_key(user_id), 1, ex=store.idle_ttl)
+            pipe.execute()
+    else:
+        for user_id in user_ids:
+            # Fresh copies, as each real session has its own objects
+            store.save_context(user_id, SessionState.from_dict(json.loads(json.dumps(context.to_dict()))))
+            store.increment_message_count(user_id)
+    populate_seconds = time.perf_counter() - started
+    gc.collect()
+    after = server_memory() if server_memory else rss_bytes()
+
+    sample = random.Random(5).sample(user_ids, min(lookups, sessions))
+    return {
+        "populate_seconds": round(populate_seconds, 2),
+        "bytes_per_session": round((after - before) / sessions),
+        "mb_per_100k_sessions": round((after - before) / sessions * 100000 / 2 ** 20, 1),
+        "get_context": timed(store.get_context, sample),
+        "save_context": timed(lambda user_id: store.save_context(user_id, context), sample),
+        "increment_message_count": timed(lambda user_id: store.increment_message_count(user_id, limit=10 ** 9), sample),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--turns", type=int, default=3, help="question/answer exchanges per session")
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--redis-url", default=None, help="Redis server to measure (its database is flushed)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    report = {
+        "dict": measure(DictStore(), args.sessions, args.turns, args.lookups),
+        "memory": measure(MemorySessionStore(max_sessions=args.sessions, max_bytes=2 ** 40),
+                          args.sessions, args.turns, args.lookups),
+    }
+
+    if args.redis_url:
+        import redis
+        client = redis.Redis.from_url(args.redis_url)
+        client.flushdb()
+        report["redis"] = measure(RedisSessionStore(client=client), args.sessions, args.turns, args.lookups,
+                                  server_memory=lambda: client.info("memory")["used_memory"])
+        client.flushdb()
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            fakeredis = None
+        if fakeredis is not None:
+            report["fakeredis (in-process)"] = measure(RedisSessionStore(client=fakeredis.FakeRedis()),
+                                                       args.sessions, args.turns, args.lookups)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.sessions} sessions, {args.turns} exchanges each")
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
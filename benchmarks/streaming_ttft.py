@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-token of /chat versus /chat/stream against the local fake Gemini server.
+
+The fake is tuned so a full reply takes --generation seconds either way: the
+blocking call returns after that long, while the streaming call sends its first
+chunk after --first-token seconds and spreads the rest over the remaining time.
+The app runs on a real threaded HTTP server so SSE chunks are observed as the
+browser would see them.
+
+Run from the repository root:
+    python benchmarks/streaming_ttft.py [--samples 30] [--generation 2.0] [--first-token 0.3]
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.serving import make_server
+
+from benchmarks.fake_gemini import DEFAULT_REPLY, FakeGemini
+
+# The third message answers the gender question, so the held-back concern goes to the model
+CONVERSATION = ["I have a headache", "30", "male"]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def post(port, path, message, cookie):
+    """POST a chat message; returns (seconds to first token, seconds to end, cookie)"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Content-Type": "application/json"}
+    if cookie:
+        headers["Cookie"] = cookie
+    started = time.perf_counter()
+    connection.request("POST", path, body=json.dumps({"message": message}), headers=headers)
+    response = connection.getresponse()
+    cookie = (response.getheader("Set-Cookie") or "").split(";")[0] or cookie
+    first_token = None
+    if response.getheader("Content-Type", "").startswith("text/event-stream"):
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            if first_token is None and line.startswith(b"event: token"):
+                first_token = time.perf_counter() - started
+    else:
+        response.read()
+        first_token = time.perf_counter() - started
+    total = time.perf_counter() - started
+    connection.close()
+    return first_token, total, cookie
+
+
+def measure(port, path, samples):
+    """Run one fresh consultation per sample and time the model-backed reply"""
+    first_tokens, totals = [], []
+    for _ in range(samples):
+        cookie = None
+        for message in CONVERSATION:
+            first_token, total, cookie = post(port, path, message, cookie)
+        first_tokens.append(first_token)
+        totals.append(total)
+    return {
+        "ttft_p50_ms": round(statistics.median(first_tokens) * 1000, 1),
+        "ttft_p95_ms": round(percentile(first_tokens, 0.95) * 1000, 1),
+        "total_p50_ms": round(statistics.median(totals) * 1000, 1),
+        "total_p95_ms": round(percentile(totals, 0.95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=30)
+    parser.add_argument("--generation", type=float, default=2.0, help="seconds for the fake to generate a full reply")
+    parser.add_argument("--first-token", type=float, default=0.3, help="seconds until the fake streams its first chunk")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    chunks = -(-len(DEFAULT_REPLY.split(" ")) // 4)
+    fake = FakeGemini(latency=args.generation, jitter=args.jitter, first_token_latency=args.first_token,
+                      chunk_delay=max(0.0, args.generation - args.first_token) / max(1, chunks - 1), seed=7).start()
+    os.environ.update({
+        "GEMINI_API_KEY": "fake-key-0001",
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": fake.url,
+        "FLASK_ENV": "development",
+        "RATE_LIMIT_ENABLED": "false",
+    })
+    logging.disable(logging.INFO)
+    import app as app_module
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {
+        "/chat": measure(server.server_port, "/chat", args.samples),
+        "/chat/stream": measure(server.server_port, "/chat/stream", args.samples),
+    }
+    server.shutdown()
+    fake.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for path, stats in results.items():
+        print(f"{path:<13} TTFT p50 {stats['ttft_p50_ms']:>7} ms  p95 {stats['ttft_p95_ms']:>7} ms   "
+              f"full reply p50 {stats['total_p50_ms']:>7} ms  p95 {stats['total_p95_ms']:>7} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tail latency of /chat against a local Gemini stub that stalls a share of its calls,
+with and without per-attempt deadlines and hedging.
+
+  no deadline        LLM_ATTEMPT_TIMEOUT at --stall-seconds: a stalled key holds
+                     the user until the stall ends, like the old retry loop
+  attempt deadline   LLM_ATTEMPT_TIMEOUT=--attempt-timeout, then the next key
+  deadline + hedge   also LLM_HEDGE_ENABLED: a second key joins after the p95
+
+Each request is a fresh session whose opening message goes straight to the model
+(the response cache is off). Reported per mode: latency percentiles, replies that
+came back "temporarily unavailable", and LLM calls per request (the hedging cost).
+
+Run from the repository root:
+    python benchmarks/tail_latency.py [--requests 300] [--stall-rate 0.05]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.async_load_test import free_port, wait_until_up
+from benchmarks.fake_gemini import FakeGemini
+from benchmarks.replay import UNAVAILABLE_PREFIX, Client, percentile
+
+OPENING = "I'm 30 and male, I have a headache"
+
+
+def run_mode(settings, args):
+    fake = FakeGemini(latency=args.latency, jitter=args.latency / 2, stall_rate=args.stall_rate,
+                      stall_seconds=args.stall_seconds, seed=11).start()
+    env = {
+        **os.environ,
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": fake.url,
+        "FLASK_ENV": "development",
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+        "RESPONSE_CACHE_ENABLED": "false",
+        **settings,
+    }
+    env.pop("GEMINI_API_KEY", None)
+    for index in range(1, args.keys + 1):
+        env[f"GEMINI_API_KEY_{index}"] = f"fake-key-{index:04d}"
+    port = free_port()
+    process = subprocess.Popen(
+        ["gunicorn", "app:app", "-k", "gthread", "-w", "1", "--threads", str(args.concurrency * 2),
+         "--timeout", str(int(args.stall_seconds * 2)), "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    def one_request(_):
+        status, payload, seconds = Client(base_url, args.stall_seconds * 3).chat(OPENING)
+        unavailable = status != 200 or not payload or str(payload.get("reply", "")).startswith(UNAVAILABLE_PREFIX)
+        return seconds, unavailable
+
+    try:
+        wait_until_up(port, process)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one_request, range(args.requests)))
+        elapsed = time.monotonic() - started
+        calls = sum(1 for entry in fake.requests if entry["path"].startswith("models/"))
+        # Stalled calls the app gave up on are still sleeping in the stub and not yet recorded
+        calls += fake._in_flight
+    finally:
+        process.terminate()
+        process.wait()
+        fake.stop()
+
+    latencies = sorted(seconds for seconds, _ in results)
+    return {
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "unavailable": sum(1 for _, unavailable in results if unavailable),
+        "llm_calls_per_request": round(calls / len(results), 3),
+        "elapsed_s": round(elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.4, help="stub seconds per LLM call (jitter is half of it)")
+    parser.add_argument("--stall-rate", type=float, default=0.05, help="share of stub calls that stall")
+    parser.add_argument("--stall-seconds", type=float, default=15.0, help="how long a stalled call hangs")
+    parser.add_argument("--attempt-timeout", type=float, default=2.0, help="LLM_ATTEMPT_TIMEOUT for the deadline modes")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    deadline = str(args.stall_seconds * 2)
+    modes = {
+        "no deadline": {"LLM_ATTEMPT_TIMEOUT": str(args.stall_seconds * 2), "LLM_REQUEST_DEADLINE": deadline},
+        "attempt deadline": {"LLM_ATTEMPT_TIMEOUT": str(args.attempt_timeout), "LLM_REQUEST_DEADLINE": deadline},
+        "deadline + hedge": {"LLM_ATTEMPT_TIMEOUT": str(args.attempt_timeout), "LLM_REQUEST_DEADLINE": deadline,
+                             "LLM_HEDGE_ENABLED": "true", "LLM_HEDGE_MIN_DELAY": str(args.latency)},
+    }
+    report = {name: run_mode(settings, args) for name, settings in modes.items()}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.requests} requests, {args.concurrency} clients, {args.keys} keys, stub latency {args.latency}s, "
+          f"{args.stall_rate:.0%} of calls stall for {args.stall_seconds:.0f}s")
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+A traffic spike against a local Gemini stub whose keys each allow a few calls in
+flight, with and without the LLM admission gate (LLM_ADMISSION_ENABLED).
+
+Some consultations are opened before the spike. Then every one of them sends a
+follow-up at the same moment as a burst of brand-new sessions, and once the burst
+is over a few more new sessions arrive one at a time to see whether the service
+has recovered. Every reply is sorted into:
+  answered  a model reply
+  shed      turned away by the gate with a 503 and Retry-After
+  failed    "temporarily unavailable": the keys answered 429 and were benched
+
+Run from the repository root:
+    python benchmarks/traffic_spike.py [--new-sessions 90] [--ongoing 12]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.async_load_test import free_port, wait_until_up
+from benchmarks.fake_gemini import FakeGemini
+from benchmarks.replay import UNAVAILABLE_PREFIX, Client, percentile
+
+OPENING = "I'm 30 and male, I have a headache"
+FOLLOW_UP = "what medicine can I take?"
+
+
+def outcome(status, payload):
+    if status == 503 and payload and payload.get("busy"):
+        return "shed"
+    if status == 200 and payload and not str(payload.get("reply", "")).startswith(UNAVAILABLE_PREFIX):
+        return "answered"
+    return "failed"
+
+
+def summarize(results):
+    answered = sorted(seconds for kind, seconds in results if kind == "answered")
+    return {
+        "answered": len(answered),
+        "shed": sum(1 for kind, _ in results if kind == "shed"),
+        "failed": sum(1 for kind, _ in results if kind == "failed"),
+        "answered_p50_ms": percentile(answered, 0.50) if answered else None,
+        "answered_p95_ms": percentile(answered, 0.95) if answered else None,
+    }
+
+
+def run_mode(enabled, args):
+    fake = FakeGemini(latency=args.latency, max_concurrent_per_key=args.per_key, retry_after=args.retry_after, seed=5).start()
+    env = {
+        **os.environ,
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": fake.url,
+        "FLASK_ENV": "development",
+        "LOG_LEVEL": "WARNING",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "RATE_LIMIT_ENABLED": "false",
+        "LLM_ADMISSION_ENABLED": "true" if enabled else "false",
+        "LLM_CONCURRENCY_PER_KEY": str(args.per_key),
+        "LLM_QUEUE_MAX": str(args.queue),
+        "LLM_QUEUE_TIMEOUT": str(args.queue_timeout),
+    }
+    env.pop("GEMINI_API_KEY", None)
+    for index in range(1, args.keys + 1):
+        env[f"GEMINI_API_KEY_{index}"] = f"fake-key-{index:04d}"
+    port = free_port()
+    process = subprocess.Popen(
+        ["gunicorn", "app:app", "-k", "gthread", "-w", "1", "--threads", "256", "--timeout", "120",
+         "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    def send(client, message):
+        status, payload, seconds = client.chat(message)
+        return outcome(status, payload), seconds
+
+    try:
+        wait_until_up(port, process)
+        ongoing = [Client(base_url, 120) for _ in range(args.ongoing)]
+        with ThreadPoolExecutor(max_workers=args.per_key) as pool:
+            opened = [kind for kind, _ in pool.map(lambda client: send(client, OPENING), ongoing)]
+        fake.reset()
+
+        spike = [(client, FOLLOW_UP) for client in ongoing] + [(Client(base_url, 120), OPENING) for _ in range(args.new_sessions)]
+        with ThreadPoolExecutor(max_workers=len(spike)) as pool:
+            results = list(pool.map(lambda entry: send(*entry), spike))
+        throttled = sum(1 for entry in fake.requests if entry["status"] == 429)
+
+        time.sleep(args.recovery_delay)
+        recovery = [send(Client(base_url, 120), OPENING) for _ in range(args.recovery)]
+        with urllib.request.urlopen(f"{base_url}/health", timeout=10) as response:
+            admission = json.loads(response.read())["admission"]
+    finally:
+        process.terminate()
+        process.wait()
+        fake.stop()
+
+    return {
+        "opened_before_spike": opened.count("answered"),
+        "ongoing": summarize(results[:args.ongoing]),
+        "new_sessions": summarize(results[args.ongoing:]),
+        "gemini_429s": throttled,
+        "recovery_answered": f"{sum(1 for kind, _ in recovery if kind == 'answered')}/{args.recovery}",
+        "admission": {key: admission.get(key) for key in ("capacity", "admitted", "rejected_queue_full", "rejected_timeout", "evicted")}
+        if enabled else {"enabled": False},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--new-sessions", type=int, default=90, help="new sessions in the burst")
+    parser.add_argument("--ongoing", type=int, default=12, help="consultations sending a follow-up during the burst")
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--per-key", type=int, default=4, help="calls in flight each stub key allows (and LLM_CONCURRENCY_PER_KEY)")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub seconds per LLM call")
+    parser.add_argument("--retry-after", type=int, default=10, help="Retry-After on the stub's 429s")
+    parser.add_argument("--queue", type=int, default=64, help="LLM_QUEUE_MAX")
+    parser.add_argument("--queue-timeout", type=float, default=10.0, help="LLM_QUEUE_TIMEOUT")
+    parser.add_argument("--recovery", type=int, default=5, help="new sessions sent one by one after the burst")
+    parser.add_argument("--recovery-delay", type=float, default=1.0, help="seconds between the burst and the recovery probes")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    report = {
+        "without admission gate": run_mode(False, args),
+        "admission gate": run_mode(True, args),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.ongoing} ongoing consultations + {args.new_sessions} new sessions at once, {args.keys} keys "
+          f"x {args.per_key} calls in flight, stub latency {args.latency}s")
+    for name, stats in report.items():
+        print(f"{name}:")
+        for field, value in stats.items():
+            print(f"    {field:<22} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+The medication catalogue, kept in data/medicines.jsonl and reloaded when it changes.
+
+The file opens with a {"schema": N} line, then holds one JSON object per entry:
+its category and the fields below, all non-empty strings. It is parsed on first
+use, not at import, and every load is validated in full, so a file with a typo or
+one caught half-written is rejected and the catalogue in use stays. Ship a change
+by writing the new file next to the old one and renaming it into place.
+
+Readers take a Snapshot and use it for the whole request. Everything built from
+the catalogue (retrieval and search indexes, category tables) is cached on the
+snapshot it was built from, so a reload never mixes two versions. Requests stat()
+the file at most every check_interval seconds; when it has changed, one of them
+parses it and rebuilds whatever the old snapshot had built while the others carry
+on with the old one, then the new snapshot is swapped in with one assignment.
+Listeners registered with on_reload refresh state kept outside the snapshot, such
+as cached prompts. The file is about 20 KB, so each gunicorn worker simply loads
+its own copy (or inherits the master's with --preload).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "medicines.jsonl")
+
+SCHEMA_VERSION = 1
+FIELDS = ("category", "condition", "medicine", "form", "age_group", "dosage", "examples", "notes")
+MAX_FIELD_CHARS = 300
+
+
+class CatalogueError(ValueError):
+    """A catalogue file that does not pass validation"""
+
+
+def parse(text, source="catalogue"):
+    """Validate catalogue text and group its entries by category, in file order"""
+    records = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise CatalogueError(f"{source}:{number}: invalid JSON: {e}") from None
+        if not isinstance(record, dict):
+            raise CatalogueError(f"{source}:{number}: expected a JSON object")
+        records.append((number, record))
+
+    if not records or records[0][1] != {"schema": SCHEMA_VERSION}:
+        raise CatalogueError(f'{source}: the first line must be {{"schema": {SCHEMA_VERSION}}}')
+
+    categories = {}
+    seen = set()
+    for number, record in records[1:]:
+        missing = [field for field in FIELDS if field not in record]
+        unknown = sorted(set(record) - set(FIELDS))
+        if missing or unknown:
+            raise CatalogueError(f"{source}:{number}: missing fields {missing}, unknown fields {unknown}")
+        for field in FIELDS:
+            value = record[field]
+            if not isinstance(value, str) or not value.strip() or len(value) > MAX_FIELD_CHARS:
+                raise CatalogueError(f"{source}:{number}: {field} must be a non-empty string of at most {MAX_FIELD_CHARS} characters")
+        identity = (record["category"], record["condition"], record["medicine"])
+        if identity in seen:
+            raise CatalogueError(f"{source}:{number}: duplicate entry {record['medicine']} for {record['condition']}")
+        seen.add(identity)
+        categories.setdefault(record["category"], []).append({field: record[field] for field in FIELDS[1:]})
+
+    if not categories:
+        raise CatalogueError(f"{source}: no entries")
+    return [{"category": name, "entries": entries} for name, entries in categories.items()]
+
+
+class Snapshot:
+    """One loaded version of the catalogue and everything derived from it"""
+
+    __slots__ = ("data", "version", "loaded_at", "_derived", "_lock")
+
+    def __init__(self, data, version):
+        self.data = data
+        self.version = version
+        self.loaded_at = time.time()
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    @property
+    def entry_count(self):
+        return sum(len(category["entries"]) for category in self.data)
+
+    def derived(self, name, build):
+        """build(data), computed once for this snapshot and shared by every caller"""
+        built = self._derived.get(name)
+        if built is None:
+            with self._lock:
+                built = self._derived.get(name)
+                if built is None:
+                    built = (build, build(self.data))
+                    self._derived[name] = built
+        return built[1]
+
+    def warm(self, other):
+        """Build everything other has built, so readers of this snapshot find it ready"""
+        for name, (build, _) in list(other._derived.items()):
+            self.derived(name, build)
+
+
+class Catalogue:
+    """The catalogue file behind a snapshot that is swapped atomically when the file changes"""
+
+    def __init__(self, path=CATALOGUE_PATH, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+
+    def _stat(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _load(self):
+        """Parse the file into a Snapshot; raises CatalogueError or OSError"""
+        with open(self.path, "rb") as handle:
+            raw = handle.read()
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise CatalogueError(f"{os.path.basename(self.path)}: not UTF-8: {e}") from None
+        return Snapshot(parse(text, os.path.basename(self.path)), hashlib.sha256(raw).hexdigest()[:12])
+
+    def on_reload(self, listener):
+        """Call listener(snapshot) after each reload that changed the catalogue"""
+        self._listeners.append(listener)
+
+    def current(self):
+        """Snapshot to use for this request, loading the file on first use and picking up changes to it"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._signature = self._stat()
+                    self._snapshot = self._load()
+                    self._next_check = time.monotonic() + self.check_interval
+                    logger.info(f"Catalogue version {self._snapshot.version} loaded: {self._snapshot.entry_count} entries")
+                return self._snapshot
+        if self.check_interval > 0 and time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            # One request looks at the file; the rest keep the snapshot they have
+            try:
+                self._next_check = time.monotonic() + self.check_interval
+                self._check()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def _check(self):
+        """Reload if the file changed since the last attempt; call with the lock held"""
+        try:
+            signature = self._stat()
+        except OSError as e:
+            signature = None
+            if self._signature is not None:
+                logger.error(f"Catalogue file unavailable, keeping version {self._snapshot.version}: {str(e)}")
+        if signature is not None and signature != self._signature:
+            self._swap()
+        self._signature = signature
+
+    def reload(self):
+        """Load the file now; True when a new version was swapped in"""
+        with self._lock:
+            if self._snapshot is None:
+                self._signature = self._stat()
+                self._snapshot = self._load()
+                return True
+            return self._swap()
+
+    def _swap(self):
+        """Validate the file and swap it in, keeping the current version on failure; call with the lock held"""
+        old = self._snapshot
+        try:
+            fresh = self._load()
+            if fresh.version == old.version:
+                return False
+            fresh.warm(old)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Catalogue reload failed, keeping version {old.version}: {str(e)}")
+            return False
+        self._snapshot = fresh
+        self.reloads += 1
+        self.last_error = None
+        logger.info(f"Catalogue reloaded: version {old.version} -> {fresh.version}, {fresh.entry_count} entries")
+        for listener in self._listeners:
+            try:
+                listener(fresh)
+            except Exception as e:
+                logger.error(f"Catalogue reload listener failed: {str(e)}")
+        return True
+
+    def stats(self):
+        """Loaded version and reload counters for the /health endpoint"""
+        snapshot = self._snapshot
+        stats = {
+            "loaded": snapshot is not None,
+            "path": os.path.basename(self.path),
+            "check_interval": self.check_interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+        if snapshot is not None:
+            stats.update({
+                "version": snapshot.version,
+                "categories": len(snapshot.data),
+                "entries": snapshot.entry_count,
+                "loaded_at": round(snapshot.loaded_at),
+            })
+        return stats
+
+
+_catalogue = Catalogue()
+
+
+def get_catalogue():
+    """The process-wide catalogue"""
+    return _catalogue
+
+
+def configure_catalogue(path=CATALOGUE_PATH, check_interval=2.0):
+    """Point the process-wide catalogue at a file; call before its first use"""
+    global _catalogue
+    _catalogue = Catalogue(path, check_interval)
+    return _catalogue
@@ -0,0 +1,159 @@
+"""
+Rule-based replies to catalogue-only requests, without a model call.
+
+"First aid kit", "travel essentials" and "period pain" are answered from a whole
+category of the catalogue, which the system prompt already asks the model to list
+in full. When a message asks for nothing beyond one of those categories, the
+structured reply (Possible Cause / Recommended Steps / Medications / When to See a
+Doctor) is rendered straight from the data, filtered to the patient's age group.
+Anything open-ended (other symptoms, extra detail, children, ambiguous intent) is
+left to Gemini.
+"""
+
+import threading
+import time
+
+from catalogue import get_catalogue
+from health_detector import detect_health_concerns
+from retrieval import age_group_allows
+from search_index import tokenize
+
+# Category dosages in the catalogue are adult doses; children go to the model for age-appropriate dosing
+MIN_AGE = 12
+ELDERLY_AGE = 65
+
+# Words that can surround a catalogue request without making it open-ended
+FILLER_WORDS = {
+    "a", "an", "the", "i", "im", "me", "my", "we", "our", "us", "you", "your", "it", "is", "am", "are",
+    "to", "for", "of", "in", "on", "with", "and", "or", "what", "which", "should", "could", "would",
+    "can", "do", "does", "need", "want", "like", "get", "buy", "keep", "pack", "bring", "carry", "take",
+    "have", "please", "recommend", "recommendation", "suggest", "suggestion", "list", "tell", "about",
+    "give", "good", "basic", "essential", "complete", "home", "house", "family", "medicine", "medication",
+    "item", "thing", "supply", "product", "option", "kit", "bag", "box", "stuff", "put", "include",
+    "contain", "must", "some", "any", "best", "hi", "hello", "hey", "thank", "thanks", "year", "old",
+    "male", "female", "man", "woman", "be", "there", "that", "this", "all",
+}
+
+CATEGORIES = {
+    "First Aid Kit Recommendations": {
+        "phrases": (("first", "aid"), ("aid", "kit"), ("medicine", "kit"), ("emergency", "kit")),
+        "concepts": {"catalogue"},
+        "words": {"first", "aid", "emergency"},
+        "cause": "Preparing a home first aid kit for minor injuries, cuts, burns, fever and allergic reactions.",
+        "steps": "Keep the kit in a dry, easy to reach place, check expiry dates every six months and restock items after use.",
+        "doctor": "For deep or heavily bleeding wounds, severe burns, breathing difficulty or any serious injury, seek emergency care immediately.",
+    },
+    "Travel Essentials": {
+        "phrases": (("travel",), ("trip",), ("vacation",), ("holiday",)),
+        "concepts": {"catalogue"},
+        "words": {"travel", "travelling", "traveling", "trip", "vacation", "holiday", "journey", "kit"},
+        "cause": "Preparing for travel, where upset stomach, dehydration, motion sickness, minor cuts and sun or insect exposure are the common problems.",
+        "steps": "Pack medicines in your hand luggage, drink safe bottled water, keep hands clean and carry any regular prescriptions with a copy of the prescription.",
+        "doctor": "See a doctor for high fever, bloody or persistent diarrhoea beyond two days, signs of dehydration, or any illness after returning from a tropical area.",
+    },
+    "Women's Health / Menstrual Care": {
+        "phrases": (("period",), ("menstrual",), ("menstruation",)),
+        "concepts": {"womens_health", "pain"},
+        "genders": {"female"},
+        "words": {"period", "menstrual", "menstruation", "pain", "cramp", "care", "relief", "monthly"},
+        "cause": "Menstrual cramps (dysmenorrhea), caused by uterine contractions during your period.",
+        "steps": "Apply a warm compress to the lower abdomen, rest, stay hydrated and try gentle exercise or stretching.",
+        "doctor": "See a doctor if pain is severe or not relieved by medication, bleeding is very heavy (soaking a pad every hour), periods are irregular or last more than 7 days, or you have fever or unusual discharge.",
+    },
+}
+
+
+def _category_table(data):
+    return {category["category"]: category["entries"] for category in data}
+
+
+def _contains(words, phrase):
+    size = len(phrase)
+    return any(tuple(words[i:i + size]) == phrase for i in range(len(words) - size + 1))
+
+
+class CatalogueResponder:
+    """Detects catalogue-only requests and renders their reply from the catalogue"""
+
+    def __init__(self, data=None):
+        # Fixed data, or None to follow the current version of the catalogue file
+        self.entries = _category_table(data) if data is not None else None
+        self._lock = threading.Lock()
+        self.handled = 0
+        self.passed = 0
+        self.render_seconds = 0.0
+        self.model_replies = 0
+        self.model_seconds = 0.0
+
+    def match(self, text, gender=None):
+        """Catalogue category the message asks for and nothing else, or None"""
+        words = tokenize(text)
+        matched = [
+            name for name, rule in CATEGORIES.items()
+            if any(_contains(words, phrase) for phrase in rule["phrases"])
+        ]
+        if len(matched) != 1:
+            return None
+        rule = CATEGORIES[matched[0]]
+        if gender and "genders" in rule and gender not in rule["genders"]:
+            return None
+        # Any other symptom, or a detail the rule does not know about, makes it a real consultation
+        if any(match.concept not in rule["concepts"] for match in detect_health_concerns(text)):
+            return None
+        if any(word not in FILLER_WORDS and word not in rule["words"] and not word.isdigit() for word in words):
+            return None
+        return matched[0]
+
+    def render(self, category, age):
+        """Structured reply for a category, listing only the entries suitable for age"""
+        rule = CATEGORIES[category]
+        entries = self.entries if self.entries is not None else get_catalogue().current().derived("categories", _category_table)
+        items = [
+            f"{entry['medicine']} - {entry['dosage']} ({entry['examples']}) - {entry['notes']}."
+            for entry in entries.get(category, []) if age_group_allows(entry["age_group"], age)
+        ]
+        doctor = rule["doctor"]
+        if age >= ELDERLY_AGE:
+            doctor += " At your age, start with the lower doses and check with your doctor if you take other regular medicines or have kidney or liver problems."
+        return "\n".join([
+            f"Possible Cause: {rule['cause']}",
+            f"Recommended Steps: {rule['steps']}",
+            f"Medications: {' '.join(items)}",
+            f"When to See a Doctor: {doctor}",
+        ])
+
+    def reply(self, text, age, gender=None):
+        """Rendered reply when text is a catalogue-only request from an adult, else None"""
+        started = time.perf_counter()
+        category = self.match(text, gender) if age and age >= MIN_AGE else None
+        reply = self.render(category, age) if category else None
+        with self._lock:
+            if reply is None:
+                self.passed += 1
+            else:
+                self.handled += 1
+                self.render_seconds += time.perf_counter() - started
+        return reply
+
+    def observe_model_latency(self, seconds):
+        """Record how long a model-backed reply took, to estimate the latency saved"""
+        with self._lock:
+            self.model_replies += 1
+            self.model_seconds += seconds
+
+    def stats(self):
+        """Share of model-bound turns answered from the catalogue and the latency that saved"""
+        with self._lock:
+            turns = self.handled + self.passed
+            model_avg = self.model_seconds / self.model_replies if self.model_replies else None
+            render_avg = self.render_seconds / self.handled if self.handled else None
+            return {
+                "enabled": True,
+                "handled": self.handled,
+                "passed_to_model": self.passed,
+                "share_handled": round(self.handled / turns, 3) if turns else None,
+                "avg_render_ms": round(render_avg * 1000, 3) if render_avg is not None else None,
+                "avg_model_reply_ms": round(model_avg * 1000, 1) if model_avg is not None else None,
+                "latency_saved_seconds": round(self.handled * (model_avg - (render_avg or 0)), 1)
+                if model_avg is not None else None,
+            }
@@ -6,6 +6,74 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'fallback-secret-key-change-in-production')
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+    GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+    GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT') or None
+    GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT') or None
+    KEY_SELECTION_STRATEGY = os.getenv('KEY_SELECTION_STRATEGY', 'least_loaded')
+    KEY_BREAKER_THRESHOLD = int(os.getenv('KEY_BREAKER_THRESHOLD', 5))
+    KEY_BREAKER_COOLDOWN = float(os.getenv('KEY_BREAKER_COOLDOWN', 30))
+
+    LLM_ATTEMPT_TIMEOUT = float(os.getenv('LLM_ATTEMPT_TIMEOUT', 20))
+    LLM_REQUEST_DEADLINE = float(os.getenv('LLM_REQUEST_DEADLINE', 40))
+    LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', 3))
+    LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+    LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', 1.0))
+    LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.25))
+    LLM_BACKOFF_CAP = float(os.getenv('LLM_BACKOFF_CAP', 2.0))
+
+    CONTEXT_CACHE_ENABLED = os.getenv('CONTEXT_CACHE_ENABLED', 'false').lower() == 'true'
+    CONTEXT_CACHE_MODEL = os.getenv('CONTEXT_CACHE_MODEL', 'gemini-1.5-flash-001')
+    CONTEXT_CACHE_TTL = int(os.getenv('CONTEXT_CACHE_TTL', 3600))
+
+    SESSION_STORE = os.getenv('SESSION_STORE', 'memory').lower()
+    SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', 86400))
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 10000))
+    SESSION_MAX_BYTES = int(os.getenv('SESSION_MAX_BYTES', 64 * 1024 * 1024))
+    SESSION_TOKEN_BUDGET = int(os.getenv('SESSION_TOKEN_BUDGET', 25000))
+
+    TOKEN_PRICE_PROMPT_PER_MILLION = float(os.getenv('TOKEN_PRICE_PROMPT_PER_MILLION', 0.075))
+    TOKEN_PRICE_COMPLETION_PER_MILLION = float(os.getenv('TOKEN_PRICE_COMPLETION_PER_MILLION', 0.30))
+    TOKEN_USAGE_RETENTION_HOURS = int(os.getenv('TOKEN_USAGE_RETENTION_HOURS', 48))
+
+    HISTORY_MAX_TURNS = int(os.getenv('HISTORY_MAX_TURNS', 4))
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 1200))
+    HISTORY_SUMMARY_BUDGET = int(os.getenv('HISTORY_SUMMARY_BUDGET', 300))
+
+    CATALOGUE_PATH = os.getenv('CATALOGUE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'medicines.jsonl')
+    CATALOGUE_RELOAD_INTERVAL = float(os.getenv('CATALOGUE_RELOAD_INTERVAL', 2))
+    CATALOGUE_FAST_PATH_ENABLED = os.getenv('CATALOGUE_FAST_PATH_ENABLED', 'true').lower() == 'true'
+    STRUCTURED_REPLIES_ENABLED = os.getenv('STRUCTURED_REPLIES_ENABLED', 'true').lower() == 'true'
+
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0))
+    METRICS_MODE = os.getenv('METRICS_MODE', 'basic').lower()
+
+    SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+    SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_WAIT_TIMEOUT', 120))
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 300))
+
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_PER_SESSION = os.getenv('RATE_LIMIT_PER_SESSION', '10/minute;60/hour')
+    RATE_LIMIT_PER_IP = os.getenv('RATE_LIMIT_PER_IP', '30/minute;300/hour')
+    RATE_LIMIT_STORAGE_URI = os.getenv('RATE_LIMIT_STORAGE_URI') or (SESSION_REDIS_URL if SESSION_STORE == 'redis' else 'memory://')
+    RATE_LIMIT_STRATEGY = os.getenv('RATE_LIMIT_STRATEGY', 'moving-window')
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+
+    LLM_ADMISSION_ENABLED = os.getenv('LLM_ADMISSION_ENABLED', 'true').lower() == 'true'
+    LLM_CONCURRENCY_PER_KEY = int(os.getenv('LLM_CONCURRENCY_PER_KEY', 8))
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 0))
+    LLM_QUEUE_MAX = int(os.getenv('LLM_QUEUE_MAX', 64))
+    LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 10))
+    LLM_ADMISSION_REDIS_URL = os.getenv('LLM_ADMISSION_REDIS_URL') or (SESSION_REDIS_URL if SESSION_STORE == 'redis' else None)
+
+    BATCH_API_TOKEN = os.getenv('BATCH_API_TOKEN') or None
+    BATCH_CONCURRENCY_PER_KEY = int(os.getenv('BATCH_CONCURRENCY_PER_KEY', 2))
+    BATCH_MAX_RECORDS = int(os.getenv('BATCH_MAX_RECORDS', 1000))
+    BATCH_RECORD_TIMEOUT = float(os.getenv('BATCH_RECORD_TIMEOUT', 300))
+    BATCH_JOURNAL_TTL = int(os.getenv('BATCH_JOURNAL_TTL', 86400))
     FLASK_ENV = os.getenv('FLASK_ENV', 'production')
     PORT = int(os.getenv('PORT', 5000))
     
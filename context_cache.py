@@ -0,0 +1,200 @@
+"""
+Server-side caching of the static system prompt and medication database with the
+Gemini cached-content API, one cache per API key.
+
+Chat requests reference the cache instead of re-sending the prompt as input
+tokens. Caches are refreshed before they expire, and any failure (caching not
+supported for the model, content below the minimum cacheable size, quota)
+benches caching for that key for a while so callers fall back to inline prompts.
+
+A chat call that fails only drops its key's cache when the error concerns the
+cache (it was deleted, expired or isn't ours); rate limits, timeouts and hedged
+attempts that lost keep it. A cache that is dropped or replaced is deleted on
+the server in the background, so it stops being billed before its TTL runs out,
+and on_retire lets the model pool forget the handle built on it.
+"""
+
+import logging
+import threading
+import time
+
+import google.ai.generativelanguage as glm
+from google.api_core import exceptions as api_exceptions
+from google.generativeai import caching
+from google.protobuf import duration_pb2, field_mask_pb2
+
+from key_pool import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+
+def is_cache_error(error):
+    """True when a failed call's error says its cached content is gone or unusable"""
+    if is_rate_limit_error(error):
+        return False
+    if isinstance(error, (api_exceptions.NotFound, api_exceptions.PermissionDenied)):
+        return True
+    text = str(error).lower()
+    return "cachedcontent" in text or "cached content" in text or "cached_content" in text
+
+
+class _CacheEntry:
+    def __init__(self, content, expires_at):
+        self.content = content
+        self.expires_at = expires_at
+        self.lock = threading.Lock()
+
+
+class ContextCacheManager:
+    """Creates, refreshes and hands out one cached-content resource per API key"""
+
+    def __init__(self, model_name, system_instruction, contents, ttl_seconds=3600,
+                 refresh_margin_seconds=300, retry_after_seconds=600,
+                 client_options=None, transport=None, on_retire=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.contents = contents
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds / 2)
+        self.retry_after_seconds = retry_after_seconds
+        self.client_options = dict(client_options or {})
+        self.transport = transport
+        # Called with (api_key, content) for every cache dropped or replaced
+        self.on_retire = on_retire
+        self._entries = {}
+        self._clients = {}
+        self._disabled_until = {}
+        self._lock = threading.Lock()
+        self.stats_counters = {"hits": 0, "creates": 0, "refreshes": 0, "failures": 0, "fallbacks": 0, "deletes": 0}
+
+    def _client(self, api_key):
+        client = self._clients.get(api_key)
+        if client is None:
+            client = glm.CacheServiceClient(
+                client_options={**self.client_options, "api_key": api_key},
+                transport=self.transport,
+            )
+            self._clients[api_key] = client
+        return client
+
+    def _create(self, api_key):
+        request = caching.CachedContent._prepare_create_request(
+            model=self.model_name,
+            display_name="curaai-system-prompt",
+            system_instruction=self.system_instruction,
+            contents=self.contents,
+            ttl=self.ttl_seconds,
+        )
+        response = self._client(api_key).create_cached_content(request)
+        self.stats_counters["creates"] += 1
+        logger.info(f"Created cached context {response.name} for API key ending {api_key[-4:]}")
+        return _CacheEntry(caching.CachedContent._from_obj(response), time.monotonic() + self.ttl_seconds)
+
+    def _refresh(self, api_key, entry):
+        """Extend the TTL of an existing cache, recreating it if the update fails"""
+        try:
+            self._client(api_key).update_cached_content(
+                cached_content=glm.CachedContent(
+                    name=entry.content.name, ttl=duration_pb2.Duration(seconds=int(self.ttl_seconds))
+                ),
+                update_mask=field_mask_pb2.FieldMask(paths=["ttl"]),
+            )
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            self.stats_counters["refreshes"] += 1
+            return entry
+        except Exception as e:
+            logger.warning(f"Refreshing cached context {entry.content.name} failed, recreating: {str(e)}")
+            fresh = self._create(api_key)
+            self._retire(api_key, entry.content)
+            return fresh
+
+    def get(self, api_key):
+        """Return the CachedContent for api_key, or None when callers should send the prompt inline"""
+        now = time.monotonic()
+        if self._disabled_until.get(api_key, 0) > now:
+            self.stats_counters["fallbacks"] += 1
+            return None
+
+        entry = self._entries.get(api_key)
+        if entry is not None and now < entry.expires_at - self.refresh_margin_seconds:
+            self.stats_counters["hits"] += 1
+            return entry.content
+
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is None:
+                entry = _CacheEntry(None, 0)
+                self._entries[api_key] = entry
+
+        # Only one request refreshes; the others keep using the cache while it is still valid
+        if not entry.lock.acquire(blocking=entry.content is None):
+            if now < entry.expires_at:
+                self.stats_counters["hits"] += 1
+                return entry.content
+            self.stats_counters["fallbacks"] += 1
+            return None
+        try:
+            if self._disabled_until.get(api_key, 0) > time.monotonic():
+                self.stats_counters["fallbacks"] += 1
+                return None
+            if entry.content is not None and time.monotonic() < entry.expires_at - self.refresh_margin_seconds:
+                self.stats_counters["hits"] += 1
+                return entry.content
+            fresh = self._refresh(api_key, entry) if entry.content is not None else self._create(api_key)
+            entry.content, entry.expires_at = fresh.content, fresh.expires_at
+            return entry.content
+        except Exception as e:
+            self.stats_counters["failures"] += 1
+            self.stats_counters["fallbacks"] += 1
+            self._disabled_until[api_key] = time.monotonic() + self.retry_after_seconds
+            logger.warning(f"Context caching unavailable for API key ending {api_key[-4:]}, using inline prompt: {str(e)}")
+            if entry.content is not None:
+                self._retire(api_key, entry.content)
+            entry.content, entry.expires_at = None, 0
+            return None
+        finally:
+            entry.lock.release()
+
+    def replace_contents(self, contents):
+        """Cache new contents from now on; caches of the old ones are deleted"""
+        with self._lock:
+            self.contents = contents
+            old, self._entries = self._entries, {}
+        for api_key, entry in old.items():
+            if entry.content is not None:
+                self._retire(api_key, entry.content)
+
+    def invalidate(self, api_key, error=None):
+        """Forget the cache for a key, or with error, only when the error concerns the cache; True if it was dropped"""
+        if error is not None and not is_cache_error(error):
+            return False
+        with self._lock:
+            entry = self._entries.pop(api_key, None)
+        if entry is not None and entry.content is not None:
+            self._retire(api_key, entry.content)
+        return True
+
+    def _retire(self, api_key, content):
+        """Forget the handles built on a dropped cache and delete it on the server in the background"""
+        if self.on_retire is not None:
+            self.on_retire(api_key, content)
+        threading.Thread(target=self._delete, args=(api_key, content.name), name="context-cache-delete", daemon=True).start()
+
+    def _delete(self, api_key, name):
+        try:
+            self._client(api_key).delete_cached_content(name=name)
+            self.stats_counters["deletes"] += 1
+            logger.info(f"Deleted cached context {name}")
+        except api_exceptions.NotFound:
+            pass
+        except Exception as e:
+            logger.warning(f"Deleting cached context {name} failed, it will expire on its own: {str(e)}")
+
+    def stats(self):
+        """Counters for the /health endpoint"""
+        now = time.monotonic()
+        return {
+            **self.stats_counters,
+            "model": self.model_name,
+            "active_caches": sum(1 for entry in self._entries.values() if entry.content is not None and entry.expires_at > now),
+        }
@@ -0,0 +1,166 @@
+"""
+Single-pass extraction of patient facts from a chat message: age, gender, body
+temperature with its unit, and how long the symptoms have lasted.
+
+One compiled pattern scans the message once; each alternative is a named group,
+and the leftmost match wins, so "for 3 days" is a duration, "3 years old" an age
+and "101 F" a temperature. Gender words are matched on word boundaries, so
+"female" is never read as "male". Bare numbers ("30", replying to "may I know
+your age?") only count as an age in short replies or next to the gender, so
+"I took 2 tablets" does not make the patient two years old.
+"""
+
+import re
+from collections import namedtuple
+
+PatientFacts = namedtuple("PatientFacts", ["age", "gender", "temperature", "duration"])
+Temperature = namedtuple("Temperature", ["value", "unit", "celsius"])
+Duration = namedtuple("Duration", ["value", "unit"])
+
+# Messages up to this many words can answer with a bare age ("30") or gender letter ("m")
+SHORT_MESSAGE_WORDS = 5
+
+MAX_AGE = 120
+FEVER_RANGE = {"C": (34.0, 44.0), "F": (93.0, 111.0)}
+
+_COUNT_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+                "seven": 7, "eight": 8, "nine": 9, "ten": 10, "few": 3, "couple of": 2, "couple": 2}
+_UNITS = {
+    "hour": "hour", "hours": "hour", "hr": "hour", "hrs": "hour",
+    "day": "day", "days": "day",
+    "week": "week", "weeks": "week", "wk": "week", "wks": "week",
+    "month": "month", "months": "month", "mo": "month", "mos": "month",
+    "year": "year", "years": "year", "yr": "year", "yrs": "year",
+}
+_YEARS_PER_UNIT = {"year": 1, "month": 1 / 12, "week": 1 / 52, "day": 1 / 365}
+
+# A bare number is an age when it sits next to the gender ("female 33", "30, male"), or ends or
+# leads a short reply ("30", "30 and female"); never when another word follows ("2 tablets")
+_NEXT_WORD = re.compile(r"[\s,.;:!-]*([a-z]*)", re.IGNORECASE)
+_PREV_WORD = re.compile(r"([a-z]*)[\s,.;:!-]*$", re.IGNORECASE)
+_GENDER_WORDS = {"male", "female", "man", "woman", "boy", "girl", "m", "f"}
+_AFTER_BARE_AGE = _GENDER_WORDS | {"", "and"}
+
+_NUM = r"\d{1,3}(?:\.\d+)?"
+_COUNT = r"\d{1,3}(?:\.\d+)?|an?|one|two|three|four|five|six|seven|eight|nine|ten|few|couple(?:\s+of)?"
+_UNIT = r"hours?|hrs?|days?|weeks?|wks?|months?|mos?|years?|yrs?"
+_AGE_UNIT = r"years?|yrs?|months?|mos?|weeks?|wks?"
+
+PATTERN = re.compile(
+    "|".join([
+        # "for 3 days", "since 2 weeks", "for the past few days"
+        rf"\b(?:for|since|past|last|over)\s+(?:the\s+)?(?:past\s+|last\s+)?(?P<dur>{_COUNT})\s*(?P<dur_unit>{_UNIT})\b",
+        # "2 days ago"
+        rf"\b(?P<ago>{_COUNT})\s*(?P<ago_unit>{_UNIT})\s+ago\b",
+        # "I'm 34", "age: 34", "she is 6 months"
+        rf"\b(?:i'?m|i\s+am|aged?|age\s+is|my\s+age\s+is|he'?s|she'?s|he\s+is|she\s+is)\s*[:=]?\s*(?P<pre>{_NUM})\b"
+        rf"(?:\s*(?P<pre_unit>{_AGE_UNIT})\b)?",
+        # "34 years old", "6 months", "2-year-old"
+        rf"\b(?P<aged>{_NUM})\s*-?\s*(?P<aged_unit>{_AGE_UNIT})\b(?P<old>\s*-?\s*(?:old|of\s+age))?",
+        # "34yo", "34 y/o"
+        r"\b(?P<yo>\d{1,3})\s*(?:yo|y/o|y\.o\.?)(?=\W|$)",
+        # "fever of 101 F", "38.5°C", "102 degrees", and "34M" / "34 f"
+        rf"(?:\b(?P<temp_ctx>temperature|temp|fever)(?:\s*(?:of|is|was|at|around|about|reading|reached|[:=]))*\s*)?"
+        rf"\b(?P<temp>{_NUM})\s*(?P<temp_deg>°|º|degrees?|deg\b)?\s*(?P<temp_unit>celsius|centigrade|fahrenheit|[cfm])?(?![a-z0-9])",
+        r"\b(?P<female>female|woman|girl|lady)\b",
+        r"\b(?P<male>male|man|boy|guy|gentleman)\b",
+        r"(?<!['’])\b(?P<letter>[mf])\b",
+    ]),
+    re.IGNORECASE,
+)
+
+
+def _count(text):
+    text = " ".join(text.lower().split())
+    return float(text) if text[0].isdigit() else _COUNT_WORDS.get(text, 1)
+
+
+def _number(value):
+    return int(value) if value == int(value) else value
+
+
+def _age(value, unit=None):
+    """Age in years (a fraction for babies), or None when implausible"""
+    years = value * _YEARS_PER_UNIT[_UNITS[unit.lower()]] if unit else value
+    if not 0 < years < MAX_AGE:
+        return None
+    return _number(round(years, 2))
+
+
+def _temperature(value, unit=None):
+    """Temperature reading, inferring the scale from the value when no unit was given"""
+    if unit:
+        unit = "F" if unit.lower().startswith("f") else "C"
+    else:
+        unit = "F" if value > FEVER_RANGE["C"][1] else "C"
+    low, high = FEVER_RANGE[unit]
+    if not low <= value <= high:
+        return None
+    celsius = value if unit == "C" else (value - 32) * 5 / 9
+    return Temperature(_number(value), unit, round(celsius, 1))
+
+
+def extract_patient_facts(text):
+    """Age, gender, temperature and duration mentioned in text, each None when absent"""
+    short = len(text.split()) <= SHORT_MESSAGE_WORDS
+    age = gender = temperature = duration = None
+    bare_age = None
+
+    for match in PATTERN.finditer(text):
+        group = match.lastgroup
+        found = match.groupdict()
+        if found["dur"] is not None or found["ago"] is not None:
+            if duration is None:
+                count, unit = (found["dur"], found["dur_unit"]) if found["dur"] is not None else (found["ago"], found["ago_unit"])
+                duration = Duration(_number(_count(count)), _UNITS[unit.lower()])
+        elif found["pre"] is not None:
+            age = age or _age(float(found["pre"]), found["pre_unit"])
+        elif found["aged"] is not None:
+            # "6 months" on its own answers the age question; in a longer sentence it needs "old"
+            if found["old"] or short:
+                age = age or _age(float(found["aged"]), found["aged_unit"])
+        elif found["yo"] is not None:
+            age = age or _age(float(found["yo"]))
+        elif found["temp"] is not None:
+            value, unit = float(found["temp"]), (found["temp_unit"] or "").lower()
+            marked = bool(found["temp_ctx"] or found["temp_deg"])
+            # "101 F" is a fever reading rather than a 101 year old woman; "34M" and "30 f" are age and gender
+            if unit in ("m", "f") and not marked and not (unit == "f" and _temperature(value, unit)):
+                age = age or _age(value)
+                gender = gender or ("male" if unit == "m" else "female")
+            elif marked or unit:
+                temperature = temperature or _temperature(value, unit if unit != "m" else None)
+            elif bare_age is None:
+                after = _NEXT_WORD.match(text, match.end()).group(1).lower()
+                before = _PREV_WORD.search(text, 0, match.start()).group(1).lower()
+                if after in _GENDER_WORDS or before in _GENDER_WORDS or (short and after in _AFTER_BARE_AGE):
+                    bare_age = value
+        elif group == "female":
+            gender = gender or "female"
+        elif group == "male":
+            gender = gender or "male"
+        elif group == "letter" and short:
+            gender = gender or ("male" if match.group("letter").lower() == "m" else "female")
+
+    if age is None and bare_age is not None:
+        age = _age(bare_age)
+    return PatientFacts(age, gender, temperature, duration)
+
+
+def describe_age(age):
+    """'34 year old', or '6 month old' for babies under two"""
+    if age < 2 and age != int(age):
+        return f"{round(age * 12)} month old"
+    return f"{int(age)} year old"
+
+
+def describe_temperature(temperature):
+    """'101°F (38.3°C)' or '38.5°C'"""
+    if temperature.unit == "C":
+        return f"{temperature.value}°C"
+    return f"{temperature.value}°F ({temperature.celsius}°C)"
+
+
+def describe_duration(duration):
+    """'3 days', '1 week'"""
+    return f"{duration.value} {duration.unit}{'' if duration.value == 1 else 's'}"
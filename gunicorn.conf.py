@@ -0,0 +1,25 @@
+"""
+Gunicorn settings, read from the working directory by `gunicorn app:app`.
+
+Importing the app no longer loads the Gemini SDK, so a worker answers /health as
+soon as it boots; each worker then loads the SDK and builds its model handles on
+a background thread. With GUNICORN_PRELOAD=true the app is imported once in the
+master and the SDK is loaded there before forking, so every worker shares both
+copy-on-write and only builds its own API clients.
+"""
+
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+
+def when_ready(server):
+    if preload_app:
+        # Only imports: gRPC channels must not be created before the fork
+        from model_pool import load_sdk
+        load_sdk()
+
+
+def post_worker_init(worker):
+    from app import start_llm_warmup
+    start_llm_warmup()
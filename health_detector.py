@@ -0,0 +1,108 @@
+"""
+Single-pass detection of health concerns in a user message.
+
+The keyword vocabulary lives in data/health_keywords.json (concept -> terms) and is
+compiled once into a phrase table keyed by first word. Messages are split into
+words a single time and matched on whole words, so "ear" no longer matches "year"
+and "gas" no longer matches "Vegas". Plural, -ed and -ing endings are folded back
+to the vocabulary form ("vomited", "coughed", "sneezed"), and "-ache" compounds
+such as "toothache" or "stomachache" count as an ache.
+"""
+
+import json
+import os
+import re
+from collections import namedtuple
+
+KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "health_keywords.json")
+
+HealthMatch = namedtuple("HealthMatch", ["concept", "term", "start", "end"])
+
+
+class HealthConcernDetector:
+    """Word-boundary matcher over a concept -> terms vocabulary, built once"""
+
+    word_pattern = re.compile(r"[a-z0-9']+")
+
+    def __init__(self, vocabulary):
+        # first word -> [(remaining words, term, concept)], longest phrase first
+        self.phrases = {}
+        for concept, terms in vocabulary.items():
+            for term in terms:
+                words = tuple(term.lower().split())
+                self.phrases.setdefault(words[0], []).append((words[1:], " ".join(words), concept))
+        for candidates in self.phrases.values():
+            candidates.sort(key=lambda candidate: len(candidate[0]), reverse=True)
+
+    @classmethod
+    def from_file(cls, path=KEYWORDS_PATH):
+        """Build a detector from a JSON vocabulary file"""
+        with open(path, encoding="utf-8") as handle:
+            return cls(json.load(handle))
+
+    @staticmethod
+    def _forms(word):
+        """word followed by the base forms it may inflect: plural, past tense and -ing"""
+        yield word
+        if word.endswith("s"):
+            yield word[:-1]
+            if word.endswith("es"):
+                yield word[:-2]
+        for suffix in ("ed", "ing"):
+            if word.endswith(suffix) and len(word) > len(suffix) + 2:
+                base = word[:-len(suffix)]
+                yield base
+                yield base + "e"
+                # "sneezed" -> "sneezing" when the vocabulary lists only the -ing form
+                if suffix == "ed":
+                    yield base + "ing"
+
+    def _stem(self, word):
+        """The vocabulary form of word, folding inflections and "-ache" compounds"""
+        for form in self._forms(word):
+            if form in self.phrases:
+                return form
+        for form in self._forms(word):
+            if form.endswith("ache") and "ache" in self.phrases:
+                return "ache"
+        return None
+
+    def detect(self, text):
+        """Return every matched concept with its term and character span in one pass"""
+        words = [(match.group(0), match.start(), match.end()) for match in self.word_pattern.finditer(text.lower())]
+        matches = []
+        i = 0
+        while i < len(words):
+            first = self._stem(words[i][0])
+            matched = False
+            if first is not None:
+                for rest, term, concept in self.phrases[first]:
+                    end = i + 1 + len(rest)
+                    if end > len(words):
+                        continue
+                    following = [words[j][0] for j in range(i + 1, end)]
+                    if all(expected in self._forms(word) for word, expected in zip(following, rest)):
+                        matches.append(HealthMatch(concept, term, words[i][1], words[end - 1][2]))
+                        i = end
+                        matched = True
+                        break
+            if not matched:
+                i += 1
+        return matches
+
+    def is_health_concern(self, text):
+        """True when the text mentions any health concept"""
+        return bool(self.detect(text))
+
+
+detector = HealthConcernDetector.from_file()
+
+
+def detect_health_concerns(text):
+    """Detect health concepts in text using the module-level detector"""
+    return detector.detect(text)
+
+
+def is_health_concern(text):
+    """True when the text mentions any health concept"""
+    return detector.is_health_concern(text)
@@ -0,0 +1,310 @@
+"""
+Deadline-bounded, optionally hedged LLM calls across the API key pool.
+
+Each attempt leases a key and gets its own timeout, and the call as a whole gets
+a deadline, so a hung call on one key no longer holds the user for the client's
+full timeout before the next key is tried. A failed attempt is followed by one
+on another key after an exponential backoff with full jitter; once every key has
+been tried, keys are reused up to max_attempts. With hedging on, an attempt
+still running after the pool's recent p95 latency is joined by a second attempt
+on another key and whichever answers first wins. Keys that keep failing are
+skipped by the pool's circuit breaker.
+
+The caller supplies attempt(lease, timeout), one model call on the leased key.
+call() runs attempts on a shared thread pool, call_async() as asyncio tasks. The
+winner's lease is released as a success, unless hold=True: then the caller
+releases it (a streamed reply keeps its key until the stream ends). Either way
+discard(lease, value) is called for any other attempt that succeeds too late to
+be used, so its stream can be closed and its tokens charged to its key; with
+call_async it may be a coroutine function. An attempt that is cancelled or fails
+never produces a value, so what it cost is not known here.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class _Attempt:
+    __slots__ = ("lease", "started", "expires", "hedge", "timed_out")
+
+    def __init__(self, lease, started, timeout, hedge):
+        self.lease = lease
+        self.started = started
+        self.expires = started + timeout
+        self.hedge = hedge
+        self.timed_out = False
+
+
+class _Call:
+    """State shared between one call's waiting thread and its attempts"""
+
+    def __init__(self, started):
+        self.cond = threading.Condition()
+        self.pending = []
+        self.winner = None
+        self.closed = False
+        self.failures = 0
+        self.next_start = started
+        self.hedged = False
+
+
+class HedgedCaller:
+    """Runs LLM attempts on pool keys with per-attempt timeouts, a deadline, backoff and hedging"""
+
+    def __init__(self, key_pool, attempt_timeout=20.0, deadline=40.0, max_attempts=3, hedge=False,
+                 hedge_min_delay=1.0, backoff_base=0.25, backoff_cap=2.0, max_workers=64):
+        self.key_pool = key_pool
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-attempt")
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            "calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+            "attempt_timeouts": 0, "deadline_exceeded": 0, "exhausted": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats_counters[name] += amount
+
+    def hedge_delay(self):
+        """Seconds an attempt runs before it is hedged: the pool's recent p95, and at least hedge_min_delay"""
+        p95_ms = self.key_pool.latency.stats()["p95_ms"]
+        if p95_ms is None:
+            return self.hedge_min_delay
+        return max(self.hedge_min_delay, p95_ms / 1000)
+
+    def backoff(self, failures):
+        """Full-jitter exponential backoff before the attempt that follows the given number of failures"""
+        return self._random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (failures - 1)))
+
+    def _lease(self, tried, running):
+        """A key for the next attempt: untried keys first, then any key not already in use by this call"""
+        lease = self.key_pool.acquire(exclude=tried)
+        if lease is None:
+            lease = self.key_pool.acquire(exclude={attempt.lease.index for attempt in running})
+        return lease
+
+    def _next_action(self, state, now, deadline, launched, hedge_delay):
+        """(launch, hedge, seconds to wait) for a call's waiting loop; call with state.cond held"""
+        running = [attempt for attempt in state.pending if not attempt.timed_out]
+        for attempt in running:
+            if now >= attempt.expires:
+                # Counted as a failure now; its thread is given up on and releases the key when the client times out
+                attempt.timed_out = True
+                state.failures += 1
+                state.next_start = now + self.backoff(state.failures)
+                self._count("attempt_timeouts")
+        running = [attempt for attempt in running if not attempt.timed_out]
+
+        wake = [deadline] + [attempt.expires for attempt in running]
+        if launched < self.max_attempts:
+            if not running:
+                if now >= state.next_start:
+                    return True, False, 0
+                wake.append(state.next_start)
+            elif self.hedge and not state.hedged and len(running) == 1:
+                hedge_at = running[0].started + hedge_delay
+                if now >= hedge_at:
+                    return True, True, 0
+                wake.append(hedge_at)
+        return False, False, max(0.0, min(wake) - now)
+
+    def call(self, attempt, hold=False, discard=None):
+        """(lease, value) of the first attempt to succeed, or (None, None) when all failed or the deadline passed"""
+        started = time.monotonic()
+        deadline = started + self.deadline
+        hedge_delay = self.hedge_delay() if self.hedge else None
+        state = _Call(started)
+        tried = set()
+        launched = 0
+        self._count("calls")
+
+        def settle(record, future):
+            error = future.exception()
+            value = None if error is not None else future.result()
+            with state.cond:
+                if record in state.pending:
+                    state.pending.remove(record)
+                won = error is None and state.winner is None and not state.closed
+                if won:
+                    state.winner = (record, value)
+                elif error is not None and not record.timed_out:
+                    state.failures += 1
+                    state.next_start = time.monotonic() + self.backoff(state.failures)
+                state.cond.notify_all()
+            if error is not None:
+                record.lease.fail(error)
+                logger.error(f"Gemini API Error with key {record.lease.index + 1}: {str(error) or type(error).__name__}")
+            elif not won:
+                record.lease.succeed()
+                if discard is not None:
+                    discard(record.lease, value)
+            elif not hold:
+                record.lease.succeed()
+
+        while True:
+            with state.cond:
+                now = time.monotonic()
+                if state.winner is not None or now >= deadline:
+                    break
+                launch, hedge, wait = self._next_action(state, now, deadline, launched, hedge_delay)
+                running = [record for record in state.pending if not record.timed_out]
+                if not launch:
+                    if not running and launched >= self.max_attempts:
+                        break
+                    state.cond.wait(wait)
+                    continue
+
+            lease = self._lease(tried, running)
+            if lease is None:
+                if not running:
+                    break
+                # Every key is busy with this call or benched; wait for the attempts already running
+                with state.cond:
+                    state.hedged = True
+                continue
+            tried.add(lease.index)
+            now = time.monotonic()
+            record = _Attempt(lease, now, min(self.attempt_timeout, deadline - now), hedge)
+            with state.cond:
+                state.pending.append(record)
+                state.hedged = state.hedged or hedge
+            launched += 1
+            self._count("attempts")
+            if hedge:
+                self._count("hedges")
+                logger.info(f"Hedging the LLM call on key {lease.index + 1} after {now - started:.2f}s")
+            elif launched > 1:
+                self._count("retries")
+            # A copy of the request's context per attempt, so their spans land in its trace
+            future = self._executor.submit(contextvars.copy_context().run, attempt, lease, record.expires - now)
+            future.add_done_callback(lambda future, record=record: settle(record, future))
+
+        with state.cond:
+            state.closed = True
+            winner = state.winner
+        if winner is None:
+            self._count("deadline_exceeded" if time.monotonic() >= deadline else "exhausted")
+            logger.error(f"LLM call failed after {launched} attempt(s) in {time.monotonic() - started:.2f}s")
+            return None, None
+        record, value = winner
+        if record.hedge:
+            self._count("hedge_wins")
+        return record.lease, value
+
+    async def call_async(self, attempt, hold=False, discard=None):
+        """call() for coroutine attempts; losing attempts are cancelled and give their keys back"""
+        started = time.monotonic()
+        deadline = started + self.deadline
+        hedge_delay = self.hedge_delay() if self.hedge else None
+        state = _Call(started)
+        tasks = {}
+        tried = set()
+        launched = 0
+        self._count("calls")
+
+        async def run(record, timeout):
+            try:
+                return await asyncio.wait_for(attempt(record.lease, timeout), timeout)
+            except asyncio.CancelledError:
+                record.lease.abandon()
+                raise
+
+        winner = None
+        try:
+            while winner is None:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                launch, hedge, wait = self._next_action(state, now, deadline, launched, hedge_delay)
+                running = [record for record in state.pending if not record.timed_out]
+                if launch:
+                    lease = self._lease(tried, running)
+                    if lease is None:
+                        if not running:
+                            break
+                        state.hedged = True
+                        continue
+                    tried.add(lease.index)
+                    record = _Attempt(lease, now, min(self.attempt_timeout, deadline - now), hedge)
+                    state.pending.append(record)
+                    state.hedged = state.hedged or hedge
+                    launched += 1
+                    self._count("attempts")
+                    if hedge:
+                        self._count("hedges")
+                        logger.info(f"Hedging the LLM call on key {lease.index + 1} after {now - started:.2f}s")
+                    elif launched > 1:
+                        self._count("retries")
+                    tasks[asyncio.create_task(run(record, record.expires - now))] = record
+                    continue
+                if not tasks:
+                    if launched >= self.max_attempts:
+                        break
+                    await asyncio.sleep(wait)
+                    continue
+
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    record = tasks.pop(task)
+                    state.pending.remove(record)
+                    error = task.exception()
+                    if error is None and winner is None:
+                        winner = (record, task.result())
+                        if not hold:
+                            record.lease.succeed()
+                    elif error is None:
+                        record.lease.succeed()
+                        if discard is not None:
+                            discarded = discard(record.lease, task.result())
+                            if inspect.isawaitable(discarded):
+                                await discarded
+                    else:
+                        if isinstance(error, asyncio.TimeoutError) and not record.timed_out:
+                            self._count("attempt_timeouts")
+                        record.lease.fail(error)
+                        logger.error(f"Gemini API Error with key {record.lease.index + 1}: {str(error) or type(error).__name__}")
+                        if not record.timed_out:
+                            state.failures += 1
+                            state.next_start = time.monotonic() + self.backoff(state.failures)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        if winner is None:
+            self._count("deadline_exceeded" if time.monotonic() >= deadline else "exhausted")
+            logger.error(f"LLM call failed after {launched} attempt(s) in {time.monotonic() - started:.2f}s")
+            return None, None
+        record, value = winner
+        if record.hedge:
+            self._count("hedge_wins")
+        return record.lease, value
+
+    def stats(self):
+        """Settings and counters for the /health endpoint"""
+        with self._lock:
+            return {
+                "attempt_timeout": self.attempt_timeout,
+                "deadline": self.deadline,
+                "max_attempts": self.max_attempts,
+                "hedge": self.hedge,
+                "hedge_delay": round(self.hedge_delay(), 3) if self.hedge else None,
+                **self.stats_counters,
+            }
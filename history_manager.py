@@ -0,0 +1,123 @@
+"""
+Bounded conversation history for the chat model.
+
+Every turn used to append two entries to the context's history and replay all of
+them through start_chat, so prompt size grew with the length of the consultation.
+HistoryManager keeps the last few exchanges verbatim and folds older ones, one at
+a time, into a running summary stored on the context. The verbatim turns are kept
+as plain texts and only become Gemini role/parts entries in chat_history. The patient's age, gender
+and presenting concern are pinned ahead of that summary, so they survive however
+long the conversation runs. Summaries are extractive (the patient's words and the
+opening of the reply), which costs no extra model call.
+"""
+
+import re
+
+from session_store import ROLE_MODEL, ROLE_USER
+
+# Gemini averages roughly four characters of English per token
+CHARS_PER_TOKEN = 4
+
+SUMMARY_ACK = "Understood, I will keep this consultation background in mind."
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting, without a count_tokens round trip"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def clip(text, max_chars):
+    """Collapse whitespace and cut text to max_chars at a word boundary"""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+def first_sentence(text):
+    """Opening sentence of a reply, with markdown emphasis stripped"""
+    text = re.sub(r"[*_#`]+", "", text).strip()
+    match = re.match(r"(.+?[.!?])(\s|$)", text, re.S)
+    return match.group(1) if match else text
+
+
+class HistoryManager:
+    """Keeps the history replayed to the model within a fixed token budget"""
+
+    def __init__(self, max_turns=4, token_budget=1200, summary_budget=300, line_chars=240):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.line_chars = line_chars
+
+    @staticmethod
+    def _tokens(texts):
+        return sum(estimate_tokens(text) for text in texts)
+
+    def summarize_exchange(self, user_text, reply):
+        """One summary line for an exchange that is leaving the verbatim window"""
+        user_part = clip(user_text, self.line_chars // 2)
+        return clip(f"Patient: {user_part} Advised: {first_sentence(reply)}", self.line_chars)
+
+    def record(self, context, user_text, reply):
+        """Append an exchange, then compact the history back under its limits"""
+        if not context.presenting_concern:
+            context.presenting_concern = clip(user_text, self.line_chars)
+        context.add_exchange(user_text, reply)
+        self.compact(context)
+
+    def compact(self, context):
+        """Fold the oldest exchanges into the summary until the verbatim window fits"""
+        history = context.history
+        summary = list(context.summary)
+        folded = 0
+        while len(history) > 2 and (len(history) > 2 * self.max_turns or self._tokens(history) > self.token_budget):
+            summary.append(self.summarize_exchange(history[0], history[1]))
+            history = history[2:]
+            folded += 1
+
+        # The summary is bounded too: its oldest lines are dropped, only the count remains
+        while len(summary) > 1 and sum(estimate_tokens(line) for line in summary) > self.summary_budget:
+            summary.pop(0)
+        if folded:
+            context.history = history
+            context.summarized_turns += folded
+        context.summary = tuple(summary)
+
+    def background(self, context):
+        """Pinned patient facts plus the summary of earlier exchanges, or None at the start"""
+        summary = context.summary
+        concern = context.presenting_concern
+        if not summary and not context.summarized_turns:
+            return None
+
+        lines = ["Consultation background (keep in mind, do not repeat back):"]
+        if context.age or context.gender:
+            lines.append(f"Patient: {context.age or 'unknown age'}, {context.gender or 'gender unknown'}.")
+        if concern:
+            lines.append(f"Presenting concern: {concern}")
+        omitted = context.summarized_turns - len(summary)
+        lines.append(f"Earlier exchanges ({context.summarized_turns} in total"
+                     + (f", oldest {omitted} omitted" if omitted > 0 else "") + "):")
+        lines.extend(f"- {line}" for line in summary)
+        return "\n".join(lines)
+
+    def chat_history(self, context):
+        """History for model.start_chat: the background as an opening exchange, then the verbatim turns"""
+        background = self.background(context)
+        if background is None:
+            return context.gemini_history()
+        return [
+            {"role": ROLE_USER, "parts": [background]},
+            {"role": ROLE_MODEL, "parts": [SUMMARY_ACK]},
+        ] + context.gemini_history()
+
+    def stats(self, context):
+        """Sizes of one context's history, for debugging"""
+        background = self.background(context)
+        texts = context.history + ((background, SUMMARY_ACK) if background is not None else ())
+        return {
+            "verbatim_turns": len(context.history) // 2,
+            "summarized_turns": context.summarized_turns,
+            "history_tokens": self._tokens(texts),
+        }
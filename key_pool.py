@@ -0,0 +1,243 @@
+"""
+Thread-safe pool of Gemini API keys.
+
+Each request leases a key for one attempt instead of relying on the process-global
+genai.configure() switch, so a failure in one request can no longer change the key
+under another request that is already in flight. Keys are picked least-loaded (or
+round-robin), and a key that returns 429 is benched for its Retry-After period.
+
+Keys that keep failing for other reasons (timeouts, 5xx) trip a circuit breaker:
+after breaker_threshold consecutive failures the key is skipped for
+breaker_cooldown seconds, then a single trial attempt decides whether it closes
+again or stays open for another cooldown.
+"""
+
+import logging
+import re
+import threading
+import time
+
+import metrics
+from metrics import RollingWindow
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COOLDOWN_SECONDS = 60
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN_SECONDS = 30
+
+
+def is_rate_limit_error(error):
+    """True for quota / rate-limit errors (HTTP 429, gRPC RESOURCE_EXHAUSTED)"""
+    # Imported here so loading the pool doesn't pull in the SDK; it is loaded by the time calls fail
+    from google.api_core import exceptions as api_exceptions
+    if isinstance(error, (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted)):
+        return True
+    # Word boundaries, so a port number such as 34291 in a connection error is not a 429
+    return re.search(r"\b429\b", str(error)) is not None or "quota" in str(error).lower()
+
+
+def retry_after_seconds(error, default=DEFAULT_COOLDOWN_SECONDS):
+    """Read the server's Retry-After hint from a rate-limit error"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and (delay.seconds or delay.nanos):
+            return delay.seconds + delay.nanos / 1e9
+    match = re.search(r"retry in ([\d.]+)s", str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return default
+
+
+class KeyState:
+    """Load and health of a single API key"""
+
+    def __init__(self, index, api_key):
+        self.index = index
+        self.api_key = api_key
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.last_error = None
+        self.latency = RollingWindow()
+        # Circuit breaker: "closed", "open" until open_until, then "half_open" for one trial attempt
+        self.circuit = "closed"
+        self.open_until = 0.0
+        self.consecutive_failures = 0
+        self.breaker_trips = 0
+
+    def available(self, now):
+        if self.cooldown_until > now:
+            return False
+        if self.circuit == "open":
+            return self.open_until <= now
+        # Half open: only the one trial attempt until it reports back
+        return self.circuit == "closed" or self.in_flight == 0
+
+    def stats(self, now):
+        return {
+            "index": self.index,
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "cooldown_remaining": round(max(0.0, self.cooldown_until - now), 1),
+            "circuit": self.circuit,
+            "consecutive_failures": self.consecutive_failures,
+            "breaker_trips": self.breaker_trips,
+            "last_error": self.last_error,
+            "recent": self.latency.stats(),
+        }
+
+
+class KeyLease:
+    """One request's claim on a key for a single LLM attempt"""
+
+    def __init__(self, pool, state):
+        self.pool = pool
+        self.state = state
+        self.released = False
+        self.started = time.monotonic()
+
+    @property
+    def api_key(self):
+        return self.state.api_key
+
+    @property
+    def index(self):
+        return self.state.index
+
+    def succeed(self):
+        self.pool._release(self, error=None)
+
+    def fail(self, error):
+        self.pool._release(self, error=error)
+
+    def abandon(self):
+        """Give the key back without an outcome, e.g. when a hedged attempt lost and was cancelled"""
+        self.pool._release(self, error=None, abandoned=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.released:
+            self.pool._release(self, error=exc)
+        return False
+
+
+class KeyPool:
+    """Hands out API key leases, spreading load and benching rate-limited keys"""
+
+    STRATEGIES = ("least_loaded", "round_robin")
+
+    def __init__(self, api_keys, strategy="least_loaded", default_cooldown=DEFAULT_COOLDOWN_SECONDS,
+                 breaker_threshold=DEFAULT_BREAKER_THRESHOLD, breaker_cooldown=DEFAULT_BREAKER_COOLDOWN_SECONDS):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown key selection strategy: {strategy}")
+        self.keys = [KeyState(index, key) for index, key in enumerate(api_keys)]
+        self.strategy = strategy
+        self.default_cooldown = default_cooldown
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        # Successful attempts on any key; hedging waits for their p95
+        self.latency = RollingWindow()
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self, exclude=()):
+        """Lease the best available key not in exclude, or None if every key is benched or excluded"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                self.keys[(self._cursor + offset) % len(self.keys)]
+                for offset in range(len(self.keys))
+            ]
+            candidates = [state for state in candidates if state.index not in exclude and state.available(now)]
+            if not candidates:
+                return None
+            if self.strategy == "least_loaded":
+                state = min(candidates, key=lambda candidate: candidate.in_flight)
+            else:
+                state = candidates[0]
+            self._cursor = (state.index + 1) % len(self.keys)
+            if state.circuit == "open":
+                state.circuit = "half_open"
+                logger.info(f"API key {state.index + 1} circuit half open, sending a trial attempt")
+            state.in_flight += 1
+            return KeyLease(self, state)
+
+    def _release(self, lease, error=None, abandoned=False):
+        if lease.released:
+            return
+        lease.released = True
+        state = lease.state
+        if abandoned:
+            with self._lock:
+                state.in_flight -= 1
+                if state.circuit == "half_open":
+                    # The trial never finished; let the next request try again
+                    state.circuit = "open"
+            return
+        elapsed = time.monotonic() - lease.started
+        state.latency.add(elapsed, ok=error is None)
+        metrics.observe_llm_attempt(state.index, elapsed, ok=error is None)
+        if error is None:
+            self.latency.add(elapsed, ok=True)
+        with self._lock:
+            state.in_flight -= 1
+            if error is None:
+                state.successes += 1
+                state.consecutive_failures = 0
+                if state.circuit != "closed":
+                    logger.info(f"API key {state.index + 1} circuit closed")
+                state.circuit = "closed"
+                return
+            state.failures += 1
+            state.last_error = type(error).__name__
+            if is_rate_limit_error(error):
+                cooldown = retry_after_seconds(error, self.default_cooldown)
+                state.rate_limited += 1
+                state.cooldown_until = max(state.cooldown_until, time.monotonic() + cooldown)
+                logger.warning(f"API key {state.index + 1} rate limited, benched for {cooldown:.0f}s")
+                return
+            state.consecutive_failures += 1
+            if state.circuit == "half_open" or state.consecutive_failures >= self.breaker_threshold:
+                state.circuit = "open"
+                state.open_until = time.monotonic() + self.breaker_cooldown
+                state.breaker_trips += 1
+                logger.warning(f"API key {state.index + 1} circuit open after {state.consecutive_failures} "
+                               f"consecutive failures, skipped for {self.breaker_cooldown:.0f}s")
+
+    def next_available_in(self):
+        """Seconds until the first benched key becomes usable again"""
+        if not self.keys:
+            return 0.0
+        now = time.monotonic()
+        return max(0.0, min(max(state.cooldown_until, state.open_until if state.circuit == "open" else 0.0)
+                            for state in self.keys) - now)
+
+    def stats(self):
+        """Per-key load and health for the /health endpoint"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "available": sum(1 for state in self.keys if state.available(now)),
+                "breaker_threshold": self.breaker_threshold,
+                "breaker_cooldown": self.breaker_cooldown,
+                "keys": [state.stats(now) for state in self.keys],
+            }
@@ -0,0 +1,308 @@
+"""
+Stage timings, latency histograms and per-key rolling percentiles for the chat
+pipeline, exported in the Prometheus text format on /metrics.
+
+METRICS_MODE picks the cost:
+  off     nothing is recorded
+  basic   histograms and counters only; a stage span costs about a microsecond
+  trace   basic, plus every request's spans logged as one line when it finishes
+
+Histograms are fixed-bucket and cumulative like Prometheus's own, kept in-process
+without the client library. Spans are attached to the current request through a
+context variable, so the same code records traces under threads and asyncio.
+"""
+
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "basic", "trace")
+
+# Seconds; from in-process stages (microseconds) up to slow LLM calls
+DEFAULT_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# Tokens per model reply; an opening turn is a couple of thousand, long histories several times that
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000)
+
+_mode = "basic"
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def configure(mode):
+    global _mode
+    if mode not in MODES:
+        raise ValueError(f"Unknown metrics mode: {mode}")
+    _mode = mode
+
+
+def enabled():
+    return _mode != "off"
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, one series per label combination"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter, one series per label combination"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Current value, one series per label combination"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            series = dict(self._series)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class RollingWindow:
+    """Latencies and outcomes of the most recent calls, for percentiles and error rates"""
+
+    def __init__(self, max_samples=1000, max_age_seconds=300):
+        self.max_age_seconds = max_age_seconds
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def add(self, seconds, ok):
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds, ok))
+
+    def stats(self):
+        """p50/p95/p99 in milliseconds and the error rate over the window"""
+        cutoff = time.monotonic() - self.max_age_seconds
+        with self._lock:
+            samples = [(seconds, ok) for at, seconds, ok in self._samples if at >= cutoff]
+        if not samples:
+            return {"samples": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "error_rate": None}
+        latencies = sorted(seconds for seconds, _ in samples)
+
+        def percentile(fraction):
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 1)
+
+        return {
+            "samples": len(samples),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "error_rate": round(sum(1 for _, ok in samples if not ok) / len(samples), 3),
+        }
+
+
+REQUEST_SECONDS = Histogram(
+    "curaai_http_request_seconds", "Time to produce a response, by route and status code", ("route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "curaai_chat_stage_seconds", "Time spent in each stage of the chat pipeline", ("stage",)
+)
+LLM_ATTEMPT_SECONDS = Histogram(
+    "curaai_llm_attempt_seconds", "Duration of each LLM attempt, by API key index and outcome", ("key", "outcome")
+)
+CHAT_REPLIES = Counter(
+    "curaai_chat_replies_total", "Chat replies by where they came from", ("source",)
+)
+LLM_SLOTS_IN_USE = Gauge(
+    "curaai_llm_slots_in_use", "Model replies holding an admission slot in this process"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "curaai_llm_admission_queue_depth", "Chat turns waiting for an admission slot, by priority", ("priority",)
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "curaai_llm_admission_wait_seconds", "Time chat turns waited for an admission slot, by priority and outcome", ("priority", "outcome")
+)
+REPLY_TOKENS = Histogram(
+    "curaai_llm_reply_tokens", "Tokens billed per model reply, by where it was asked for and kind", ("source", "kind"),
+    buckets=TOKEN_BUCKETS
+)
+REGISTRY = [
+    REQUEST_SECONDS, STAGE_SECONDS, LLM_ATTEMPT_SECONDS, CHAT_REPLIES,
+    LLM_SLOTS_IN_USE, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, REPLY_TOKENS,
+]
+
+
+def register(metric):
+    """Export another object with a render() returning Prometheus lines on /metrics"""
+    REGISTRY.append(metric)
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.name)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((self.name, elapsed))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def stage(name):
+    """Context manager timing one pipeline stage"""
+    return _Span(name) if _mode != "off" else _NO_SPAN
+
+
+def observe_llm_attempt(key_index, seconds, ok):
+    """Record one LLM attempt on the key's histogram and in the current trace"""
+    if _mode == "off":
+        return
+    LLM_ATTEMPT_SECONDS.observe(seconds, str(key_index + 1), "success" if ok else "error")
+    spans = _trace.get()
+    if spans is not None:
+        spans.append((f"llm_attempt[key {key_index + 1}{'' if ok else ', failed'}]", seconds))
+
+
+def count_reply(source):
+    if _mode != "off":
+        CHAT_REPLIES.inc(source)
+
+
+def observe_admission(priority, outcome, seconds):
+    if _mode != "off":
+        ADMISSION_WAIT_SECONDS.observe(seconds, priority, outcome)
+
+
+def set_admission_depth(in_use, queued):
+    """Slots held and waiters per priority, after every change to either"""
+    if _mode != "off":
+        LLM_SLOTS_IN_USE.set(in_use)
+        for priority, depth in queued.items():
+            ADMISSION_QUEUE_DEPTH.set(depth, priority)
+
+
+def observe_reply_tokens(source, prompt_tokens, completion_tokens):
+    if _mode != "off":
+        REPLY_TOKENS.observe(prompt_tokens, source, "prompt")
+        REPLY_TOKENS.observe(completion_tokens, source, "completion")
+
+
+def observe_request(route, status, seconds):
+    if _mode != "off":
+        REQUEST_SECONDS.observe(seconds, route, str(status))
+
+
+def begin_trace():
+    """Start collecting the current request's spans (trace mode only); returns a token for end_trace"""
+    if _mode != "trace":
+        return None
+    return _trace.set([])
+
+
+def end_trace(token, label):
+    """Log the spans collected since begin_trace as one line"""
+    if token is None:
+        return
+    spans = _trace.get()
+    _trace.reset(token)
+    if spans:
+        breakdown = " ".join(f"{name}={seconds * 1000:.2f}ms" for name, seconds in spans)
+        logger.info(f"Trace {label}: {breakdown}")
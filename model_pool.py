@@ -0,0 +1,246 @@
+"""
+Pool of reusable GenerativeModel handles keyed by (API key, model name,
+system-instruction hash), shared by all requests and threads of a worker.
+
+The Gemini SDK is imported on first use rather than with this module: it takes
+most of a second, and a worker should answer /health before it is loaded.
+"""
+
+import hashlib
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def load_sdk():
+    """Import the Gemini SDK now; returns the seconds it took (about 0 once loaded)"""
+    started = time.perf_counter()
+    import google.ai.generativelanguage  # noqa: F401
+    import google.generativeai  # noqa: F401
+    return time.perf_counter() - started
+
+
+def has_system_context(model):
+    """True when the model carries the system prompt itself (instruction or cached content)"""
+    return getattr(model, "_system_instruction", None) is not None or model.cached_content is not None
+
+
+def token_usage(response):
+    """(prompt tokens, completion tokens) Gemini reported for a response, or None when it sent no usage"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None or not getattr(usage, "total_token_count", 0):
+        return None
+    return usage.prompt_token_count, usage.candidates_token_count
+
+
+def _stream_iterators(chunks, response):
+    # Our iterator over the reply, then the SDK's iterator over the HTTP/gRPC stream under it
+    return chunks, getattr(response, "_iterator", None)
+
+
+def close_stream(chunks, response):
+    """Stop a streamed reply that won't be read to the end, releasing its connection now rather than at GC"""
+    for iterator in _stream_iterators(chunks, response):
+        close = getattr(iterator, "close", None) or getattr(iterator, "cancel", None)
+        if close is None:
+            continue
+        try:
+            close()
+        except Exception as e:
+            logger.debug(f"Closing a discarded stream failed: {str(e)}")
+
+
+async def aclose_stream(chunks, response):
+    """close_stream for a reply from the asyncio client"""
+    for iterator in _stream_iterators(chunks, response):
+        aclose = getattr(iterator, "aclose", None)
+        try:
+            if aclose is not None:
+                await aclose()
+            elif getattr(iterator, "cancel", None) is not None:
+                iterator.cancel()
+        except Exception as e:
+            logger.debug(f"Closing a discarded stream failed: {str(e)}")
+
+
+def stream_rest_responses(client):
+    """Make a REST-transport client yield streamGenerateContent chunks as they arrive
+
+    The generated REST transport issues the request without stream=True, so requests
+    downloads the whole reply before the first chunk is parsed.
+    """
+    session = getattr(client._transport, "_session", None)
+    if session is None:
+        return client
+    request = session.request
+
+    def streaming_request(method, url, *args, **kwargs):
+        if ":streamGenerateContent" in url:
+            kwargs.setdefault("stream", True)
+        return request(method, url, *args, **kwargs)
+
+    session.request = streaming_request
+    return client
+
+
+def instruction_hash(system_instruction):
+    """Stable short hash of a system instruction"""
+    return hashlib.sha256((system_instruction or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ModelPool:
+    """Builds each model handle once and hands the same instance to every request"""
+
+    def __init__(self, client_options=None, transport=None):
+        self.client_options = dict(client_options or {})
+        self.transport = transport
+        self._models = {}
+        self._clients = {}
+        self._async_clients = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.construction_seconds = 0.0
+        self._warmup = None
+        self.warmup_seconds = None
+
+    def client_for_key(self, api_key):
+        """Generative service client bound to one API key, created once per key"""
+        client = self._clients.get(api_key)
+        if client is None:
+            import google.ai.generativelanguage as glm
+            client = glm.GenerativeServiceClient(
+                client_options={**self.client_options, "api_key": api_key},
+                transport=self.transport,
+            )
+            if self.transport == "rest":
+                stream_rest_responses(client)
+            self._clients[api_key] = client
+        return client
+
+    def async_client_for_key(self, api_key):
+        """Asyncio generative client bound to one API key; create it on the serving event loop"""
+        client = self._async_clients.get(api_key)
+        if client is None:
+            import google.ai.generativelanguage as glm
+            # The async client only speaks gRPC in this SDK version
+            client = glm.GenerativeServiceAsyncClient(
+                client_options={**self.client_options, "api_key": api_key},
+                transport="grpc_asyncio",
+            )
+            self._async_clients[api_key] = client
+        return client
+
+    def bind_async(self, model, api_key):
+        """Route a pooled model's *_async calls through api_key's asyncio client"""
+        if model._async_client is None:
+            model._async_client = self.async_client_for_key(api_key)
+        return model
+
+    def _build(self, api_key, model_name, system_instruction):
+        import google.generativeai as genai
+        try:
+            model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        except TypeError:
+            model = genai.GenerativeModel(model_name)
+        # Bind the handle to its own key instead of the process-global genai.configure()
+        model._client = self.client_for_key(api_key)
+        return model
+
+    def get(self, api_key, model_name, system_instruction=None):
+        """Return the cached model handle for this key, model and instruction"""
+        key = (api_key, model_name, instruction_hash(system_instruction))
+        model = self._models.get(key)
+        if model is not None:
+            # Lock-free fast path; the counter may undercount slightly under contention
+            self.hits += 1
+            return model
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+            start = time.perf_counter()
+            model = self._build(api_key, model_name, system_instruction)
+            self.construction_seconds += time.perf_counter() - start
+            self.misses += 1
+            self._models[key] = model
+            return model
+
+    def get_cached(self, api_key, cached_content):
+        """Return the model handle that references a cached-content resource"""
+        key = (api_key, cached_content.model, f"cached:{cached_content.name}")
+        model = self._models.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                import google.generativeai as genai
+                start = time.perf_counter()
+                model = genai.GenerativeModel.from_cached_content(cached_content)
+                model._client = self.client_for_key(api_key)
+                self.construction_seconds += time.perf_counter() - start
+                self.misses += 1
+                self._models[key] = model
+            else:
+                self.hits += 1
+            return model
+
+    def forget_cached(self, api_key, cached_content):
+        """Drop the handle built on a cached-content resource that was deleted or replaced"""
+        with self._lock:
+            self._models.pop((api_key, cached_content.model, f"cached:{cached_content.name}"), None)
+
+    def warm(self, api_keys, model_name, system_instruction=None):
+        """Import the SDK and build every key's handle, so the first chat finds them ready"""
+        started = time.perf_counter()
+        load_sdk()
+        for api_key in api_keys:
+            self.get(api_key, model_name, system_instruction)
+        self.warmup_seconds = time.perf_counter() - started
+        logger.info(f"Gemini SDK and {len(api_keys)} model handle(s) ready in {self.warmup_seconds * 1000:.0f}ms")
+
+    def warm_in_background(self, api_keys, model_name, system_instruction=None):
+        """warm() on a daemon thread, at most once per process; requests meanwhile build what they need"""
+        with self._lock:
+            if self._warmup is not None:
+                return
+            self._warmup = threading.Thread(
+                target=self._warm_logged, args=(api_keys, model_name, system_instruction),
+                name="model-pool-warmup", daemon=True,
+            )
+        self._warmup.start()
+
+    def _warm_logged(self, *args):
+        try:
+            self.warm(*args)
+        except Exception as e:
+            logger.warning(f"Model warm-up failed, requests will build their own handles: {str(e)}")
+
+    def clear(self):
+        """Drop all cached handles, e.g. after the system prompt changes"""
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        """Hit rate and construction time saved, for the /health endpoint"""
+        lookups = self.hits + self.misses
+        average = self.construction_seconds / self.misses if self.misses else 0.0
+        return {
+            "models_cached": len(self._models),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_construction_ms": round(average * 1000, 3),
+            "construction_ms_saved": round(self.hits * average * 1000, 1),
+            "sdk_loaded": "google.generativeai" in sys.modules,
+            "warm": self.warmup_seconds is not None,
+            "warmup_ms": round(self.warmup_seconds * 1000, 1) if self.warmup_seconds is not None else None,
+        }
@@ -0,0 +1,117 @@
+"""
+Per-session and per-IP quotas on the chat routes, enforced with Flask-Limiter.
+
+The limits are checked in a before_request hook, ahead of JSON parsing, the session
+store and any LLM work, so a client over its quota costs one storage round trip.
+Counts live in a shared store: memory:// keeps them in the process, a Redis URL
+shares them between every worker and node. The default moving-window strategy
+records a timestamp per request (in Redis, tested and recorded by one Lua script, so
+concurrent workers can't overshoot a quota), and Retry-After is the time until the
+oldest request in the window ages out, rounded up, rather than the end of a fixed
+window.
+
+The session quota follows the session cookie; the IP quota stops a client from
+starting a fresh session for every message. Requests without a session yet draw on
+their address's session quota.
+"""
+
+import logging
+import math
+import threading
+import time
+from functools import partial
+
+from flask import jsonify, session
+from flask_limiter import Limiter, RateLimitExceeded
+from flask_limiter.util import get_remote_address
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED_REPLY = "⚠️ You're sending messages faster than I can answer them. Please wait {seconds} second(s) and try again."
+
+
+def session_key():
+    """Quota key of the current session, or of the client address before it has one"""
+    user_id = session.get("user_id")
+    return f"session:{user_id}" if user_id else f"session:ip:{get_remote_address()}"
+
+
+def address_key():
+    """Quota key of the client address"""
+    return f"ip:{get_remote_address()}"
+
+
+class ChatRateLimits:
+    """Decorator applying the per-session and per-IP chat quotas to a Flask view"""
+
+    def __init__(self, app, per_session="10/minute;60/hour", per_ip="30/minute;300/hour",
+                 storage_uri="memory://", strategy="moving-window", enabled=True):
+        self.per_session = per_session
+        self.per_ip = per_ip
+        self.storage_uri = storage_uri
+        self.strategy = strategy
+        self.enabled = enabled
+        # Retry-After is set by _breached; Flask-Limiter's own headers round it down
+        self.limiter = Limiter(
+            address_key,
+            app=app,
+            storage_uri=storage_uri,
+            strategy=strategy,
+            key_prefix="curaai",
+            headers_enabled=False,
+            swallow_errors=True,
+            in_memory_fallback_enabled=True,
+            enabled=enabled,
+        )
+        # Both chat routes draw on the same quotas; each quota reports its own breaches
+        self._session_limit = self.limiter.shared_limit(
+            per_session, scope="chat-session", key_func=session_key, on_breach=partial(self._breached, "session")
+        )
+        self._address_limit = self.limiter.shared_limit(
+            per_ip, scope="chat-ip", key_func=address_key, on_breach=partial(self._breached, "ip")
+        )
+        self._lock = threading.Lock()
+        self.rejected = {"session": 0, "ip": 0}
+
+    def __call__(self, view):
+        return self._address_limit(self._session_limit(view))
+
+    def _breached(self, quota, request_limit):
+        """JSON reply for a request over its quota, with Retry-After in whole seconds"""
+        seconds = max(1, math.ceil(request_limit.reset_at - time.time()))
+        with self._lock:
+            self.rejected[quota] += 1
+        logger.info(f"Chat {quota} quota {request_limit.limit} exceeded, retry after {seconds}s")
+        response = jsonify({
+            "reply": RATE_LIMITED_REPLY.format(seconds=seconds),
+            "rate_limited": True,
+            "retry_after": seconds,
+        })
+        response.status_code = 429
+        response.headers["Retry-After"] = str(seconds)
+        return response
+
+    def check(self):
+        """Rejection response for the current request context when it is over a quota, else None"""
+        if not self.enabled:
+            return None
+        try:
+            self.limiter.check()
+        except RateLimitExceeded as error:
+            return error.get_response()
+        return None
+
+    def stats(self):
+        """Settings and rejection counts for the /health endpoint"""
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            rejected = dict(self.rejected)
+        return {
+            "enabled": True,
+            "storage": self.storage_uri.split("://", 1)[0],
+            "strategy": self.strategy,
+            "per_session": self.per_session,
+            "per_ip": self.per_ip,
+            "rejected": rejected,
+        }
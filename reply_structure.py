@@ -0,0 +1,201 @@
+"""
+Structured replies: the model's text split into its four sections, with the
+medicines it recommends checked against the catalogue.
+
+The system prompt asks for "Possible Cause:", "Recommended Steps:", "Medications:"
+and "When to See a Doctor:". parse_reply finds those headings in one regex pass,
+whatever markdown, numbering or case the model wraps them in, so the browser gets
+the fields as JSON instead of splitting the text apart itself. A reply with none
+of them (a greeting, a question back) has no structure and is shown as text.
+
+Medicines named in the Medications section are looked up in alias tables built
+once per catalogue snapshot: every medicine name, its ingredients ("Cetirizine /
+Loratadine Tablet" gives cetirizine and loratadine), the name without its form
+("Paracetamol Tablets" gives paracetamol) and the brands in its examples. Each
+item's words are matched longest-first against those tables, so a reply costs a
+few dict lookups per word however large the catalogue grows. A medicine found is
+checked against its entry's age group for the patient; an item that gives a dose
+but matches nothing in the catalogue is reported as unverified.
+"""
+
+import re
+
+from catalogue import get_catalogue
+from retrieval import age_group_allows
+
+SECTIONS = (
+    ("possible_cause", "Possible Cause"),
+    ("recommended_steps", "Recommended Steps"),
+    ("medications", "Medications"),
+    ("see_a_doctor", "When to See a Doctor"),
+)
+
+_FIELDS = {label.lower(): field for field, label in SECTIONS}
+_FIELDS.update({"medication": "medications", "medicine": "medications", "medicines": "medications"})
+
+# A heading at the start of a line, e.g. "Medications:", "**Possible Cause:**", "2. Recommended Steps -"
+_HEADING = re.compile(
+    r"^[ \t>#*_-]*(?:\d+[.)][ \t]*)?[*_]*(possible cause|recommended steps|medications?|medicines?|when to see a doctor)"
+    r"[*_]*[ \t]*[:\-–][*_]*[ \t]*",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Items of the Medications section: lines, semicolons, and commas outside brackets
+_ITEM_SPLIT = re.compile(r"\n|;|,(?![^(]*\))")
+_WORD = re.compile(r"[a-z0-9]+")
+_DOSE = re.compile(r"\d\s*(?:mg|mcg|g|ml|%|iu|units?|tablets?|tabs?|caps?|capsules?|drops?|puffs?|sachets?)\b", re.IGNORECASE)
+_NAME_END = re.compile(r"\s*(?:\d|\(|-\s|–|:)")
+
+# Words that say what form a medicine comes in, dropped to get its bare name
+FORM_WORDS = {
+    "tablet", "tablets", "tab", "tabs", "capsule", "capsules", "syrup", "cream", "gel", "spray", "drops", "drop",
+    "ointment", "powder", "lotion", "inhaler", "sachet", "sachets", "suppository", "lozenges", "liquid",
+    "suspension", "solution", "nasal", "eye", "ear", "oil", "packs", "pack", "wipes", "supplements",
+}
+MIN_ALIAS_CHARS = 4
+MAX_UNVERIFIED_CHARS = 60
+
+
+def parse_reply(text):
+    """The reply's sections by field (None for any it lacks, plus text before the first as intro), or None without headings"""
+    headings = list(_HEADING.finditer(text))
+    if not headings:
+        return None
+    sections = {field: None for field, _ in SECTIONS}
+    intro = text[:headings[0].start()].strip()
+    sections["intro"] = intro or None
+    for heading, following in zip(headings, headings[1:] + [None]):
+        body = text[heading.end():following.start() if following else len(text)].strip()
+        field = _FIELDS[heading.group(1).lower()]
+        if body:
+            # A repeated heading adds to the section rather than replacing it
+            sections[field] = f"{sections[field]}\n{body}" if sections[field] else body
+    return sections
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+def _core(words):
+    """Words without the trailing form and strength ("hydrocortisone cream 1" -> "hydrocortisone")"""
+    end = len(words)
+    while end and (words[end - 1] in FORM_WORDS or words[end - 1].isdigit()):
+        end -= 1
+    return words[:end]
+
+
+def _name_aliases(name):
+    """Alias word lists for a catalogue medicine name"""
+    bracketed = re.findall(r"\(([^)]*)\)", name)
+    bare = re.sub(r"\([^)]*\)", " ", name)
+    aliases = [_words(bare), _core(_words(bare))]
+    # "(ORS)", "(Neomycin)": a single bracketed word is another name for it
+    aliases += [_words(text) for text in bracketed if len(_words(text)) == 1]
+    # Ingredients, unless a part is only a form ("Clotrimazole Powder/Cream") or too short to be one ("Hot/Cold")
+    parts = [_core(_words(part)) for part in re.split(r"[/+]", bare)]
+    if len(parts) > 1 and all(len(" ".join(part)) >= 5 for part in parts):
+        aliases += parts
+    return [alias for alias in aliases if alias and len(" ".join(alias)) >= 3]
+
+
+def _brand_aliases(examples):
+    """Alias word lists for an entry's example brands, skipping placeholders such as "Generic ..." """
+    aliases = []
+    for brand in re.split(r"[,+]", examples):
+        words = _words(brand)
+        if words and words[0] not in ("generic", "local") and len(" ".join(words)) >= MIN_ALIAS_CHARS:
+            aliases.append(words)
+    return aliases
+
+
+class MedicationLookup:
+    """Name, ingredient and brand tables over one catalogue snapshot"""
+
+    def __init__(self, data):
+        self.names = {}
+        brands = {}
+        for category in data:
+            for entry in category["entries"]:
+                for alias in _name_aliases(entry["medicine"]):
+                    self._add(self.names, alias, entry)
+                for alias in _brand_aliases(entry["examples"]):
+                    self._add(brands, alias, entry)
+        # A brand never overrides a name: "Ibuprofen" is the Ibuprofen entry, not the kit that lists it as an example
+        for alias, entries in brands.items():
+            self.names.setdefault(alias, entries)
+        self.first_words = {alias.split(" ", 1)[0] for alias in self.names}
+        self.max_words = max(alias.count(" ") + 1 for alias in self.names)
+
+    @staticmethod
+    def _add(table, alias, entry):
+        entries = table.setdefault(" ".join(alias), [])
+        if entry not in entries:
+            entries.append(entry)
+
+    def find(self, text):
+        """(words matched, catalogue entries) for each medicine named in text, longest names first"""
+        words = _words(text)
+        found = []
+        i = 0
+        while i < len(words):
+            if words[i] in self.first_words:
+                for size in range(min(self.max_words, len(words) - i), 0, -1):
+                    entries = self.names.get(" ".join(words[i:i + size]))
+                    if entries is not None:
+                        found.append((" ".join(words[i:i + size]), entries))
+                        i += size
+                        break
+                else:
+                    i += 1
+            else:
+                i += 1
+        return found
+
+
+def check_medications(text, age=None, lookup=None):
+    """(medicines found in the catalogue, unverified items with a dose, warnings) for a Medications section"""
+    lookup = lookup or get_catalogue().current().derived("medication_lookup", MedicationLookup)
+    medicines = []
+    unverified = []
+    warnings = []
+    seen = set()
+    for item in _ITEM_SPLIT.split(text):
+        item = item.strip(" \t.*•-")
+        if not item:
+            continue
+        found = lookup.find(item)
+        if not found:
+            # A dose with a name in front of it ("Azithromycin 250 mg"), not just more dosing ("2 drops each nostril")
+            name = _NAME_END.split(item, 1)[0].strip()
+            if name and _DOSE.search(item):
+                unverified.append(name[:MAX_UNVERIFIED_CHARS])
+            continue
+        for mentioned, entries in found:
+            suited = [entry for entry in entries if age is None or age_group_allows(entry["age_group"], age)]
+            entry = (suited or entries)[0]
+            if entry["medicine"] in seen:
+                continue
+            seen.add(entry["medicine"])
+            suits_age = None if age is None else bool(suited)
+            medicines.append({
+                "name": mentioned,
+                "catalogue": entry["medicine"],
+                "age_group": entry["age_group"],
+                "suits_age": suits_age,
+            })
+            if suits_age is False:
+                warnings.append(f"{entry['medicine']} is listed for {entry['age_group']} only; check it suits a patient aged {age}")
+    return medicines, unverified, warnings
+
+
+def structure_reply(text, age=None, snapshot=None):
+    """Sections of a reply plus its checked medicines, or None when the reply has no sections"""
+    sections = parse_reply(text)
+    if sections is None:
+        return None
+    medicines, unverified, warnings = [], [], []
+    if sections["medications"]:
+        snapshot = snapshot or get_catalogue().current()
+        lookup = snapshot.derived("medication_lookup", MedicationLookup)
+        medicines, unverified, warnings = check_medications(sections["medications"], age, lookup)
+    return {**sections, "medicines": medicines, "unverified": unverified, "warnings": warnings}
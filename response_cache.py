@@ -0,0 +1,187 @@
+"""
+Cache of model replies to the opening consultation turn.
+
+Many sessions open with the same concern from the same kind of patient
+("headache, 30, male", "first aid kit", "travel kit"). The reply to that first
+model turn depends on the concern, the patient's age group and gender, and the
+temperature and duration they reported, so it is cached under a normalized
+(concern, age group, gender, temperature, duration) key and served without a
+Gemini call or a message from the user's allowance. A message with any other
+number in it (a dose already taken, times vomited) gets no key, since the number
+may change the advice, and neither does a negated one ("fever but no headache"),
+since the words of the key don't record what was ruled out. Later turns depend on
+the conversation so far and always bypass the cache.
+
+Similarity matching is optional: concerns are compared as sparse bag-of-words
+vectors, widened with the health concepts the detector finds (so "migraine" and
+"headache" meet), with cosine similarity computed locally.
+"""
+
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from health_detector import detect_health_concerns
+from retrieval import tokenize
+
+# The age groups of the system prompt's age-specific guidelines
+AGE_GROUPS = (
+    (2, "infant"),
+    (6, "child 2-6"),
+    (12, "child 6-12"),
+    (65, "adult"),
+)
+ELDERLY = "elderly"
+
+_NUMBER = re.compile(r"\d+")
+# Negation flips the meaning of the words around it, which a bag of words can't see
+_NEGATION = re.compile(r"\b(?:no|not|without|never)\b|n't\b", re.IGNORECASE)
+
+# Words that carry the demographics (already in the key) or pleasantries rather than the concern
+IGNORED_WORDS = {
+    "male", "female", "man", "woman", "boy", "girl", "year", "old", "age", "aged", "yo",
+    "hi", "hello", "hey", "please", "thank", "thanks", "doctor", "help", "advice",
+}
+
+
+def age_group(age):
+    """Age group from the system prompt's guidelines"""
+    for upper, name in AGE_GROUPS:
+        if age < upper:
+            return name
+    return ELDERLY
+
+
+def known_numbers(age, temperature=None, duration=None):
+    """Numbers a message may contain that the rest of the key already accounts for"""
+    numbers = {str(int(age))}
+    if age < 2:
+        # "6 months old"
+        numbers.add(str(round(age * 12)))
+    for fact in (temperature, duration):
+        if fact:
+            numbers.update(_NUMBER.findall(fact))
+    return numbers
+
+
+def concern_terms(text):
+    """Normalized words of a concern, without numbers, demographics or pleasantries"""
+    return frozenset(term for term in tokenize(text) if not term.isdigit() and term not in IGNORED_WORDS)
+
+
+def concern_vector(text, terms):
+    """Sparse vector of a concern: its words plus the health concepts it mentions"""
+    return terms | {f"concept:{match.concept}" for match in detect_health_concerns(text)}
+
+
+def cosine(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / math.sqrt(len(a) * len(b))
+
+
+class _Entry:
+    __slots__ = ("reply", "vector", "expires_at")
+
+    def __init__(self, reply, vector, expires_at):
+        self.reply = reply
+        self.vector = vector
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """LRU cache of opening replies with expiry, a size cap and hit/miss counters"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, similarity=0.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # 0 disables similarity matching, leaving exact normalized matches only
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            "hits": 0, "similar_hits": 0, "misses": 0, "bypasses": 0,
+            "stores": 0, "evictions": 0, "expirations": 0,
+        }
+
+    def key(self, text, age, gender, temperature=None, duration=None):
+        """(concern, age group, gender, temperature, duration) key for text, or None when it has nothing to key on
+
+        temperature and duration are the consultation's, as described to the model; a number in
+        text that is neither of them nor the age could change the reply, so such text gets no key,
+        and so does text that negates part of the concern.
+        """
+        terms = concern_terms(text)
+        if not terms or not age or not gender or _NEGATION.search(text):
+            return None
+        if not set(_NUMBER.findall(text)) <= known_numbers(age, temperature, duration):
+            return None
+        return (" ".join(sorted(terms)), age_group(age), gender, temperature, duration), concern_vector(text, terms)
+
+    def bypass(self):
+        """Count a turn that cannot use the cache, such as one in a conversation already underway"""
+        with self._lock:
+            self.stats_counters["bypasses"] += 1
+
+    def get(self, cache_key):
+        """Cached reply for a key from key(), or None"""
+        key, vector = cache_key
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                self.stats_counters["expirations"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats_counters["hits"] += 1
+                return entry.reply
+
+            if self.similarity > 0:
+                best, best_score = None, self.similarity
+                for other_key, other in self._entries.items():
+                    if other_key[1:] != key[1:] or other.expires_at <= now:
+                        continue
+                    score = cosine(vector, other.vector)
+                    if score >= best_score:
+                        best, best_score = other_key, score
+                if best is not None:
+                    self._entries.move_to_end(best)
+                    self.stats_counters["similar_hits"] += 1
+                    return self._entries[best].reply
+
+            self.stats_counters["misses"] += 1
+            return None
+
+    def put(self, cache_key, reply):
+        key, vector = cache_key
+        with self._lock:
+            self._entries[key] = _Entry(reply, vector, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            self.stats_counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats_counters["evictions"] += 1
+
+    def clear(self):
+        """Drop every cached reply"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Size, settings and hit/miss counters for the /health endpoint"""
+        with self._lock:
+            lookups = self.stats_counters["hits"] + self.stats_counters["similar_hits"] + self.stats_counters["misses"]
+            hits = self.stats_counters["hits"] + self.stats_counters["similar_hits"]
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity": self.similarity,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+                **self.stats_counters,
+            }
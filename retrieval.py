@@ -0,0 +1,179 @@
+"""
+Select the parts of the medication database that are relevant to a consultation
+so only those entries are sent to the model instead of the whole catalogue.
+"""
+
+import re
+
+from catalogue import get_catalogue
+
+MAX_ENTRIES = 12
+
+# Extra words patients use for each category that do not appear in the entries
+CATEGORY_HINTS = {
+    "Pain Relief / Muscle Sprain / Backache": [
+        "back", "backache", "muscle", "sprain", "strain", "joint", "cramp", "knee",
+        "shoulder", "neck", "twisted", "ankle", "arthritis", "body",
+    ],
+    "Travel Essentials": [
+        "travel", "trip", "traveling", "travelling", "vacation", "holiday", "journey",
+        "flight",
+    ],
+    "Women's Health / Menstrual Care": [
+        "period", "periods", "menstrual", "menstruation", "cramps", "pms", "vaginal",
+        "yeast", "urinary", "uti",
+    ],
+    "First Aid Kit Recommendations": [
+        "first", "aid", "kit", "emergency", "supplies",
+    ],
+    "Skin Infections / Fungal / Rashes / Prickly Heat": [
+        "skin", "rash", "itch", "itchy", "itching", "fungal", "ringworm", "eczema",
+        "diaper", "heat", "sweat", "hives",
+    ],
+    "Cough, Cold, Nasal Congestion, Allergies": [
+        "cough", "cold", "flu", "sneeze", "sneezing", "runny", "nose", "blocked",
+        "congestion", "throat", "sore", "allergy", "allergies", "sinus", "phlegm",
+    ],
+    "Gastric Issues (Acidity, Gas, Constipation, Diarrhea)": [
+        "stomach", "tummy", "belly", "abdomen", "gut", "acid", "acidity", "gas",
+        "bloating", "heartburn", "indigestion", "constipation", "diarrhea", "loose",
+        "motion", "vomit", "vomiting", "nausea", "dehydrated", "dehydration",
+    ],
+    "Wounds, Burns, Cuts": [
+        "wound", "cut", "cuts", "burn", "burns", "scrape", "graze", "bleeding", "abrasion",
+    ],
+    "Eye / Ear Problems": [
+        "eye", "eyes", "dry", "ear", "ears", "earwax", "wax", "itchy",
+    ],
+    "Chronic Conditions (Rx Only)": [
+        "hypertension", "pressure", "bp", "diabetes", "sugar", "asthma", "wheezing",
+        "inhaler",
+    ],
+}
+
+# Requests that should get a whole catalogue category rather than single entries
+CATEGORY_INTENTS = {
+    "First Aid Kit Recommendations": ("first aid", "aid kit", "medicine kit"),
+    "Travel Essentials": ("travel", "trip", "vacation", "holiday"),
+    "Women's Health / Menstrual Care": ("period", "menstrua"),
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "for", "from", "have", "i", "in", "is",
+    "it", "my", "of", "on", "or", "the", "to", "with", "me", "im", "am", "has", "had",
+    "since", "very", "really", "some", "what", "can", "do", "need", "take", "get",
+    "after", "before", "daily", "times", "once", "twice", "apply", "needed",
+}
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens with a trailing plural 's' removed"""
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.add(word)
+    return tokens
+
+
+def _build_entry_index(data):
+    """Precompute the token set of every entry and its category hints"""
+    indexed = []
+    for category in data:
+        hint_tokens = tokenize(" ".join(CATEGORY_HINTS.get(category["category"], [])))
+        hint_tokens |= tokenize(category["category"])
+        for entry in category["entries"]:
+            entry_tokens = tokenize(" ".join([entry["condition"], entry["medicine"], entry["notes"]]))
+            indexed.append((category["category"], entry, entry_tokens, hint_tokens))
+    return indexed
+
+
+def age_group_allows(age_group, age):
+    """Check whether an entry's age_group label covers the given age in years"""
+    if age is None:
+        return True
+    label = age_group.lower()
+    if "all ages" in label:
+        return True
+    minimum = re.search(r">\s*(\d+)", label)
+    if minimum:
+        return age > int(minimum.group(1))
+    if "adult" in label and age >= 12:
+        return True
+    if "children" in label and 2 <= age < 12:
+        return True
+    if "infant" in label and age < 2:
+        return True
+    return False
+
+
+def conversation_text(concern, user_turns, max_turns=3):
+    """Join the current concern with the most recent of the patient's earlier turns"""
+    return " ".join(list(user_turns)[-max_turns:] + [concern or ""])
+
+
+def select_entries(text, age=None, max_entries=MAX_ENTRIES, snapshot=None):
+    """Pick the medication entries relevant to the text, grouped by category"""
+    snapshot = snapshot or get_catalogue().current()
+    lowered = text.lower()
+    query = tokenize(text)
+    whole_categories = [
+        name for name, phrases in CATEGORY_INTENTS.items()
+        if any(phrase in lowered for phrase in phrases)
+    ]
+
+    scored = []
+    for position, (category, entry, entry_tokens, hint_tokens) in enumerate(snapshot.derived("retrieval_index", _build_entry_index)):
+        if not age_group_allows(entry["age_group"], age):
+            continue
+        if category in whole_categories:
+            score = 100
+        else:
+            score = 2 * len(query & entry_tokens) + len(query & hint_tokens)
+        if score > 0:
+            scored.append((score, position, category, entry))
+
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    limit = max(max_entries, sum(1 for item in scored if item[0] >= 100))
+    selected = sorted(scored[:limit], key=lambda item: item[1])
+
+    grouped = {}
+    for _, _, category, entry in selected:
+        grouped.setdefault(category, []).append(entry)
+    return grouped
+
+
+def format_entries(grouped, snapshot=None):
+    """Render selected entries as compact plain text for the model"""
+    if not grouped:
+        snapshot = snapshot or get_catalogue().current()
+        categories = ", ".join(category["category"] for category in snapshot.data)
+        return (
+            "MEDICATION DATABASE ENTRIES: none matched this concern yet. "
+            f"Available categories: {categories}."
+        )
+    lines = ["MEDICATION DATABASE ENTRIES:"]
+    for category, entries in grouped.items():
+        lines.append(f"{category}:")
+        for entry in entries:
+            lines.append(
+                f"- {entry['medicine']} | {entry['condition']} | {entry['form']} | "
+                f"{entry['age_group']} | {entry['dosage']} | {entry['examples']} | {entry['notes']}"
+            )
+    return "\n".join(lines)
+
+
+def build_medication_context(concern, age=None, user_turns=()):
+    """Build the medication context block for the current turn of a consultation"""
+    text = conversation_text(concern, user_turns)
+    # One catalogue version for the whole turn, even if a reload lands in between
+    snapshot = get_catalogue().current()
+    return format_entries(select_entries(text, age, snapshot=snapshot), snapshot)
+
+
+def build_full_medication_context(snapshot=None):
+    """The whole catalogue in the same compact format, for server-side context caching"""
+    snapshot = snapshot or get_catalogue().current()
+    return format_entries({category["category"]: category["entries"] for category in snapshot.data}, snapshot)
@@ -0,0 +1,240 @@
+"""
+Inverted index over the medication catalogue with BM25 ranking, synonym,
+prefix and fuzzy matching, and facet filters on age group, form and category.
+"""
+
+import bisect
+import heapq
+import math
+import re
+from collections import defaultdict
+
+from catalogue import get_catalogue
+from retrieval import age_group_allows
+
+FIELD_WEIGHTS = {
+    "condition": 2.0,
+    "medicine": 2.0,
+    "examples": 1.5,
+    "notes": 1.0,
+    "category": 0.5,
+}
+
+SYNONYMS = {
+    "tummy": ["stomach", "gastric"],
+    "belly": ["stomach", "gastric"],
+    "abdomen": ["stomach", "gastric"],
+    "stomach": ["gastric"],
+    "runny": ["nasal", "congestion"],
+    "nose": ["nasal"],
+    "blocked": ["congestion", "nasal"],
+    "stuffy": ["congestion", "nasal"],
+    "loose": ["diarrhea"],
+    "motion": ["diarrhea"],
+    "diarrhoea": ["diarrhea"],
+    "puke": ["nausea"],
+    "vomit": ["nausea"],
+    "vomiting": ["nausea"],
+    "period": ["menstrual", "dysmenorrhea"],
+    "cramp": ["dysmenorrhea", "cramps"],
+    "itch": ["itching"],
+    "itchy": ["itching"],
+    "heartburn": ["acidity", "gerd"],
+    "acid": ["acidity"],
+    "reflux": ["gerd", "acidity"],
+    "fever": ["paracetamol"],
+    "headache": ["paracetamol", "pain"],
+    "sore": ["pain", "throat"],
+    "scrape": ["abrasion", "cuts"],
+    "graze": ["abrasion", "cuts"],
+    "bp": ["hypertension"],
+    "sugar": ["diabetes"],
+    "wheezing": ["asthma"],
+    "kid": ["children"],
+    "child": ["children"],
+    "baby": ["infant", "babies"],
+}
+
+SYNONYM_WEIGHT = 0.8
+PREFIX_WEIGHT = 0.7
+FUZZY_WEIGHT = 0.5
+MAX_EXPANSIONS = 10
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(word):
+    """Fold simple English plurals so 'cramps' and 'cramp' share a term"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercase word tokens in order, with plurals folded"""
+    return [normalize(word) for word in _TOKEN_RE.findall(text.lower())]
+
+
+def _deletes(term):
+    """All strings formed by deleting one character from term"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True when a and b differ by at most one insert, delete or substitution"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = j = edits = 0
+    while i < len(a) and j < len(b):
+        if a[i] != b[j]:
+            edits += 1
+            if edits > 1:
+                return False
+            if len(a) == len(b):
+                i += 1
+            j += 1
+        else:
+            i += 1
+            j += 1
+    return edits + (len(b) - j) + (len(a) - i) <= 1
+
+
+class MedicineIndex:
+    """Prebuilt inverted index over the condition, medicine, examples and notes fields"""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, data):
+        self.docs = []
+        self.postings = defaultdict(dict)
+        self.doc_lengths = []
+        self.forms = defaultdict(set)
+        self.age_groups = defaultdict(set)
+        self.categories = defaultdict(set)
+
+        for category in data:
+            for entry in category["entries"]:
+                self._add({"category": category["category"], **entry})
+
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.docs else 0.0
+        self.norms = [
+            self.k1 * (1 - self.b + self.b * length / self.avg_length) for length in self.doc_lengths
+        ]
+        self._age_cache = {}
+        self.vocabulary = sorted(self.postings)
+        self.delete_index = defaultdict(set)
+        for term in self.vocabulary:
+            if len(term) >= 4:
+                for variant in _deletes(term):
+                    self.delete_index[variant].add(term)
+        self.idf = {
+            term: math.log(1 + (len(self.docs) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def _add(self, entry):
+        """Index one catalogue entry"""
+        doc_id = len(self.docs)
+        self.docs.append(entry)
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            terms = tokenize(entry[field])
+            length += len(terms)
+            for term in terms:
+                posting = self.postings[term]
+                posting[doc_id] = posting.get(doc_id, 0.0) + weight
+        self.doc_lengths.append(length)
+        for form in re.split(r"[/,]", entry["form"]):
+            self.forms[form.strip().lower()].add(doc_id)
+        self.age_groups[entry["age_group"].lower()].add(doc_id)
+        self.categories[entry["category"].lower()].add(doc_id)
+
+    def _prefix_terms(self, prefix):
+        """Vocabulary terms that start with prefix"""
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        matches = []
+        for term in self.vocabulary[start:start + MAX_EXPANSIONS + 1]:
+            if not term.startswith(prefix):
+                break
+            if term != prefix:
+                matches.append(term)
+        return matches
+
+    def _fuzzy_terms(self, term):
+        """Vocabulary terms within one edit of term"""
+        candidates = set(self.delete_index.get(term, ()))
+        for variant in _deletes(term):
+            if variant in self.postings:
+                candidates.add(variant)
+            candidates |= self.delete_index.get(variant, set())
+        candidates.discard(term)
+        return [candidate for candidate in candidates if _within_one_edit(term, candidate)][:MAX_EXPANSIONS]
+
+    def expand(self, query):
+        """Map a query to weighted index terms via exact, synonym, prefix and fuzzy matching"""
+        weights = {}
+
+        def add(term, weight):
+            if term in self.postings and weight > weights.get(term, 0.0):
+                weights[term] = weight
+
+        for word in tokenize(query):
+            add(word, 1.0)
+            for synonym in SYNONYMS.get(word, ()):
+                add(normalize(synonym), SYNONYM_WEIGHT)
+            if word in self.postings or len(word) < 3:
+                continue
+            for term in self._prefix_terms(word):
+                add(term, PREFIX_WEIGHT)
+            if len(word) >= 4:
+                for term in self._fuzzy_terms(word):
+                    add(term, FUZZY_WEIGHT)
+        return weights
+
+    def _allowed(self, age_group=None, form=None, category=None, age=None):
+        """Doc ids passing the facet filters, or None when no filter is set"""
+        allowed = None
+        for facet, value in ((self.age_groups, age_group), (self.forms, form), (self.categories, category)):
+            if value:
+                docs = facet.get(value.strip().lower(), set())
+                allowed = docs if allowed is None else allowed & docs
+        if age is not None:
+            # Keyed on the age-group labels the age falls in, so any number of ages share a few entries
+            labels = frozenset(label for label in self.age_groups if age_group_allows(label, age))
+            by_age = self._age_cache.get(labels)
+            if by_age is None:
+                by_age = {doc_id for label in labels for doc_id in self.age_groups[label]}
+                self._age_cache[labels] = by_age
+            allowed = by_age if allowed is None else allowed & by_age
+        return allowed
+
+    def search(self, query, limit=10, age_group=None, form=None, category=None, age=None):
+        """Rank entries for query with BM25 and return the top results"""
+        allowed = self._allowed(age_group, form, category, age)
+        scores = defaultdict(float)
+        for term, weight in self.expand(query).items():
+            idf = self.idf[term]
+            factor = weight * idf * (self.k1 + 1)
+            norms = self.norms
+            for doc_id, tf in self.postings[term].items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                scores[doc_id] += factor * tf / (tf + norms[doc_id])
+
+        if not scores and not query.strip() and allowed is not None:
+            return [{**self.docs[doc_id], "score": 0.0} for doc_id in sorted(allowed)[:limit]]
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [{**self.docs[doc_id], "score": round(score, 4)} for doc_id, score in ranked]
+
+
+def get_index():
+    """Return the index over the current catalogue, built once per catalogue version"""
+    return get_catalogue().current().derived("search_index", MedicineIndex)
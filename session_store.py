@@ -0,0 +1,361 @@
+"""
+Storage for per-user consultation state (age, gender, history), message counts
+and the tokens billed to each session.
+
+MemorySessionStore keeps everything inside one worker process, bounded by an LRU
+over both entry count and total bytes, with idle expiry. RedisSessionStore shares
+state between gunicorn workers and survives restarts; idle sessions expire through
+key TTLs, and its memory ceiling is the server's maxmemory with a volatile-lru
+policy (every key it writes has a TTL). Callers always get a private copy of a
+context and must save it back after changing it.
+
+A context is a SessionState: one slotted object per session instead of a dict, with
+the verbatim history kept as the turn texts joined into a single string. Turns
+alternate user, model from the first one, so roles aren't stored at all;
+HistoryManager bounds the number of turns and builds Gemini's role/parts entries
+only when a chat is started. Every field is immutable, so the memory store keeps
+the objects themselves and a shallow copy is a private one; Redis stores them as
+JSON.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-entry cost of the key, entry object and OrderedDict node, on top of the context
+ENTRY_OVERHEAD_BYTES = 240
+
+# Gemini's chat roles; history turns alternate between them, user first
+ROLE_USER = "user"
+ROLE_MODEL = "model"
+
+# Joins the verbatim turns into one string; it is stripped from the texts themselves
+TURN_SEPARATOR = "\x1e"
+
+
+class SessionState:
+    """One user's consultation state"""
+
+    FIELDS = (
+        "age", "gender", "history", "summary", "summarized_turns", "presenting_concern",
+        "temperature", "duration", "initial_health_concern", "has_addressed_initial_concern",
+    )
+    __slots__ = tuple(name if name != "history" else "_turns" for name in FIELDS)
+
+    def __init__(self, age=None, gender=None, history=(), summary=(), summarized_turns=0,
+                 presenting_concern=None, temperature=None, duration=None,
+                 initial_health_concern=None, has_addressed_initial_concern=False):
+        self.age = age
+        # A handful of distinct values shared by every session
+        self.gender = sys.intern(gender) if gender else gender
+        self.history = history
+        self.summary = tuple(summary)
+        self.summarized_turns = summarized_turns
+        self.presenting_concern = presenting_concern
+        self.temperature = temperature
+        self.duration = duration
+        self.initial_health_concern = initial_health_concern
+        self.has_addressed_initial_concern = has_addressed_initial_concern
+
+    @property
+    def history(self):
+        """The verbatim turns, oldest first; even positions are the patient's"""
+        return tuple(self._turns.split(TURN_SEPARATOR)) if self._turns is not None else ()
+
+    @history.setter
+    def history(self, turns):
+        # One string instead of a tuple of them saves an object header per turn
+        turns = [text.replace(TURN_SEPARATOR, "") for text in turns]
+        self._turns = TURN_SEPARATOR.join(turns) if turns else None
+
+    def __eq__(self, other):
+        if not isinstance(other, SessionState):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def copy(self):
+        """A private copy; the fields are immutable, so a shallow one is enough"""
+        state = SessionState.__new__(SessionState)
+        for name in self.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    def add_exchange(self, user_text, reply):
+        self.history = self.history + (user_text, reply)
+
+    def user_turns(self):
+        """The patient's verbatim turns, oldest first"""
+        return self.history[0::2]
+
+    def gemini_history(self):
+        """The verbatim turns as role/parts entries for model.start_chat"""
+        return [
+            {"role": ROLE_MODEL if index % 2 else ROLE_USER, "parts": [text]}
+            for index, text in enumerate(self.history)
+        ]
+
+    def size(self):
+        """Approximate bytes held by this state, for the memory store's ceiling"""
+        texts = self.summary + (
+            self._turns, self.presenting_concern, self.temperature, self.duration, self.initial_health_concern,
+        )
+        return (
+            sys.getsizeof(self) + sys.getsizeof(self.summary)
+            + sum(sys.getsizeof(text) for text in texts if text is not None)
+        )
+
+    def to_dict(self):
+        """JSON-ready form for the Redis store"""
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        data["history"] = list(data["history"])
+        data["summary"] = list(self.summary)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a state saved by to_dict, or by the older dict contexts with role/parts history entries"""
+        data = dict(data)
+        data["history"] = [
+            turn["parts"][0] if isinstance(turn, dict) else turn
+            for turn in data.get("history") or ()
+        ]
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+
+def new_context():
+    """Consultation state for a user we have not seen before"""
+    return SessionState()
+
+
+class _Entry:
+    __slots__ = ("context", "count", "prompt_tokens", "completion_tokens", "touched")
+
+    def __init__(self, now):
+        self.context = None
+        self.count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.touched = now
+
+    def size(self):
+        return ENTRY_OVERHEAD_BYTES + (self.context.size() if self.context is not None else 0)
+
+
+class MemorySessionStore:
+    """In-process store with idle expiry and an LRU ceiling on sessions and bytes"""
+
+    def __init__(self, idle_ttl=86400, max_sessions=10000, max_bytes=64 * 2 ** 20):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _entry(self, user_id, create=False):
+        """Look up (or create) an entry and mark it most recently used; call with the lock held"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and now - entry.touched > self.idle_ttl:
+            self._drop(user_id)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = _Entry(now)
+            self._entries[user_id] = entry
+            self._bytes += entry.size()
+        else:
+            self._entries.move_to_end(user_id)
+            entry.touched = now
+        return entry
+
+    def _drop(self, user_id):
+        self._bytes -= self._entries.pop(user_id).size()
+
+    def _enforce_limits(self):
+        """Expire idle sessions, then evict least recently used ones until under the ceiling"""
+        now = time.monotonic()
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if now - entry.touched > self.idle_ttl:
+                self._drop(user_id)
+                self.expirations += 1
+            elif len(self._entries) > self.max_sessions or self._bytes > self.max_bytes:
+                self._drop(user_id)
+                self.evictions += 1
+            else:
+                break
+
+    def get_context(self, user_id):
+        """The user's saved context, or None"""
+        with self._lock:
+            entry = self._entry(user_id)
+            context = entry.context if entry is not None else None
+        return context.copy() if context is not None else None
+
+    def save_context(self, user_id, context):
+        context = context.copy()
+        with self._lock:
+            entry = self._entry(user_id, create=True)
+            self._bytes -= entry.size()
+            entry.context = context
+            self._bytes += entry.size()
+            self._enforce_limits()
+
+    def get_message_count(self, user_id):
+        with self._lock:
+            entry = self._entry(user_id)
+            return entry.count if entry is not None else 0
+
+    def increment_message_count(self, user_id, limit=None):
+        """Atomically count one message; returns the new count, or None if limit was already reached"""
+        with self._lock:
+            entry = self._entry(user_id, create=True)
+            if limit is not None and entry.count >= limit:
+                return None
+            entry.count += 1
+            self._enforce_limits()
+            return entry.count
+
+    def refund_message_count(self, user_id):
+        """Give back a counted message whose reply was never attempted"""
+        with self._lock:
+            entry = self._entry(user_id)
+            if entry is not None and entry.count > 0:
+                entry.count -= 1
+
+    def reset_message_count(self, user_id):
+        with self._lock:
+            self._entry(user_id, create=True).count = 0
+
+    def get_token_usage(self, user_id):
+        """(prompt tokens, completion tokens) billed to the session so far"""
+        with self._lock:
+            entry = self._entry(user_id)
+            return (entry.prompt_tokens, entry.completion_tokens) if entry is not None else (0, 0)
+
+    def add_token_usage(self, user_id, prompt_tokens, completion_tokens):
+        """Bill one model reply to the session; returns its new (prompt, completion) totals"""
+        with self._lock:
+            entry = self._entry(user_id, create=True)
+            entry.prompt_tokens += prompt_tokens
+            entry.completion_tokens += completion_tokens
+            self._enforce_limits()
+            return entry.prompt_tokens, entry.completion_tokens
+
+    def reset_token_usage(self, user_id):
+        with self._lock:
+            entry = self._entry(user_id, create=True)
+            entry.prompt_tokens = entry.completion_tokens = 0
+
+    def stats(self):
+        """Size and eviction counters for the /health endpoint"""
+        return {
+            "backend": "memory",
+            "sessions": len(self._entries),
+            "bytes": self._bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "idle_ttl": self.idle_ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RedisSessionStore:
+    """Store shared by every worker through Redis (or anything speaking its protocol)"""
+
+    def __init__(self, url="redis://localhost:6379/0", idle_ttl=86400, prefix="curaai:", client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.redis = client
+        self.idle_ttl = idle_ttl
+        self.prefix = prefix
+
+    def _context_key(self, user_id):
+        return f"{self.prefix}context:{user_id}"
+
+    def _count_key(self, user_id):
+        return f"{self.prefix}count:{user_id}"
+
+    def _tokens_key(self, user_id):
+        return f"{self.prefix}tokens:{user_id}"
+
+    def get_context(self, user_id):
+        """The user's saved context, or None; reading it also extends the idle timeout"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.getex(self._context_key(user_id), ex=self.idle_ttl)
+        pipe.expire(self._count_key(user_id), self.idle_ttl)
+        pipe.expire(self._tokens_key(user_id), self.idle_ttl)
+        data = pipe.execute()[0]
+        return SessionState.from_dict(json.loads(data)) if data else None
+
+    def save_context(self, user_id, context):
+        data = json.dumps(context.to_dict(), separators=(",", ":"))
+        self.redis.set(self._context_key(user_id), data, ex=self.idle_ttl)
+
+    def get_message_count(self, user_id):
+        return int(self.redis.get(self._count_key(user_id)) or 0)
+
+    def increment_message_count(self, user_id, limit=None):
+        """Atomically count one message; returns the new count, or None if limit was already reached"""
+        key = self._count_key(user_id)
+        pipe = self.redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.idle_ttl)
+        count = pipe.execute()[0]
+        if limit is not None and count > limit:
+            # Over the limit: give the increment back so the stored count stays at the limit
+            self.redis.decr(key)
+            return None
+        return count
+
+    def refund_message_count(self, user_id):
+        """Give back a counted message whose reply was never attempted"""
+        key = self._count_key(user_id)
+        if self.redis.decr(key) < 0:
+            # The count was reset in between; don't leave it negative
+            self.redis.incr(key)
+
+    def reset_message_count(self, user_id):
+        self.redis.set(self._count_key(user_id), 0, ex=self.idle_ttl)
+
+    def get_token_usage(self, user_id):
+        """(prompt tokens, completion tokens) billed to the session so far"""
+        prompt_tokens, completion_tokens = self.redis.hmget(self._tokens_key(user_id), "prompt", "completion")
+        return int(prompt_tokens or 0), int(completion_tokens or 0)
+
+    def add_token_usage(self, user_id, prompt_tokens, completion_tokens):
+        """Bill one model reply to the session; returns its new (prompt, completion) totals"""
+        key = self._tokens_key(user_id)
+        pipe = self.redis.pipeline()
+        pipe.hincrby(key, "prompt", prompt_tokens)
+        pipe.hincrby(key, "completion", completion_tokens)
+        pipe.expire(key, self.idle_ttl)
+        prompt_total, completion_total, _ = pipe.execute()
+        return prompt_total, completion_total
+
+    def reset_token_usage(self, user_id):
+        self.redis.delete(self._tokens_key(user_id))
+
+    def stats(self):
+        """Key count and server memory for the /health endpoint"""
+        stats = {"backend": "redis", "idle_ttl": self.idle_ttl}
+        try:
+            info = self.redis.info("memory")
+            stats.update({
+                "keys": self.redis.dbsize(),
+                "used_memory": info.get("used_memory"),
+                "maxmemory": info.get("maxmemory"),
+                "maxmemory_policy": info.get("maxmemory_policy"),
+            })
+        except Exception as e:
+            stats["error"] = str(e)
+        return stats
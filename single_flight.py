@@ -0,0 +1,99 @@
+"""
+Coalescing of duplicate chat requests.
+
+A page refresh, the Retry button or a double submit can send a message again while
+the model is still answering it. The first request to join a key leads: it runs
+the turn and shares the outcome. Duplicates that arrive meanwhile wait for that
+outcome instead of making their own paid call and using another message from the
+allowance. The chat routes key a turn on (user, message, position in the
+conversation).
+
+Outcomes of requests that carried an Idempotency-Key are also kept for a while,
+so a retry whose first attempt did get answered (only the response was lost)
+gets the same reply back.
+
+Flights are per process; with several gunicorn workers, duplicates are only
+coalesced when they reach the same worker.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class Flight:
+    """One in-flight turn; followers wait() for the leader's finish()"""
+
+    __slots__ = ("key", "idempotency_key", "result", "_done")
+
+    def __init__(self, key, idempotency_key=None):
+        self.key = key
+        self.idempotency_key = idempotency_key
+        self.result = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """The leader's result, or None if it gave up or did not finish in time"""
+        self._done.wait(timeout)
+        return self.result
+
+
+class SingleFlight:
+    """In-flight turns by key, and recent results by idempotency key"""
+
+    def __init__(self, wait_timeout=120, result_ttl=300, max_results=1024):
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self._flights = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats_counters = {"leaders": 0, "coalesced": 0, "replayed": 0, "abandoned": 0}
+
+    def join(self, key, idempotency_key=None):
+        """(flight, leader): the leader runs the turn and must finish() it, everyone else waits on it"""
+        now = time.monotonic()
+        with self._lock:
+            if idempotency_key is not None:
+                remembered = self._results.get(idempotency_key)
+                if remembered is not None and remembered[0] > now:
+                    self.stats_counters["replayed"] += 1
+                    flight = Flight(key)
+                    flight.result = remembered[1]
+                    flight._done.set()
+                    return flight, False
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats_counters["coalesced"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key, idempotency_key)
+            self.stats_counters["leaders"] += 1
+            return flight, True
+
+    def finish(self, flight, result=None, remember=False):
+        """Hand result to the waiting duplicates; None tells them to answer themselves. Only the first call counts"""
+        with self._lock:
+            if flight._done.is_set():
+                return
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if result is None:
+                self.stats_counters["abandoned"] += 1
+            elif remember and flight.idempotency_key is not None:
+                self._results[flight.idempotency_key] = (time.monotonic() + self.result_ttl, result)
+                self._results.move_to_end(flight.idempotency_key)
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+            flight.result = result
+            flight._done.set()
+
+    def stats(self):
+        """In-flight count, remembered results and counters for the /health endpoint"""
+        with self._lock:
+            return {
+                "enabled": True,
+                "in_flight": len(self._flights),
+                "remembered_results": len(self._results),
+                "result_ttl_seconds": self.result_ttl,
+                **self.stats_counters,
+            }
@@ -13,7 +13,12 @@ let hasStartedChat = false;
 let currentChatId = null;
 let chatHistoryData = [];
 let messageCount = 0;
-let messageLimit = 10;
+let tokensUsed = 0;
+let tokenBudget = null;
+// The last message sent and its Idempotency-Key; Retry sends the same key so the server
+// can hand back the first attempt's reply instead of calling the model again
+let lastRequest = null;
+let retrying = false;
 
 document.addEventListener("DOMContentLoaded", () => {
   loadChatHistory();
@@ -95,17 +100,23 @@ function updateMessageCounter() {
     .then(response => response.json())
     .then(data => {
       messageCount = data.count;
-      messageLimit = data.limit;
+      tokensUsed = data.tokens_used;
+      tokenBudget = data.token_budget;
       
       console.log('Message counter updated:', data); // Debug log
       
-      // Update UI to show message count
+      // Update UI to show how much of the session's token budget is left
       const counterElement = document.getElementById('message-counter');
       if (counterElement) {
-        counterElement.textContent = `${messageCount}/${messageLimit}`;
-        if (messageCount >= messageLimit) {
+        if (!tokenBudget) {
+          counterElement.textContent = `${messageCount}`;
+          counterElement.style.color = '#4caf50';
+          return;
+        }
+        counterElement.textContent = `${Math.round(100 * data.tokens_remaining / tokenBudget)}%`;
+        if (tokensUsed >= tokenBudget) {
           counterElement.style.color = '#ff6b6b';
-        } else if (messageCount >= messageLimit * 0.8) {
+        } else if (tokensUsed >= tokenBudget * 0.8) {
           counterElement.style.color = '#ffa726';
         } else {
           counterElement.style.color = '#4caf50';
@@ -189,7 +200,7 @@ function loadChat(chatId) {
   welcomeScreen.style.display = 'none';
   
   chat.messages.forEach(message => {
-    appendMessage(message.sender, message.text, false);
+    appendMessage(message.sender, message.text, false, message.structured);
   });
   
   renderChatHistory();
@@ -225,11 +236,11 @@ function updateChatTitle(chatId, title) {
   }
 }
 
-function addMessageToHistory(sender, text) {
+function addMessageToHistory(sender, text, structured = null) {
   if (currentChatId) {
     const chat = chatHistoryData.find(c => c.id === currentChatId);
     if (chat) {
-      chat.messages.push({ sender, text });
+      chat.messages.push(structured ? { sender, text, structured } : { sender, text });
       saveChatHistory();
       
       if (chat.messages.length === 2 && chat.title === 'New Chat') {
@@ -265,6 +276,7 @@ function startNewChat() {
   
   // Reset message counter for new session
   messageCount = 0;
+  tokensUsed = 0;
   updateMessageCounter();
   
   // Re-enable input if it was disabled
@@ -312,29 +324,68 @@ function appendMessageWithTyping(sender, text) {
   }
 }
 
-function appendMessage(sender, text, saveToHistory = true) {
-  if (saveToHistory) {
-    addMessageToHistory(sender, text);
-  }
-  
+function createMessageElement(sender) {
   const messageDiv = document.createElement('div');
   messageDiv.className = `chat-message ${sender}`;
   
   const contentDiv = document.createElement('div');
   contentDiv.className = 'message-content';
   
-  if (sender === 'ai') {
+  messageDiv.appendChild(contentDiv);
+  chatBox.appendChild(messageDiv);
+  return contentDiv;
+}
+
+function appendMessage(sender, text, saveToHistory = true, structured = null) {
+  if (saveToHistory) {
+    addMessageToHistory(sender, text, structured);
+  }
+  
+  const contentDiv = createMessageElement(sender);
+  
+  if (sender === 'ai' && structured) {
+    renderStructuredReply(contentDiv, structured);
+  } else if (sender === 'ai') {
     contentDiv.innerHTML = formatAIResponse(text);
   } else {
     contentDiv.textContent = text;
   }
   
-  messageDiv.appendChild(contentDiv);
-  chatBox.appendChild(messageDiv);
-  
   scrollToBottom();
 }
 
+const REPLY_SECTIONS = [
+  ['possible_cause', 'Possible Cause'],
+  ['recommended_steps', 'Recommended Steps'],
+  ['medications', 'Medications'],
+  ['see_a_doctor', 'When to See a Doctor'],
+];
+
+// Sections and medicine checks come parsed from the server; only text nodes are created
+function renderStructuredReply(contentDiv, structured) {
+  contentDiv.innerHTML = '';
+  const paragraph = (text, className) => {
+    const p = document.createElement('p');
+    if (className) p.className = className;
+    p.textContent = text;
+    contentDiv.appendChild(p);
+    return p;
+  };
+  
+  if (structured.intro) {
+    paragraph(structured.intro);
+  }
+  REPLY_SECTIONS.forEach(([field, label]) => {
+    if (!structured[field]) return;
+    const heading = paragraph('');
+    const strong = document.createElement('strong');
+    strong.textContent = `${label}:`;
+    heading.appendChild(strong);
+    paragraph(structured[field]);
+  });
+  (structured.warnings || []).forEach(warning => paragraph(`⚠️ ${warning}`, 'reply-warning'));
+}
+
 function formatAIResponse(text) {
   const lines = text.split('\n');
   let formattedText = '';
@@ -402,6 +453,12 @@ chatForm.addEventListener('submit', async (e) => {
     startNewChat();
   }
   
+  const idempotencyKey = retrying && lastRequest && lastRequest.message === message
+    ? lastRequest.key
+    : newIdempotencyKey();
+  retrying = false;
+  lastRequest = { message, key: idempotencyKey };
+  
   appendMessage('user', message);
   userInput.value = '';
   
@@ -409,29 +466,40 @@ chatForm.addEventListener('submit', async (e) => {
   showTypingIndicator();
   
   try {
-    const response = await fetch('/chat', {
+    const response = await fetch('/chat/stream', {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey,
       },
       body: JSON.stringify({ message })
     });
     
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
+    const contentType = response.headers.get('Content-Type') || '';
+    if (contentType.startsWith('text/event-stream')) {
+      await renderStreamedReply(response);
+      return;
     }
     
+    // Replies that don't need the model (age/gender questions, limits) arrive as plain JSON
     const data = await response.json();
+    if (!response.ok && !data.limit_reached && !data.rate_limited && !data.busy) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
     removeTypingIndicator();
     
-    if (data.limit_reached) {
+    if (data.rate_limited || data.busy) {
+      // Sent too fast, or the service is saturated; the reply says how long to wait and Retry resends the same message
+      showErrorWithRetry(data.reply);
+      setInputState(true);
+    } else if (data.limit_reached) {
       appendMessage('ai', data.reply);
       setInputState(false);
-      userInput.placeholder = 'Message limit reached';
+      userInput.placeholder = 'Session budget used up';
       userInput.disabled = true;
       sendButton.disabled = true;
     } else {
-      appendMessage('ai', data.reply);
+      appendMessage('ai', data.reply, true, data.structured);
       // Only update counter if the backend actually counted this message
       if (data.message_counted) {
         updateMessageCounter();
@@ -447,6 +515,81 @@ chatForm.addEventListener('submit', async (e) => {
   }
 });
 
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+function parseServerSentEvent(block) {
+  let type = 'message';
+  let data = '';
+  block.split('\n').forEach(line => {
+    if (line.startsWith('event:')) {
+      type = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      data += line.slice(5).trim();
+    }
+  });
+  return { type, data: data ? JSON.parse(data) : {} };
+}
+
+async function renderStreamedReply(response) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let reply = '';
+  let contentDiv = null;
+  let result = null;
+  
+  while (!result) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    
+    let boundary;
+    while (!result && (boundary = buffer.indexOf('\n\n')) !== -1) {
+      const event = parseServerSentEvent(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      
+      if (event.type === 'token') {
+        if (!contentDiv) {
+          removeTypingIndicator();
+          contentDiv = createMessageElement('ai');
+        }
+        reply += event.data.text;
+        contentDiv.innerHTML = formatAIResponse(reply);
+        chatBox.scrollTop = chatBox.scrollHeight;
+      } else if (event.type === 'done' || event.type === 'error') {
+        result = event;
+      }
+    }
+  }
+  
+  removeTypingIndicator();
+  const structured = result && result.type === 'done' ? result.data.structured : null;
+  if (reply) {
+    addMessageToHistory('ai', reply, structured);
+  }
+  if (structured && contentDiv) {
+    renderStructuredReply(contentDiv, structured);
+  }
+  
+  if (result && result.type === 'done') {
+    if (result.data.message_counted) {
+      updateMessageCounter();
+    }
+    setInputState(true);
+  } else if (result && !reply) {
+    appendMessage('ai', result.data.reply);
+    setInputState(true);
+  } else {
+    // The connection dropped or the model failed part-way through the reply
+    throw new Error('Reply stream ended early');
+  }
+}
+
 function showErrorWithRetry(message) {
   const errorDiv = document.createElement('div');
   errorDiv.className = 'error-message';
@@ -468,6 +611,7 @@ function retryLastMessage() {
   if (lastUserMessage) {
     const messageText = lastUserMessage.querySelector('.message-content').textContent;
     userInput.value = messageText;
+    retrying = true;
     chatForm.dispatchEvent(new Event('submit'));
   }
 }
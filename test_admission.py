@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Tests for the admission gate in front of model replies
+Run with: python -m pytest -q test_admission.py
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import PRIORITY_BATCH, PRIORITY_NEW, PRIORITY_ONGOING, AdmissionGate
+
+
+def queue_in_background(gate, priority, results):
+    def run():
+        ticket = gate.admit(priority)
+        results.append((priority, ticket))
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_for_queue(gate, depth):
+    deadline = time.monotonic() + 2
+    while sum(gate.stats()["queue"].values()) < depth and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_capacity_is_never_exceeded():
+    gate = AdmissionGate(3, max_queue=50, max_wait=5)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def reply():
+        ticket = gate.admit(PRIORITY_NEW)
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        ticket.release()
+
+    threads = [threading.Thread(target=reply) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 3
+    stats = gate.stats()
+    assert (stats["in_use"], stats["admitted"]) == (0, 20)
+
+
+def test_ongoing_consultations_go_first():
+    gate = AdmissionGate(1, max_queue=10, max_wait=5)
+    holder = gate.admit(PRIORITY_NEW)
+    results = []
+    threads = [queue_in_background(gate, PRIORITY_NEW, results)]
+    wait_for_queue(gate, 1)
+    threads.append(queue_in_background(gate, PRIORITY_ONGOING, results))
+    wait_for_queue(gate, 2)
+
+    holder.release()
+    time.sleep(0.05)
+    assert [priority for priority, _ in results] == [PRIORITY_ONGOING]
+    results[0][1].release()
+    for thread in threads:
+        thread.join()
+    assert [priority for priority, _ in results] == [PRIORITY_ONGOING, PRIORITY_NEW]
+
+
+def test_full_queue_sheds_new_sessions_and_evicts_for_ongoing_ones():
+    gate = AdmissionGate(1, max_queue=1, max_wait=5)
+    holder = gate.admit(PRIORITY_NEW)
+    results = []
+    queued_new = queue_in_background(gate, PRIORITY_NEW, results)
+    wait_for_queue(gate, 1)
+
+    started = time.monotonic()
+    assert gate.admit(PRIORITY_NEW) is None
+    assert time.monotonic() - started < 0.05
+
+    ongoing = queue_in_background(gate, PRIORITY_ONGOING, results)
+    queued_new.join(1)
+    assert results == [(PRIORITY_NEW, None)]
+    holder.release()
+    ongoing.join(1)
+    assert results[1][0] == PRIORITY_ONGOING and results[1][1] is not None
+    stats = gate.stats()
+    assert (stats["rejected_queue_full"], stats["evicted"]) == (1, 1)
+
+
+def test_waiting_is_bounded():
+    gate = AdmissionGate(1, max_queue=10, max_wait=0.1)
+    holder = gate.admit(PRIORITY_ONGOING)
+    started = time.monotonic()
+    assert gate.admit(PRIORITY_ONGOING) is None
+    assert 0.1 <= time.monotonic() - started < 0.3
+    holder.release()
+    assert gate.stats()["rejected_timeout"] == 1
+
+
+def test_async_waiters_and_cancellation():
+    gate = AdmissionGate(1, max_queue=10, max_wait=5)
+
+    async def scenario():
+        holder = await gate.admit_async(PRIORITY_NEW)
+        cancelled = asyncio.create_task(gate.admit_async(PRIORITY_NEW))
+        waiting = asyncio.create_task(gate.admit_async(PRIORITY_NEW))
+        await asyncio.sleep(0.02)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        holder.release()
+        ticket = await asyncio.wait_for(waiting, 1)
+        ticket.release()
+
+    asyncio.run(scenario())
+    stats = gate.stats()
+    assert (stats["in_use"], sum(stats["queue"].values())) == (0, 0)
+
+
+class SlowRedis:
+    """Lease store whose every round trip takes 100ms, like a distant Redis"""
+
+    def __init__(self):
+        self.leases = set()
+
+    def register_script(self, script):
+        def acquire(keys, args):
+            time.sleep(0.1)
+            self.leases.add(args[3])
+            return 1
+        return acquire
+
+    def zrem(self, key, lease):
+        time.sleep(0.1)
+        self.leases.discard(lease)
+
+
+def test_async_admission_keeps_slot_store_calls_off_the_event_loop():
+    client = SlowRedis()
+    gate = AdmissionGate(2, client=client)
+
+    async def scenario():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        ticket = await gate.admit_async(PRIORITY_NEW)
+        await ticket.release_async()
+        ticker.cancel()
+        return ticks
+
+    # The loop kept running through both 100ms round trips
+    assert asyncio.run(scenario()) >= 10
+    assert client.leases == set() and gate.stats()["in_use"] == 0
+
+
+class ExpiringLeases:
+    """Lease store that drops leases past their expiry, as the acquire script does"""
+
+    def __init__(self):
+        self.leases = {}
+
+    def register_script(self, script):
+        def acquire(keys, args):
+            now, expiry, capacity, lease = args
+            self.leases = {key: score for key, score in self.leases.items() if score > now}
+            if len(self.leases) >= capacity:
+                return 0
+            self.leases[lease] = expiry
+            return 1
+        return acquire
+
+    def zadd(self, key, mapping, xx=False):
+        for lease, score in mapping.items():
+            if not xx or lease in self.leases:
+                self.leases[lease] = score
+
+    def zrem(self, key, lease):
+        self.leases.pop(lease, None)
+
+
+def test_held_leases_are_renewed_past_their_ttl():
+    client = ExpiringLeases()
+    first = AdmissionGate(1, max_wait=0, client=client, lease_ttl=0.3)
+    second = AdmissionGate(1, max_wait=0, client=client, lease_ttl=0.3)
+    ticket = first.admit()
+    time.sleep(0.7)
+    # Still held by a live worker, so the shared cap stays full
+    assert second.admit() is None
+    ticket.release()
+    assert client.leases == {}
+    second.admit().release()
+
+
+def test_shared_slots_span_gates():
+    fakeredis = pytest.importorskip("fakeredis")
+    # fakeredis runs the lease script through lupa
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeRedis()
+    first = AdmissionGate(2, max_wait=0.5, client=client)
+    second = AdmissionGate(2, max_wait=0.5, client=client, poll_interval=0.01)
+    held = [first.admit(), first.admit()]
+    assert second.admit() is None
+
+    threading.Timer(0.1, held[0].release).start()
+    started = time.monotonic()
+    ticket = second.admit()
+    assert ticket is not None and time.monotonic() - started < 0.3
+    ticket.release()
+    held[1].release()
+    assert client.zcard("curaai:llm_slots") == 0
+
+
+def test_batch_records_wait_behind_chats_and_make_room_for_them():
+    gate = AdmissionGate(1, max_queue=2, max_wait=5)
+    holder = gate.admit(PRIORITY_NEW)
+    results = []
+    threads = [queue_in_background(gate, PRIORITY_BATCH, results)]
+    wait_for_queue(gate, 1)
+    threads.append(queue_in_background(gate, PRIORITY_BATCH, results))
+    wait_for_queue(gate, 2)
+
+    # A new session arriving at a full queue turns away the newest batch record
+    threads.append(queue_in_background(gate, PRIORITY_NEW, results))
+    threads[1].join(1)
+    assert results == [(PRIORITY_BATCH, None)]
+    holder.release()
+    threads[2].join(1)
+    assert results[1][0] == PRIORITY_NEW
+    results[1][1].release()
+    threads[0].join(1)
+    assert results[2][0] == PRIORITY_BATCH and results[2][1] is not None
+    results[2][1].release()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tests for the async chat routes driven through the ASGI app, with the Gemini model stubbed out
+Run with: python -m pytest -q test_asgi.py
+"""
+
+import asyncio
+import json
+
+import pytest
+from asgiref.testing import ApplicationCommunicator
+
+# Sets the same environment as the Flask route tests before app is imported
+from test_chat_routes import REPLY, FakeModel, chat_app
+
+import asgi
+from admission import AdmissionGate
+
+
+class AsyncFakeModel(FakeModel):
+    """FakeModel as the asyncio client sees it"""
+
+    def start_chat(self, history=None):
+        return AsyncFakeChat(super().start_chat(history))
+
+
+class AsyncFakeChat:
+    def __init__(self, chat):
+        self.chat = chat
+
+    async def send_message_async(self, prompt, stream=False, request_options=None):
+        response = self.chat.send_message(prompt, stream=stream, request_options=request_options)
+        return AsyncFakeStream(response) if stream else response
+
+
+class AsyncFakeStream:
+    def __init__(self, response):
+        self.chunks = response.chunks
+        self.usage_metadata = response.usage_metadata
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = AsyncFakeModel()
+
+    async def async_model_for_key(api_key):
+        return fake, None
+
+    monkeypatch.setattr(asgi, "async_model_for_key", async_model_for_key)
+    chat_app.response_cache.clear()
+    return fake
+
+
+class Client:
+    """Posts to the ASGI app and keeps the session cookie between turns, as a browser would"""
+
+    def __init__(self):
+        self.cookie = None
+
+    def post(self, path, message):
+        return asyncio.run(self._post(path, message))
+
+    async def _post(self, path, message):
+        headers = [(b"content-type", b"application/json")]
+        if self.cookie:
+            headers.append((b"cookie", self.cookie))
+        communicator = ApplicationCommunicator(asgi.app, {
+            "type": "http", "method": "POST", "path": path, "query_string": b"", "headers": headers,
+            "client": ("127.0.0.1", 50000), "server": ("testserver", 80), "scheme": "http",
+        })
+        await communicator.send_input({"type": "http.request", "body": json.dumps({"message": message}).encode()})
+        start = await communicator.receive_output(5)
+        body = b""
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        for name, value in start["headers"]:
+            if name == b"set-cookie":
+                self.cookie = value.split(b";", 1)[0]
+        return start["status"], dict(start["headers"]), body.decode("utf-8")
+
+    def chat(self, message):
+        status, headers, body = self.post("/chat", message)
+        return status, headers, json.loads(body)
+
+    def stream(self, message):
+        status, headers, body = self.post("/chat/stream", message)
+        assert status == 200 and headers[b"content-type"].startswith(b"text/event-stream")
+        events = []
+        for block in body.strip().split("\n\n"):
+            event, data = block.split("\n", 1)
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+
+def test_session_cookie_carries_the_consultation_across_turns(model):
+    client = Client()
+    status, _, first = client.chat("I'm 30 and male, I have had a dry cough since yesterday")
+    assert status == 200 and first["reply"] == REPLY and first["current_count"] == 1
+    assert client.cookie is not None
+
+    _, _, second = client.chat("It is worse at night")
+    assert second["current_count"] == 2
+    # The second turn replays the first to the model
+    assert [turn["role"] for turn in model.histories[-1]] == ["user", "model"]
+    assert model.histories[-1][1]["parts"][0] == REPLY
+
+
+def test_streamed_reply_arrives_as_tokens(model):
+    events = Client().stream("I'm 30 and male, I have had a dry cough since yesterday")
+    assert [name for name, _ in events[:-1]] == ["token"] * (len(events) - 1)
+    assert "".join(data["text"] for _, data in events[:-1]).strip() == REPLY
+    name, done = events[-1]
+    assert name == "done" and done["current_count"] == 1
+    assert done["structured"]["possible_cause"] == "A viral infection."
+
+
+def test_clients_over_their_quota_get_429_before_the_model_is_called(model, monkeypatch):
+    def check():
+        response = chat_app.app.json.response({"reply": "Too fast", "rate_limited": True, "retry_after": 7})
+        response.status_code = 429
+        response.headers["Retry-After"] = "7"
+        return response
+
+    monkeypatch.setattr(asgi.chat_rate_limits, "check", check)
+    status, headers, body = Client().chat("I'm 30 and male, I have had a dry cough since yesterday")
+    assert status == 429 and headers[b"retry-after"] == b"7"
+    assert body["rate_limited"] is True
+    assert model.prompts == []
+
+
+def test_turns_over_the_admission_limit_get_503_and_their_message_back(model, monkeypatch):
+    gate = AdmissionGate(1, max_queue=0, max_wait=0)
+    monkeypatch.setattr(asgi, "admission_gate", gate)
+    monkeypatch.setattr(chat_app, "admission_gate", gate)
+    held = gate.admit()
+    try:
+        status, headers, body = Client().chat("I'm 30 and male, I have had a dry cough since yesterday")
+    finally:
+        held.release()
+    assert status == 503 and headers[b"retry-after"] == str(body["retry_after"]).encode()
+    assert body["busy"] is True and body["current_count"] == 0
+    assert model.prompts == []
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tests for batch triage: record parsing, bounded fan-out and resuming a job
+Run with: python -m pytest -q test_batch.py
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from batch import BatchError, BatchRunner, FileJournal, MemoryJournal, parse_records
+
+
+def lines(*records):
+    return [record if isinstance(record, str) else json.dumps(record) for record in records]
+
+
+def test_records_are_validated_and_fill_in_age_and_gender_from_the_message():
+    records = parse_records(lines(
+        {"id": "a", "message": "Headache since this morning", "age": "6 months", "gender": "F"},
+        {"request_id": 7, "message": "34M with a fever of 101 F for 2 days"},
+        "",
+        {"message": "Dry cough", "age": 30},
+        "{not json",
+        {"id": "a", "message": "Sore throat", "age": 40, "gender": "male"},
+    ))
+    assert [(record["index"], record["id"]) for record in records] == [(1, "a"), (2, "7"), (4, "line-4"), (5, "line-5"), (6, "line-6")]
+    assert (records[0]["age"], records[0]["gender"]) == (0.5, "female")
+    assert (records[1]["age"], records[1]["gender"], records[1]["temperature"].unit) == (34, "male", "F")
+    assert records[2]["error"] == "gender is missing or not male or female"
+    assert records[3]["error"].startswith("invalid JSON")
+    assert records[4]["error"] == "duplicate id a"
+
+    with pytest.raises(BatchError):
+        parse_records(["", "  "])
+    with pytest.raises(BatchError, match="at most 1"):
+        parse_records(lines({"message": "a"}, {"message": "b"}), max_records=1)
+
+
+def test_records_are_fanned_out_with_bounded_concurrency():
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def triage(record):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {"status": "ok", "reply": record["message"], "cost": {"prompt_tokens": 10, "completion_tokens": 2, "attempts": 1}}
+
+    records = parse_records(lines(*({"id": str(n), "message": f"cough {n}", "age": 30, "gender": "male"} for n in range(12))))
+    results = list(BatchRunner(triage, concurrency=3).run(records, "job"))
+    assert peak[0] == 3
+    assert sorted(result["id"] for result in results[:-1]) == sorted(str(n) for n in range(12))
+    assert all(result["latency_ms"] >= 20 for result in results[:-1])
+    summary = results[-1]["summary"]
+    assert (summary["ok"], summary["prompt_tokens"], summary["completion_tokens"]) == (12, 120, 24)
+
+
+def test_a_job_resumes_with_only_unfinished_records():
+    answered = []
+    outcomes = {"1": "ok", "2": "unavailable", "3": "ok"}
+
+    def triage(record):
+        answered.append(record["id"])
+        return {"status": outcomes[record["id"]], "reply": "Rest"}
+
+    records = parse_records(lines(*({"id": record_id, "message": "cough", "age": 30, "gender": "male"} for record_id in outcomes)))
+    runner = BatchRunner(triage, concurrency=2, journal=MemoryJournal())
+    first = list(runner.run(records, "job"))
+    assert first[-1]["summary"]["failed"] == 1
+
+    outcomes["2"] = "ok"
+    answered.clear()
+    second = list(runner.run(records, "job"))
+    assert answered == ["2"]
+    assert sorted(result["id"] for result in second[:-1] if result.get("resumed")) == ["1", "3"]
+    assert (second[-1]["summary"]["ok"], second[-1]["summary"]["resumed"]) == (3, 2)
+
+
+def test_records_whose_line_moved_are_answered_again():
+    answered = []
+
+    def triage(record):
+        answered.append(record["message"])
+        return {"status": "ok", "reply": f"About the {record['message']}"}
+
+    runner = BatchRunner(triage, concurrency=1, journal=MemoryJournal())
+    first = lines({"message": "cough", "age": 30, "gender": "male"}, {"message": "rash", "age": 30, "gender": "male"})
+    list(runner.run(parse_records(first), "job"))
+
+    # A line inserted at the top renames the old records: line-2 is now the cough, line-3 the rash
+    answered.clear()
+    second = list(runner.run(parse_records(lines({"message": "fever", "age": 30, "gender": "male"}) + first), "job"))
+    assert sorted(answered) == ["cough", "fever", "rash"]
+    assert {result["id"]: result["reply"] for result in second[:-1]}["line-2"] == "About the cough"
+
+    answered.clear()
+    third = list(runner.run(parse_records(lines({"message": "fever", "age": 30, "gender": "male"}) + first), "job"))
+    assert answered == [] and third[-1]["summary"]["resumed"] == 3
+
+
+def test_file_journal_survives_a_run_killed_mid_write(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text(json.dumps({"id": "1", "status": "ok"}) + "\n" + json.dumps({"id": "2", "status": "busy"}) + "\n" + '{"id": "3", "sta')
+    journal = FileJournal(str(path))
+    assert list(journal.load()) == ["1"]
+
+    journal.save(None, {"id": "3", "status": "ok"})
+    journal.close()
+    assert set(FileJournal(str(path)).load()) == {"1", "3"}
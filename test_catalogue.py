@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for loading, validating and hot-reloading the medication catalogue
+Run with: python -m pytest -q test_catalogue.py
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from catalogue import CATALOGUE_PATH, Catalogue, CatalogueError, parse
+
+ENTRY = {
+    "category": "Eye / Ear Problems", "condition": "Dry Eyes", "medicine": "Carboxymethylcellulose Drops",
+    "form": "Eye Drops", "age_group": "Adults", "dosage": "1-2 drops 3-4 times daily",
+    "examples": "Refresh Tears", "notes": "Lubricating",
+}
+
+
+def catalogue_text(*entries):
+    return "\n".join([json.dumps({"schema": 1})] + [json.dumps(entry) for entry in entries]) + "\n"
+
+
+def write(path, text):
+    # How a deploy should ship the file: write it aside, then rename it into place
+    with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+        handle.write(text)
+    os.replace(f"{path}.tmp", path)
+
+
+def wait_for_reload(catalogue, version):
+    deadline = time.monotonic() + 2
+    while catalogue.current().version == version and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return catalogue.current()
+
+
+def test_shipped_catalogue_is_valid():
+    with open(CATALOGUE_PATH, encoding="utf-8") as handle:
+        data = parse(handle.read())
+    assert len(data) == 10
+    assert sum(len(category["entries"]) for category in data) == 70
+
+
+@pytest.mark.parametrize("text, message", [
+    (json.dumps(ENTRY), "first line"),
+    (catalogue_text({**ENTRY, "dosage": ""}), "dosage"),
+    (catalogue_text({key: value for key, value in ENTRY.items() if key != "notes"}), "missing fields ['notes']"),
+    (catalogue_text({**ENTRY, "price": "10"}), "unknown fields ['price']"),
+    (catalogue_text(ENTRY, ENTRY), "duplicate"),
+    (catalogue_text(ENTRY)[:-20], "invalid JSON"),
+])
+def test_invalid_files_are_rejected(text, message):
+    with pytest.raises(CatalogueError, match=message.replace("[", r"\[").replace("]", r"\]")):
+        parse(text)
+
+
+def test_changed_file_is_swapped_in_with_derived_data_rebuilt(tmp_path):
+    path = str(tmp_path / "medicines.jsonl")
+    write(path, catalogue_text(ENTRY))
+    catalogue = Catalogue(path, check_interval=0.01)
+    builds, reloaded = [], []
+    catalogue.on_reload(reloaded.append)
+
+    first = catalogue.current()
+    assert first.derived("doses", lambda data: builds.append(1) or data[0]["entries"][0]["dosage"]) == ENTRY["dosage"]
+
+    write(path, catalogue_text({**ENTRY, "dosage": "1 drop twice daily"}))
+    second = wait_for_reload(catalogue, first.version)
+    assert second.version != first.version and reloaded == [second]
+    # Rebuilt before the swap, so no reader pays for it
+    assert len(builds) == 2
+    assert second.derived("doses", None) == "1 drop twice daily"
+    # A reader still holding the old snapshot keeps a consistent view
+    assert first.derived("doses", None) == ENTRY["dosage"]
+
+
+def test_a_broken_file_keeps_the_current_version(tmp_path):
+    path = str(tmp_path / "medicines.jsonl")
+    write(path, catalogue_text(ENTRY))
+    catalogue = Catalogue(path, check_interval=0.01)
+    version = catalogue.current().version
+
+    write(path, catalogue_text({**ENTRY, "form": 3}))
+    time.sleep(0.05)
+    assert catalogue.current().version == version
+    assert catalogue.stats()["failures"] == 1
+    assert "form" in catalogue.stats()["last_error"]
+
+    write(path, catalogue_text({**ENTRY, "form": "Gel"}))
+    assert wait_for_reload(catalogue, version).data[0]["entries"][0]["form"] == "Gel"
+    assert catalogue.stats()["last_error"] is None
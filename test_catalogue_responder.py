@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for the rule-based catalogue fast path
+Run with: python -m pytest -q test_catalogue_responder.py
+"""
+
+from catalogue_responder import CatalogueResponder
+
+
+def test_catalogue_only_requests_are_matched():
+    responder = CatalogueResponder()
+    assert responder.match("I need a first aid kit for home") == "First Aid Kit Recommendations"
+    assert responder.match("what should I pack in a travel kit?") == "Travel Essentials"
+    assert responder.match("period cramps", "female") == "Women's Health / Menstrual Care"
+
+
+def test_open_ended_requests_go_to_the_model():
+    responder = CatalogueResponder()
+    assert responder.match("I have a headache") is None
+    assert responder.match("I have fever after my trip") is None
+    assert responder.match("travel kit for my baby") is None
+    assert responder.match("period pain and heavy bleeding for 10 days", "female") is None
+    # Two categories at once is ambiguous
+    assert responder.match("I need a medicine kit for my trip") is None
+
+
+def test_reply_uses_the_structured_format_and_age_group():
+    responder = CatalogueResponder()
+    reply = responder.reply("travel essentials", 30, "male")
+    assert [line.split(":")[0] for line in reply.split("\n")] == [
+        "Possible Cause", "Recommended Steps", "Medications", "When to See a Doctor"
+    ]
+    assert "Loperamide Tablets" in reply
+    # Catalogue doses are adult doses, so children are left to the model
+    assert responder.reply("travel essentials", 8, "male") is None
+    assert "lower doses" in responder.reply("travel essentials", 70, "male")
+
+
+def test_stats_report_share_and_latency_saved():
+    responder = CatalogueResponder()
+    responder.reply("first aid kit", 30, "female")
+    responder.reply("I have a cough", 30, "female")
+    responder.observe_model_latency(2.0)
+
+    stats = responder.stats()
+    assert (stats["handled"], stats["passed_to_model"], stats["share_handled"]) == (1, 1, 0.5)
+    assert 1.9 < stats["latency_saved_seconds"] <= 2.0
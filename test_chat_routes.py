@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests for the chat routes end to end through the Flask test client, with the Gemini model stubbed out
+Run with: python -m pytest -q test_chat_routes.py
+"""
+
+import json
+import os
+from types import SimpleNamespace
+
+# Read when app is imported below
+os.environ.update({
+    "FLASK_ENV": "development",
+    "LOG_LEVEL": "WARNING",
+    "GEMINI_API_KEY_1": "test-key-0001",
+    "RATE_LIMIT_ENABLED": "false",
+    "CONTEXT_CACHE_ENABLED": "false",
+    "SESSION_STORE": "memory",
+})
+
+import pytest
+
+import app as chat_app
+
+REPLY = (
+    "Possible Cause: A viral infection.\n"
+    "Recommended Steps: Rest and drink fluids.\n"
+    "Medications: Paracetamol 500 mg every 6 hours\n"
+    "When to See a Doctor: If it lasts more than 3 days."
+)
+
+
+def usage(prompt_tokens, completion_tokens):
+    return SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=completion_tokens,
+                           total_token_count=prompt_tokens + completion_tokens)
+
+
+class FakeChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = history
+
+    def send_message(self, prompt, stream=False, request_options=None):
+        self.model.prompts.append(prompt)
+        if not stream:
+            return SimpleNamespace(text=self.model.reply, usage_metadata=usage(1000, 50))
+        words = self.model.reply.split(" ")
+        chunks = [SimpleNamespace(parts=[SimpleNamespace(text=" ".join(words[i:i + 5]) + " ")]) for i in range(0, len(words), 5)]
+        return FakeStream(chunks, usage(1000, 50))
+
+
+class FakeStream:
+    def __init__(self, chunks, usage_metadata):
+        self.chunks = chunks
+        self.usage_metadata = usage_metadata
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+class FakeModel:
+    """Stands in for a GenerativeModel built with the system prompt as its instruction"""
+
+    _system_instruction = "system prompt"
+    cached_content = None
+
+    def __init__(self, reply=REPLY):
+        self.reply = reply
+        self.prompts = []
+        self.histories = []
+
+    def start_chat(self, history=None):
+        self.histories.append(list(history or ()))
+        return FakeChat(self, history)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setattr(chat_app, "model_for_key", lambda api_key: (fake, None))
+    chat_app.response_cache.clear()
+    return fake
+
+
+def chat(message, client=None):
+    client = client or chat_app.app.test_client()
+    response = client.post("/chat", json={"message": message})
+    return response.status_code, response.get_json()
+
+
+def introduce(concern, client):
+    """Raise a concern and give the age; the gender, sent next, lets the model answer it"""
+    assert "age" in chat(concern, client)[1]["reply"]
+    assert "gender" in chat("30", client)[1]["reply"]
+
+
+def stream(message, client):
+    response = client.post("/chat/stream", json={"message": message})
+    assert response.mimetype == "text/event-stream"
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_opening_replies_are_cached_only_for_the_same_severity(model):
+    status, mild = chat("I'm 30 and male, I have a fever of 99 F for 2 days")
+    assert status == 200 and "cached" not in mild
+    assert mild["structured"]["possible_cause"] == "A viral infection."
+
+    _, severe = chat("I'm 30 and male, I have a fever of 105 F for 9 days")
+    assert "cached" not in severe
+    assert "105°F" in model.prompts[-1] and "9 days" in model.prompts[-1]
+
+    _, again = chat("I'm 30 and male, I have a fever of 99 F for 2 days")
+    assert again["cached"] is True
+    assert len(model.prompts) == 2
+
+
+def test_turns_carry_only_the_relevant_medication_entries(model):
+    client = chat_app.app.test_client()
+    introduce("My tummy hurts and I have loose motions", client)
+    status, _ = chat("male", client)
+    assert status == 200
+    prompt = model.prompts[-1]
+    assert "Loperamide Tablet" in prompt and "Skin Infections" not in prompt
+    # The model was built with the system prompt as its instruction, so it is not repeated
+    assert not prompt.startswith(chat_app.system_prompt)
+
+
+def test_streamed_reply_arrives_as_tokens_and_joins_the_history(model):
+    client = chat_app.app.test_client()
+    introduce("I have had a dry cough since yesterday", client)
+    events = stream("male", client)
+    assert [name for name, _ in events[:-1]] == ["token"] * (len(events) - 1)
+    assert "".join(data["text"] for _, data in events[:-1]).strip() == REPLY
+    name, done = events[-1]
+    assert name == "done" and done["current_count"] == 1
+    assert done["structured"]["possible_cause"] == "A viral infection."
+
+    # The finished stream was recorded, so the next turn replays it to the model
+    stream("It is worse at night", client)
+    history = model.histories[-1]
+    assert [entry["role"] for entry in history] == ["user", "model"]
+    assert history[1]["parts"][0] == REPLY
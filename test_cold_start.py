@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for the deferred Gemini SDK loading at startup
+Run with: python -m pytest -q test_cold_start.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_app(script, **env):
+    """Run script in a fresh interpreter that has just imported app"""
+    environment = {**os.environ, "FLASK_ENV": "development", "LOG_LEVEL": "WARNING", **env}
+    for name in [name for name in environment if name.startswith("GEMINI_API_KEY")]:
+        environment.pop(name)
+    environment.update(env)
+    result = subprocess.run([sys.executable, "-c", "import app, json, sys\n" + script],
+                            cwd=ROOT, env=environment, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_the_app_defers_the_sdk_until_warm_up():
+    state = run_app(
+        "before = 'google.generativeai' in sys.modules\n"
+        "app.model_pool.warm(app.available_api_keys, 'gemini-1.5-flash', app.system_prompt)\n"
+        "print(json.dumps({'before': before, 'after': 'google.generativeai' in sys.modules,"
+        " 'stats': app.model_pool.stats()}))",
+        GEMINI_API_KEY_1="fake-key-0001",
+    )
+    assert state["before"] is False and state["after"] is True
+    assert state["stats"]["warm"] is True and state["stats"]["models_cached"] == 1
+
+
+def test_health_answers_without_api_keys():
+    health = run_app("print(json.dumps(app.app.test_client().get('/health').get_json()))")
+    assert health["status"] == "degraded"
+    assert health["api_keys"]["total_available"] == 0
+    assert health["model_pool"]["sdk_loaded"] is False
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for Gemini context caching: which failures drop a key's cache, and deleting the caches it drops
+Run with: python -m pytest -q test_context_cache.py
+"""
+
+import time
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from google.api_core import exceptions as api_exceptions
+
+from benchmarks.fake_gemini import FakeGemini
+from context_cache import ContextCacheManager, is_cache_error
+
+KEY = "fake-key-0001"
+
+
+@pytest.fixture
+def fake():
+    server = FakeGemini(latency=0).start()
+    yield server
+    server.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_only_errors_about_the_cache_drop_it():
+    assert is_cache_error(api_exceptions.NotFound("CachedContent not found"))
+    assert is_cache_error(api_exceptions.PermissionDenied("Permission denied on cached content"))
+    assert not is_cache_error(api_exceptions.TooManyRequests("429 quota exceeded"))
+    assert not is_cache_error(api_exceptions.DeadlineExceeded("Deadline Exceeded"))
+    assert not is_cache_error(TimeoutError("read timed out"))
+
+
+def test_dropped_and_replaced_caches_are_deleted(fake):
+    retired = []
+    manager = ContextCacheManager(
+        "gemini-1.5-flash-001", "system prompt", ["medication database"],
+        client_options={"api_endpoint": fake.url}, transport="rest",
+        on_retire=lambda api_key, content: retired.append(content.name),
+    )
+    first = manager.get(KEY)
+    assert list(fake.cached_contents) == [first.name]
+
+    # A rate limit or a timeout says nothing about the cache
+    assert manager.invalidate(KEY, api_exceptions.TooManyRequests("429 quota exceeded")) is False
+    assert manager.invalidate(KEY, api_exceptions.DeadlineExceeded("Deadline Exceeded")) is False
+    assert manager.get(KEY).name == first.name
+
+    assert manager.invalidate(KEY, api_exceptions.NotFound("CachedContent not found")) is True
+    assert retired == [first.name]
+    wait_for(lambda: not fake.cached_contents)
+
+    second = manager.get(KEY)
+    assert second.name != first.name
+    manager.replace_contents(["new medication database"])
+    assert retired == [first.name, second.name]
+    wait_for(lambda: not fake.cached_contents and manager.stats()["deletes"] == 2)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Tests for the patient fact extractor against the labelled corpus in data/
+Run with: python -m pytest -q test_demographics.py
+"""
+
+import json
+import os
+
+import pytest
+
+from demographics import describe_age, extract_patient_facts
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "demographics_corpus.json")
+
+with open(CORPUS_PATH, encoding="utf-8") as handle:
+    CORPUS = json.load(handle)
+
+
+@pytest.mark.parametrize("example", CORPUS, ids=[example["text"] for example in CORPUS])
+def test_corpus(example):
+    facts = extract_patient_facts(example["text"])
+    assert facts.age == example["age"]
+    assert facts.gender == example["gender"]
+    temperature = facts.temperature and {"value": facts.temperature.value, "unit": facts.temperature.unit}
+    assert temperature == example["temperature"]
+    duration = facts.duration and {"value": facts.duration.value, "unit": facts.duration.unit}
+    assert duration == example["duration"]
+
+
+def test_female_is_not_read_as_male():
+    assert extract_patient_facts("I am female").gender == "female"
+    assert extract_patient_facts("female, 30").gender == "female"
+
+
+def test_describe_age():
+    assert describe_age(34) == "34 year old"
+    assert describe_age(0.5) == "6 month old"
+    assert describe_age(1.5) == "18 month old"
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for whole-word health-concern detection and its inflection folding
+Run with: python -m pytest -q test_health_detector.py
+"""
+
+import pytest
+
+from health_detector import HealthConcernDetector, detect_health_concerns, is_health_concern
+
+
+def concepts(text):
+    return [(match.concept, match.term) for match in detect_health_concerns(text)]
+
+
+def test_plurals_fold_to_the_vocabulary_term():
+    assert concepts("my ears hurt") == [("body_part", "ear"), ("pain", "hurt")]
+    assert concepts("I keep getting headaches") == [("headache", "headache")]
+    assert concepts("I have loose motions") == [("digestive", "loose motion")]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("vomited twice", ("digestive", "vomit")),
+    ("I coughed blood", ("respiratory", "cough")),
+    ("sneezed all day", ("respiratory", "sneezing")),
+    ("I cramped up at night", ("pain", "cramp")),
+    ("I feel nauseated", ("digestive", "nauseated")),
+])
+def test_past_tense_and_ing_forms_are_folded(text, expected):
+    assert concepts(text) == [expected]
+
+
+def test_ache_compounds_count_as_an_ache():
+    assert concepts("I have a toothache") == [("pain", "ache")]
+    assert concepts("stomachache since morning") == [("pain", "ache")]
+    assert concepts("my toothaches are back") == [("pain", "ache")]
+    # A compound the vocabulary lists keeps its own concept
+    assert concepts("bad headache") == [("headache", "headache")]
+
+
+@pytest.mark.parametrize("text", [
+    "female", "hello", "what year is it", "We are going to Vegas", "I'm gutted", "good morning doctor",
+])
+def test_words_that_only_contain_a_term_are_not_concerns(text):
+    assert not is_health_concern(text)
+
+
+def test_spans_cover_the_inflected_word():
+    text = "She vomited after lunch"
+    (match,) = HealthConcernDetector({"digestive": ["vomit"]}).detect(text)
+    assert text[match.start:match.end] == "vomited"
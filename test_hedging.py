@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for deadline-bounded, hedged LLM calls and the key pool's circuit breaker
+Run with: python -m pytest -q test_hedging.py
+"""
+
+import asyncio
+import time
+
+from hedging import HedgedCaller
+from key_pool import KeyPool, is_rate_limit_error
+
+
+def make_pool(keys=3, **options):
+    return KeyPool([f"key-{index}" for index in range(keys)], strategy="round_robin", **options)
+
+
+def stalls_on_first_key(lease, timeout):
+    """Key 0 hangs until its timeout, like a stalled connection; the others answer in 20ms"""
+    if lease.index == 0:
+        time.sleep(timeout)
+        raise TimeoutError("Read timed out")
+    time.sleep(0.02)
+    return f"reply from key {lease.index}"
+
+
+def test_stalled_attempt_times_out_and_the_next_key_answers():
+    caller = HedgedCaller(make_pool(), attempt_timeout=0.2, deadline=5, backoff_base=0.01)
+    started = time.monotonic()
+    lease, value = caller.call(stalls_on_first_key)
+    assert value == "reply from key 1"
+    assert time.monotonic() - started < 1.0
+    assert caller.stats()["attempt_timeouts"] == 1
+
+
+def test_hedge_wins_before_the_stalled_attempt_times_out():
+    caller = HedgedCaller(make_pool(), attempt_timeout=5, deadline=10, hedge=True, hedge_min_delay=0.1)
+    started = time.monotonic()
+    lease, value = caller.call(stalls_on_first_key)
+    assert value == "reply from key 1"
+    assert time.monotonic() - started < 1.0
+    stats = caller.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_deadline_bounds_the_whole_call():
+    def always_stalls(lease, timeout):
+        time.sleep(timeout)
+        raise TimeoutError("Read timed out")
+
+    caller = HedgedCaller(make_pool(), attempt_timeout=0.2, deadline=0.5, max_attempts=10, backoff_base=0.01)
+    started = time.monotonic()
+    assert caller.call(always_stalls) == (None, None)
+    assert time.monotonic() - started < 0.8
+    assert caller.stats()["deadline_exceeded"] == 1
+
+
+def test_failures_back_off_and_stop_after_max_attempts():
+    calls = []
+
+    def always_fails(lease, timeout):
+        calls.append(time.monotonic())
+        raise RuntimeError("500 Internal error encountered.")
+
+    caller = HedgedCaller(make_pool(keys=2), deadline=5, max_attempts=3, backoff_base=0.05, backoff_cap=0.05)
+    assert caller.call(always_fails) == (None, None)
+    assert len(calls) == 3
+    assert caller.stats()["exhausted"] == 1
+
+
+def test_circuit_breaker_skips_a_failing_key_then_trials_it():
+    pool = make_pool(keys=2, breaker_threshold=2, breaker_cooldown=0.2)
+    for _ in range(2):
+        lease = pool.acquire(exclude={1})
+        lease.fail(RuntimeError("503 Service Unavailable"))
+    assert pool.stats()["keys"][0]["circuit"] == "open"
+    assert pool.acquire(exclude={1}) is None
+
+    time.sleep(0.25)
+    trial = pool.acquire(exclude={1})
+    assert trial is not None and pool.stats()["keys"][0]["circuit"] == "half_open"
+    # Only the one trial attempt while half open
+    assert pool.acquire(exclude={1}) is None
+    trial.succeed()
+    assert pool.stats()["keys"][0]["circuit"] == "closed"
+
+
+def test_port_numbers_are_not_rate_limits():
+    assert not is_rate_limit_error(OSError("HTTPConnectionPool(host='127.0.0.1', port=34291): Read timed out."))
+    assert is_rate_limit_error(RuntimeError("429 Resource has been exhausted"))
+
+
+def test_async_hedge_cancels_the_losing_attempt():
+    pool = make_pool()
+
+    async def attempt(lease, timeout):
+        await asyncio.sleep(timeout if lease.index == 0 else 0.02)
+        return f"reply from key {lease.index}"
+
+    caller = HedgedCaller(pool, attempt_timeout=5, deadline=10, hedge=True, hedge_min_delay=0.1)
+    lease, value = asyncio.run(caller.call_async(attempt))
+    assert value == "reply from key 1"
+    # The cancelled attempt gave its key back without counting as a failure
+    assert [(key["in_flight"], key["failures"]) for key in pool.stats()["keys"]] == [(0, 0), (0, 0), (0, 0)]
+
+
+def test_late_hedged_stream_is_discarded_with_its_key():
+    discarded = []
+
+    def attempt(lease, timeout):
+        time.sleep(0.3 if lease.index == 0 else 0.02)
+        chunks = (word for word in f"reply from key {lease.index}".split())
+        next(chunks)
+        return chunks
+
+    def discard(lease, chunks):
+        chunks.close()
+        discarded.append((lease.index, next(chunks, None)))
+
+    caller = HedgedCaller(make_pool(), attempt_timeout=5, deadline=10, hedge=True, hedge_min_delay=0.1)
+    lease, chunks = caller.call(attempt, hold=True, discard=discard)
+    assert (lease.index, list(chunks)) == (1, ["from", "key", "1"])
+    lease.succeed()
+    deadline = time.monotonic() + 2
+    while not discarded and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # The slow first attempt finished after the hedge won: closed, and reported with the key it ran on
+    assert discarded == [(0, None)]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted conversation history
+Run with: python -m pytest -q test_history_manager.py
+"""
+
+from history_manager import HistoryManager, estimate_tokens
+from session_store import new_context
+
+QUESTIONS = [
+    "I have had a headache since this morning",
+    "It gets worse when I look at screens",
+    "Can I take paracetamol with my blood pressure tablets?",
+    "I also feel a bit feverish tonight",
+    "How much water should I be drinking?",
+]
+
+REPLY = (
+    "**Assessment:** A tension-type headache is the most likely cause given what you describe. "
+    "**Recommendations:** Rest away from screens, stay hydrated and consider paracetamol 500mg "
+    "every 6 hours, no more than 4 doses a day. **When to see a doctor:** If the pain is sudden "
+    "and severe, or comes with a stiff neck, confusion or vision changes, seek care urgently."
+)
+
+
+def prompt_tokens(manager, context, message):
+    history = manager.chat_history(context)
+    return sum(estimate_tokens(part) for entry in history for part in entry["parts"]) + estimate_tokens(message)
+
+
+def run_conversation(manager, turns):
+    context = new_context()
+    context.age, context.gender = 34, "female"
+    sizes = []
+    for turn in range(turns):
+        message = f"{QUESTIONS[turn % len(QUESTIONS)]} (turn {turn + 1})"
+        sizes.append(prompt_tokens(manager, context, message))
+        manager.record(context, message, REPLY * (1 + turn % 3))
+    return context, sizes
+
+
+def test_prompt_tokens_stay_flat_over_fifty_turns():
+    manager = HistoryManager(max_turns=4, token_budget=1200, summary_budget=300)
+    context, sizes = run_conversation(manager, 50)
+
+    ceiling = manager.token_budget + manager.summary_budget + 200
+    assert max(sizes) <= ceiling
+    # Once the window is full, later turns cost the same as earlier ones (give or take the turn numbers)
+    assert max(sizes[25:]) <= max(sizes[10:25]) + 10
+    assert max(sizes[40:]) - min(sizes[40:]) < manager.summary_budget
+    assert len(context.history) <= 2 * manager.max_turns
+
+
+def test_unbounded_history_would_grow():
+    # Sanity check of the measurement: with effectively no budget the prompt grows every turn
+    manager = HistoryManager(max_turns=1000, token_budget=10 ** 9, summary_budget=10 ** 9)
+    _, sizes = run_conversation(manager, 50)
+    assert sizes[-1] > 10 * sizes[5]
+
+
+def test_patient_facts_stay_pinned():
+    manager = HistoryManager(max_turns=2, token_budget=600, summary_budget=100)
+    context, _ = run_conversation(manager, 50)
+
+    background = manager.chat_history(context)[0]["parts"][0]
+    assert "34, female" in background
+    assert "Presenting concern: I have had a headache since this morning (turn 1)" in background
+    assert context.summarized_turns == 50 - len(context.history) // 2
+
+
+def test_history_alternates_roles():
+    manager = HistoryManager(max_turns=3)
+    context, _ = run_conversation(manager, 12)
+
+    roles = [entry["role"] for entry in manager.chat_history(context)]
+    assert roles == ["user", "model"] * (len(roles) // 2)
+
+
+def test_summary_is_incremental():
+    manager = HistoryManager(max_turns=2, token_budget=10 ** 6, summary_budget=10 ** 6)
+    context, _ = run_conversation(manager, 6)
+    earlier = context.summary
+
+    manager.record(context, "One more question", REPLY)
+    assert context.summary[:-1] == earlier
+    assert context.summary[-1].startswith("Patient:")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for per-request API key leases: selection, rate-limit benching and thread safety
+Run with: python -m pytest -q test_key_pool.py
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from key_pool import KeyPool, retry_after_seconds
+
+
+def keys(count):
+    return [f"key-{index}" for index in range(count)]
+
+
+def test_round_robin_spreads_leases_over_every_key():
+    pool = KeyPool(keys(3), strategy="round_robin")
+    leases = [pool.acquire() for _ in range(6)]
+    assert [lease.index for lease in leases] == [0, 1, 2, 0, 1, 2]
+    for lease in leases:
+        lease.succeed()
+    assert [key["successes"] for key in pool.stats()["keys"]] == [2, 2, 2]
+
+
+def test_least_loaded_picks_the_key_with_fewest_calls_in_flight():
+    pool = KeyPool(keys(3))
+    held = [pool.acquire() for _ in range(3)]
+    held[1].succeed()
+    assert pool.acquire().index == held[1].index
+    assert pool.acquire(exclude={0, 1, 2}) is None
+
+
+def test_a_rate_limited_key_is_benched_for_its_retry_after():
+    pool = KeyPool(keys(2), strategy="round_robin")
+    error = RuntimeError("429 Resource has been exhausted")
+    error.response = SimpleNamespace(headers={"Retry-After": "30"})
+    assert retry_after_seconds(error) == 30.0
+
+    pool.acquire().fail(error)
+    stats = pool.stats()
+    assert stats["available"] == 1 and stats["keys"][0]["rate_limited"] == 1
+    assert 29 < stats["keys"][0]["cooldown_remaining"] <= 30
+    # Only the other key is handed out until the cooldown ends
+    assert {pool.acquire().index for _ in range(3)} == {1}
+
+
+def test_concurrent_requests_never_lose_or_share_a_lease():
+    pool = KeyPool(keys(4))
+    peak = [0] * 4
+    in_use = [0] * 4
+    lock = threading.Lock()
+
+    def request():
+        for _ in range(200):
+            lease = pool.acquire()
+            with lock:
+                in_use[lease.index] += 1
+                peak[lease.index] = max(peak[lease.index], in_use[lease.index])
+            time.sleep(0)
+            with lock:
+                in_use[lease.index] -= 1
+            lease.succeed()
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()["keys"]
+    assert sum(key["successes"] for key in stats) == 1600
+    assert all(key["in_flight"] == 0 for key in stats)
+    # Eight threads on four least-loaded keys: no key ever carried more than its share
+    assert max(peak) <= 2 and all(key["successes"] for key in stats)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for stage spans, latency histograms, per-key percentiles and the /metrics route
+Run with: python -m pytest -q test_metrics.py
+"""
+
+import logging
+
+import pytest
+
+import metrics
+from key_pool import KeyPool
+from metrics import Histogram, RollingWindow
+
+
+@pytest.fixture
+def mode():
+    previous = metrics._mode
+    yield metrics.configure
+    metrics.configure(previous)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test latencies", ("stage",), buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(seconds, "llm")
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{stage="llm",le="0.1"} 1',
+        'test_seconds_bucket{stage="llm",le="1.0"} 3',
+        'test_seconds_bucket{stage="llm",le="+Inf"} 4',
+        'test_seconds_sum{stage="llm"} 4.25',
+        'test_seconds_count{stage="llm"} 4',
+    ]
+
+
+def test_rolling_window_reports_percentiles_and_error_rate():
+    window = RollingWindow()
+    for index in range(100):
+        window.add((index + 1) / 1000, ok=index % 10 != 0)
+    stats = window.stats()
+    assert (stats["samples"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]) == (100, 51.0, 96.0, 100.0)
+    assert stats["error_rate"] == 0.1
+    assert RollingWindow().stats()["p95_ms"] is None
+
+
+def test_trace_mode_logs_each_requests_spans(mode, caplog):
+    mode("trace")
+    token = metrics.begin_trace()
+    with metrics.stage("parse"):
+        pass
+    metrics.observe_llm_attempt(1, 0.25, ok=False)
+    with caplog.at_level(logging.INFO, logger="metrics"):
+        metrics.end_trace(token, "POST /chat")
+    assert "Trace POST /chat: parse=" in caplog.text
+    assert "llm_attempt[key 2, failed]=250.00ms" in caplog.text
+
+
+def test_off_mode_records_nothing(mode):
+    mode("off")
+    before = metrics.render()
+    with metrics.stage("parse"):
+        pass
+    metrics.observe_llm_attempt(0, 0.1, ok=True)
+    assert metrics.render() == before
+
+
+def test_metrics_route_exports_stage_and_per_key_attempt_histograms(monkeypatch):
+    # Read when app is first imported
+    monkeypatch.setenv("GEMINI_API_KEY_1", "test-key-0001")
+    import app as chat_app
+
+    with metrics.stage("keyword_detection"):
+        pass
+    KeyPool(["key-a", "key-b"], strategy="round_robin").acquire().succeed()
+    response = chat_app.app.test_client().get("/metrics")
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert 'curaai_chat_stage_seconds_count{stage="keyword_detection"}' in body
+    assert 'curaai_llm_attempt_seconds_bucket{key="1",outcome="success",le="+Inf"}' in body
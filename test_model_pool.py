@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for reusing GenerativeModel handles across requests, retries and threads
+Run with: python -m pytest -q test_model_pool.py
+"""
+
+import threading
+
+import pytest
+
+from model_pool import ModelPool
+
+pytest.importorskip("google.generativeai")
+
+MODEL = "gemini-1.5-flash"
+
+
+def test_handles_are_built_once_per_key_model_and_instruction():
+    pool = ModelPool(transport="rest")
+    first = pool.get("key-1", MODEL, "system prompt")
+    assert pool.get("key-1", MODEL, "system prompt") is first
+    assert pool.get("key-2", MODEL, "system prompt") is not first
+    assert pool.get("key-1", MODEL, "another prompt") is not first
+    # Each handle calls Gemini with its own key's client, not the global genai.configure()
+    assert first._client is pool.client_for_key("key-1")
+    assert pool.get("key-2", MODEL, "system prompt")._client is not first._client
+
+    stats = pool.stats()
+    assert (stats["models_cached"], stats["misses"], stats["hits"]) == (3, 3, 2)
+    assert stats["hit_rate"] == 0.4
+
+
+def test_concurrent_requests_share_one_handle():
+    pool = ModelPool(transport="rest")
+    handles = []
+    start = threading.Barrier(8)
+
+    def request():
+        start.wait()
+        handles.append(pool.get("key-1", MODEL, "system prompt"))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(handle) for handle in handles}) == 1
+    assert pool.stats()["misses"] == 1
+
+
+def test_clear_drops_handles_after_the_prompt_changes():
+    pool = ModelPool(transport="rest")
+    first = pool.get("key-1", MODEL, "system prompt")
+    pool.clear()
+    assert pool.get("key-1", MODEL, "system prompt") is not first
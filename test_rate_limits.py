@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-session and per-IP chat quotas
+Run with: python -m pytest -q test_rate_limits.py
+"""
+
+import time
+
+from flask import Flask, jsonify, session
+
+from rate_limits import ChatRateLimits
+
+
+def make_app(**options):
+    app = Flask(__name__)
+    app.secret_key = "test"
+    limits = ChatRateLimits(app, **options)
+    calls = []
+
+    @app.route("/chat", methods=["POST"])
+    @limits
+    def chat():
+        calls.append(1)
+        session.setdefault("user_id", f"user-{len(calls)}")
+        return jsonify({"reply": "ok"})
+
+    @app.route("/chat/stream", methods=["POST"])
+    @limits
+    def chat_stream():
+        calls.append(1)
+        return jsonify({"reply": "ok"})
+
+    return app, limits, calls
+
+
+def test_session_quota_is_shared_by_both_chat_routes():
+    app, limits, calls = make_app(per_session="3/minute", per_ip="100/minute")
+    client = app.test_client()
+    client.post("/chat")
+    statuses = [client.post(path).status_code for path in ("/chat", "/chat/stream", "/chat", "/chat/stream")]
+    assert statuses == [200, 200, 200, 429]
+    # The rejected request never reached the view
+    assert len(calls) == 4
+    assert limits.stats()["rejected"] == {"session": 1, "ip": 0}
+
+
+def test_ip_quota_covers_fresh_sessions():
+    app, limits, calls = make_app(per_session="100/minute", per_ip="3/minute")
+    # A new cookie-less client per request, as when a script drops the session
+    statuses = [app.test_client().post("/chat").status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+    assert limits.stats()["rejected"] == {"session": 0, "ip": 1}
+
+
+def test_retry_after_counts_down_from_the_oldest_request():
+    app, limits, _ = make_app(per_session="1/3second", per_ip="100/minute")
+    client = app.test_client()
+    client.post("/chat")
+    client.post("/chat")
+    time.sleep(1.2)
+    response = client.post("/chat")
+    assert response.status_code == 429
+    # The oldest request ages out 1.8s from now; reset_at is a whole-second timestamp
+    assert response.headers["Retry-After"] in ("2", "3")
+    assert response.get_json()["rate_limited"] is True
+
+
+def test_check_outside_the_view_and_disabled_limits():
+    app, limits, _ = make_app(per_session="100/minute", per_ip="1/minute")
+    with app.test_request_context("/chat", method="POST", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert limits.check() is None
+    with app.test_request_context("/chat", method="POST", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert limits.check().status_code == 429
+
+    app, limits, _ = make_app(per_session="1/minute", per_ip="1/minute", enabled=False)
+    client = app.test_client()
+    assert [client.post("/chat").status_code for _ in range(3)] == [200, 200, 200]
+    assert limits.stats() == {"enabled": False}
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for structured replies: section parsing and medicines checked against the catalogue
+Run with: python -m pytest -q test_reply_structure.py
+"""
+
+from catalogue import Snapshot
+from reply_structure import MedicationLookup, parse_reply, structure_reply
+
+DATA = [{"category": "Pain", "entries": [
+    {"medicine": "Ibuprofen", "examples": "Brufen, Advil", "dosage": "200 mg", "age_group": "Adults"},
+    {"medicine": "Paracetamol Tablets", "examples": "Crocin, Dolo 650", "dosage": "500 mg", "age_group": "All Ages"},
+    {"medicine": "Ibuprofen + Paracetamol Kit", "examples": "Ibuprofen, Combiflam", "dosage": "1 tablet", "age_group": "Adults"},
+]}]
+
+
+def test_headings_are_found_in_any_markdown_or_numbering():
+    sections = parse_reply(
+        "Hello there.\n**Possible Cause:** A cold.\n2. Recommended Steps - Rest.\n"
+        "medications:\n- Paracetamol\n### When to See a Doctor: After 3 days.\nMedicine: Fluids too."
+    )
+    assert sections == {
+        "intro": "Hello there.",
+        "possible_cause": "A cold.",
+        "recommended_steps": "Rest.",
+        "medications": "- Paracetamol\nFluids too.",
+        "see_a_doctor": "After 3 days.",
+    }
+    assert parse_reply("Could you tell me how old the patient is?") is None
+    assert structure_reply("Could you tell me how old the patient is?") is None
+
+
+def test_names_and_brands_match_their_entries_with_age_checks():
+    lookup = MedicationLookup(DATA)
+    assert [mentioned for mentioned, _ in lookup.find("Dolo 650 twice daily")] == ["dolo 650"]
+    # A brand never shadows the medicine of the same name
+    assert lookup.names["ibuprofen"][0]["medicine"] == "Ibuprofen"
+
+    structured = structure_reply(
+        "Possible Cause: Fever.\nMedications:\n- Ibuprofen 200 mg (Brufen, Advil)\n- Crocin 500 mg; 2 drops each nostril",
+        age=5, snapshot=Snapshot(DATA, "test"),
+    )
+    assert [(medicine["name"], medicine["catalogue"], medicine["suits_age"]) for medicine in structured["medicines"]] == [
+        ("ibuprofen", "Ibuprofen", False), ("crocin", "Paracetamol Tablets", True),
+    ]
+    assert structured["warnings"] == ["Ibuprofen is listed for Adults only; check it suits a patient aged 5"]
+    assert structured["unverified"] == []
+
+
+def test_dosed_medicines_missing_from_the_catalogue_are_unverified():
+    structured = structure_reply(
+        "Medications:\n* Azithromycin 500 mg once daily\n* Paracetamol 500 mg\n* 2 drops each nostril\n* Plenty of fluids",
+        age=30, snapshot=Snapshot(DATA, "test"),
+    )
+    assert structured["unverified"] == ["Azithromycin"]
+    assert [medicine["catalogue"] for medicine in structured["medicines"]] == ["Paracetamol Tablets"]
+    assert structured["possible_cause"] is None and structured["warnings"] == []
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the opening-turn response cache
+Run with: python -m pytest -q test_response_cache.py
+"""
+
+import time
+
+from response_cache import ResponseCache, age_group
+
+
+def test_key_normalizes_concern_and_buckets_age():
+    cache = ResponseCache()
+    key, _ = cache.key("I have a headache, I am 30 and male", 30, "male")
+    other, _ = cache.key("headaches please", 41, "male")
+    assert key == other == ("headache", "adult", "male", None, None)
+    assert cache.key("hello", 30, "male") is None
+
+
+def test_temperature_and_duration_keep_severities_apart():
+    cache = ResponseCache()
+    mild, _ = cache.key("fever of 99 F for 2 days", 30, "male", "99°F (37.2°C)", "2 days")
+    severe, _ = cache.key("fever of 105 F for 9 days", 30, "male", "105°F (40.6°C)", "9 days")
+    assert mild != severe
+    assert mild == ("day fever", "adult", "male", "99°F (37.2°C)", "2 days")
+    # Numbers the key can't account for get no key at all
+    assert cache.key("fever, vomited 6 times", 30, "male") is None
+    assert cache.key("I'm 30 with a fever, took 2 tablets", 30, "male") is None
+    assert cache.key("my 6 month old has a fever", 0.5, "female") is not None
+
+
+def test_negated_concerns_get_no_key():
+    cache = ResponseCache()
+    assert cache.key("fever but no headache", 30, "male") is None
+    assert cache.key("headache but no fever", 30, "male") is None
+    assert cache.key("I don't have a fever, just a headache", 30, "male") is None
+    assert cache.key("headache without nausea", 30, "male") is None
+    # Words that merely contain a negation still get keyed
+    assert cache.key("nose bleed at night", 30, "male") is not None
+
+
+def test_age_groups_follow_the_prompt_guidelines():
+    assert [age_group(age) for age in (1, 4, 8, 30, 70)] == ["infant", "child 2-6", "child 6-12", "adult", "elderly"]
+
+
+def test_exact_hits_and_misses_are_counted():
+    cache = ResponseCache()
+    key = cache.key("I need a first aid kit", 30, "female")
+    assert cache.get(key) is None
+    cache.put(key, "A basic kit contains...")
+    assert cache.get(cache.key("first aid kits", 35, "female")) == "A basic kit contains..."
+    assert cache.get(cache.key("first aid kits", 35, "male")) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (1, 2, 1)
+
+
+def test_similarity_matching_is_optional():
+    exact = ResponseCache()
+    similar = ResponseCache(similarity=0.6)
+    for cache in (exact, similar):
+        cache.put(cache.key("bad headache and fever", 30, "male"), "Rest and paracetamol")
+
+    assert exact.get(exact.key("headache with fever", 30, "male")) is None
+    assert similar.get(similar.key("headache with fever", 30, "male")) == "Rest and paracetamol"
+    assert similar.get(similar.key("headache with fever", 70, "male")) is None
+    assert similar.stats()["similar_hits"] == 1
+
+
+def test_lru_cap_and_expiry():
+    cache = ResponseCache(max_entries=2, ttl_seconds=0.05)
+    for concern in ("cough", "fever", "rash"):
+        cache.put(cache.key(concern, 30, "male"), concern)
+    assert cache.get(cache.key("cough", 30, "male")) is None
+    assert cache.stats()["evictions"] == 1
+
+    time.sleep(0.06)
+    assert cache.get(cache.key("rash", 30, "male")) is None
+    assert cache.stats()["expirations"] == 1
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tests for picking the medication entries sent to the model with each turn
+Run with: python -m pytest -q test_retrieval.py
+"""
+
+from retrieval import (
+    build_full_medication_context,
+    build_medication_context,
+    conversation_text,
+    select_entries,
+)
+
+GASTRIC = "Gastric Issues (Acidity, Gas, Constipation, Diarrhea)"
+
+
+def test_only_the_concerns_categories_are_sent():
+    context = build_medication_context("my tummy hurts and I have loose motions", age=30)
+    assert f"{GASTRIC}:" in context and "Loperamide Tablet" in context
+    assert "Skin Infections" not in context
+    assert len(context) < len(build_full_medication_context()) / 3
+
+
+def test_entries_outside_the_patients_age_are_left_out():
+    adult = [entry["medicine"] for entry in select_entries("tummy ache and loose motions", age=30)[GASTRIC]]
+    infant = select_entries("tummy ache and loose motions", age=1)[GASTRIC]
+    assert "Loperamide Tablet" in adult
+    assert "Loperamide Tablet" not in [entry["medicine"] for entry in infant]
+    assert all(entry["age_group"] in ("All Ages", "Infants/Children") for entry in infant)
+
+
+def test_earlier_turns_keep_the_consultation_on_topic():
+    assert select_entries("it got worse", age=30) == {}
+    text = conversation_text("it got worse", ["I have a dry cough"])
+    assert "Cough, Cold, Nasal Congestion, Allergies" in select_entries(text, age=30)
+
+
+def test_a_concern_matching_nothing_lists_the_categories():
+    context = build_medication_context("qwerty")
+    assert context.startswith("MEDICATION DATABASE ENTRIES: none matched")
+    assert "Travel Essentials" in context
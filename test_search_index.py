@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the inverted-index medicine search and its /medicines/search route
+Run with: python -m pytest -q test_search_index.py
+"""
+
+from search_index import MedicineIndex
+
+
+def entry(condition, medicine, form="Tablet", age_group="Adults", examples="", notes=""):
+    return {"condition": condition, "medicine": medicine, "form": form, "age_group": age_group,
+            "dosage": "As directed", "examples": examples, "notes": notes}
+
+
+CATALOGUE = [
+    {"category": "Gastric Issues", "entries": [
+        entry("Stomach Acidity", "Antacid Suspension", form="Liquid", examples="Gelusil"),
+        entry("Diarrhea", "Loperamide Tablet", examples="Imodium", notes="Not for children"),
+        entry("Dehydration", "Oral Rehydration Salts", form="Powder", age_group="All Ages"),
+    ]},
+    {"category": "Fever", "entries": [
+        entry("Fever", "Paracetamol Tablet", age_group="All Ages", examples="Crocin"),
+        entry("Fever in Children", "Paracetamol Syrup", form="Syrup", age_group="Children (2-12 years)"),
+    ]},
+]
+
+
+def medicines(results):
+    return [result["medicine"] for result in results]
+
+
+def test_exact_terms_rank_the_matching_field_first():
+    index = MedicineIndex(CATALOGUE)
+    results = index.search("loperamide diarrhea")
+    assert medicines(results)[0] == "Loperamide Tablet"
+    assert results == sorted(results, key=lambda result: -result["score"])
+
+
+def test_synonyms_prefixes_and_typos_still_match():
+    index = MedicineIndex(CATALOGUE)
+    assert medicines(index.search("tummy"))[0] == "Antacid Suspension"
+    assert medicines(index.search("lopera")) == ["Loperamide Tablet"]
+    assert "Paracetamol Tablet" in medicines(index.search("paracetmol"))
+
+
+def test_facets_filter_the_results():
+    index = MedicineIndex(CATALOGUE)
+    assert medicines(index.search("fever", form="syrup")) == ["Paracetamol Syrup"]
+    assert medicines(index.search("fever", age=30)) == ["Paracetamol Tablet"]
+    # Filters alone list what they allow, in catalogue order
+    assert medicines(index.search("", category="gastric issues", limit=2)) == ["Antacid Suspension", "Loperamide Tablet"]
+
+
+def test_age_filters_are_cached_per_age_group_not_per_age():
+    index = MedicineIndex(CATALOGUE)
+    for age in range(0, 121):
+        index.search("fever", age=age)
+    # Infants, children and adults: one entry each, however many ages were asked for
+    assert len(index._age_cache) == 3
+    assert medicines(index.search("fever", age=7)) == ["Paracetamol Tablet", "Paracetamol Syrup"]
+
+
+def test_search_route_validates_and_ranks(monkeypatch):
+    # Read when app is first imported
+    monkeypatch.setenv("GEMINI_API_KEY_1", "test-key-0001")
+    import app as chat_app
+
+    client = chat_app.app.test_client()
+    assert client.get("/medicines/search").status_code == 400
+    assert client.get("/medicines/search?q=fever&limit=x").status_code == 400
+    assert client.get("/medicines/search?q=fever&age=500").status_code == 400
+    assert client.get("/medicines/search?q=fever&age=-1").status_code == 400
+    body = client.get("/medicines/search?q=diarrhea&age=30&limit=3").get_json()
+    assert body["filters"] == {"age": 30} and 0 < body["count"] <= 3
+    assert "Loperamide" in body["results"][0]["medicine"]
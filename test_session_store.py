@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the slotted session state and the stores that keep it
+Run with: python -m pytest -q test_session_store.py
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, RedisSessionStore, SessionState, new_context
+
+
+def test_gemini_history_is_built_from_alternating_turns():
+    context = new_context()
+    context.add_exchange("I have a headache", "Rest and drink water.")
+    context.add_exchange("Since this morning", "Try paracetamol.")
+    assert context.user_turns() == ("I have a headache", "Since this morning")
+    assert context.gemini_history() == [
+        {"role": "user", "parts": ["I have a headache"]},
+        {"role": "model", "parts": ["Rest and drink water."]},
+        {"role": "user", "parts": ["Since this morning"]},
+        {"role": "model", "parts": ["Try paracetamol."]},
+    ]
+    with pytest.raises(AttributeError):
+        context.notes = "slotted states take no new attributes"
+
+
+def test_memory_store_hands_out_private_copies():
+    store = MemorySessionStore()
+    context = new_context()
+    context.add_exchange("hello", "hi")
+    store.save_context("user", context)
+    context.age = 40
+    context.add_exchange("more", "reply")
+
+    saved = store.get_context("user")
+    assert (saved.age, saved.history) == (None, ("hello", "hi"))
+    saved.gender = "female"
+    assert store.get_context("user").gender is None
+    assert store.stats()["bytes"] > 0
+
+
+def test_redis_round_trip_reads_the_older_dict_format():
+    fakeredis = pytest.importorskip("fakeredis")
+    store = RedisSessionStore(client=fakeredis.FakeRedis())
+    context = SessionState(age=34, gender="female", summarized_turns=2, summary=("Patient: earlier",))
+    context.add_exchange("hello", "hi")
+    store.save_context("user", context)
+    assert store.get_context("user") == context
+
+    legacy = {
+        "age": 34, "gender": "female", "summary": [], "summarized_turns": 0,
+        "history": [{"role": "user", "parts": ["hello"]}, {"role": "model", "parts": ["hi"]}],
+        "has_addressed_initial_concern": True,
+    }
+    store.redis.set(store._context_key("old"), json.dumps(legacy))
+    restored = store.get_context("old")
+    assert restored.history == ("hello", "hi")
+    assert restored.has_addressed_initial_concern is True
+
+
+def test_message_counter_is_atomic_and_stops_at_the_limit():
+    store = MemorySessionStore()
+    counts = []
+
+    def send():
+        for _ in range(50):
+            counts.append(store.increment_message_count("user", limit=120))
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(count for count in counts if count is not None) == list(range(1, 121))
+    assert counts.count(None) == 80 and store.get_message_count("user") == 120
+
+    store.reset_message_count("user")
+    store.refund_message_count("user")
+    assert store.get_message_count("user") == 0
+
+
+def test_idle_sessions_expire_and_the_least_recent_is_evicted():
+    store = MemorySessionStore(idle_ttl=0.05, max_sessions=2)
+    for user_id in ("a", "b"):
+        store.save_context(user_id, new_context())
+    store.get_context("a")
+    store.save_context("c", new_context())
+    # "b" was used least recently, so it made room for "c"
+    assert [store.get_context(user_id) is not None for user_id in ("a", "b", "c")] == [True, False, True]
+    assert store.stats()["evictions"] == 1
+
+    time.sleep(0.06)
+    assert store.get_context("a") is None and store.get_message_count("c") == 0
+    assert store.stats()["expirations"] >= 1
+
+
+def test_redis_stores_share_counts_between_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    first = RedisSessionStore(client=fakeredis.FakeRedis(server=server), idle_ttl=60)
+    second = RedisSessionStore(client=fakeredis.FakeRedis(server=server), idle_ttl=60)
+
+    assert first.increment_message_count("user", limit=2) == 1
+    assert second.increment_message_count("user", limit=2) == 2
+    assert first.increment_message_count("user", limit=2) is None
+    assert second.get_message_count("user") == 2
+    second.add_token_usage("user", 100, 20)
+    assert first.add_token_usage("user", 50, 5) == (150, 25)
+    assert 0 < first.redis.ttl(first._count_key("user")) <= 60
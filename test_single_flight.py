@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing of duplicate chat requests
+Run with: python -m pytest -q test_single_flight.py
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_duplicates_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    def request():
+        flight, leader = flights.join(("user", "I have a headache", 0))
+        if not leader:
+            return flight.wait(5)
+        calls.append(1)
+        time.sleep(0.2)
+        flights.finish(flight, ("Rest and fluids", 200))
+        return flight.result
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: request(), range(8)))
+
+    assert len(calls) == 1
+    assert results == [("Rest and fluids", 200)] * 8
+    stats = flights.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 7, 0)
+
+
+def test_finished_flights_are_not_reused_without_an_idempotency_key():
+    flights = SingleFlight()
+    flight, leader = flights.join(("user", "thanks", 2))
+    flights.finish(flight, ("You're welcome", 200), remember=True)
+    assert flights.join(("user", "thanks", 2))[1] is True
+
+
+def test_idempotency_key_replays_a_remembered_result():
+    flights = SingleFlight(result_ttl=60)
+    flight, _ = flights.join(("user", "I have a cough", 0), ("user", "key-1"))
+    flights.finish(flight, ("Honey and warm water", 200), remember=True)
+
+    # The retry reaches the server after the history has moved on
+    replay, leader = flights.join(("user", "I have a cough", 1), ("user", "key-1"))
+    assert not leader
+    assert replay.wait(0) == ("Honey and warm water", 200)
+    assert flights.stats()["replayed"] == 1
+
+
+def test_failures_are_not_remembered_and_expire():
+    flights = SingleFlight(result_ttl=0.05)
+    flight, _ = flights.join(("user", "fever", 0), ("user", "key-1"))
+    flights.finish(flight, ("Sorry, unavailable", 200), remember=False)
+    assert flights.join(("user", "fever", 0), ("user", "key-1"))[1] is True
+
+    flight, _ = flights.join(("user", "rash", 0), ("user", "key-2"))
+    flights.finish(flight, ("Calamine lotion", 200), remember=True)
+    time.sleep(0.1)
+    assert flights.join(("user", "rash", 0), ("user", "key-2"))[1] is True
+
+
+def test_abandoned_leader_releases_waiters():
+    flights = SingleFlight()
+    flight, _ = flights.join(("user", "headache", 0))
+    follower, leader = flights.join(("user", "headache", 0))
+    assert not leader
+
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(follower.wait(5)))
+    waiter.start()
+    flights.finish(flight, None)
+    flights.finish(flight, ("too late", 200))
+    waiter.join(1)
+    assert waited == [None]
+    assert flights.stats()["abandoned"] == 1
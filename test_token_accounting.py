@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for token accounting: per-key and per-hour totals and the session token budget
+Run with: python -m pytest -q test_token_accounting.py
+"""
+
+import threading
+
+import pytest
+
+import token_accounting
+from session_store import MemorySessionStore, RedisSessionStore
+from token_accounting import TokenLedger
+
+
+def test_calls_from_many_threads_add_up_per_key():
+    ledger = TokenLedger(prompt_price=0.1, completion_price=0.4, shards=4)
+
+    def worker(key_index):
+        for _ in range(500):
+            ledger.record(key_index, 1000, 100)
+
+    threads = [threading.Thread(target=worker, args=(n % 2,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ledger.record(1, 50, 5, estimated=True)
+
+    keys = ledger.by_key()
+    assert keys["1"] == {"calls": 2000, "prompt_tokens": 2000000, "completion_tokens": 200000,
+                         "estimated_calls": 0, "cost_usd": 0.28}
+    assert (keys["2"]["calls"], keys["2"]["estimated_calls"]) == (2001, 1)
+    assert ledger.stats()["total"]["prompt_tokens"] == 4000050
+    assert 'curaai_llm_tokens_total{key="2",kind="completion"} 200005' in ledger.render()
+    # Every thread got its own shard, not the one its aligned ident maps to
+    assert sum(1 for shard in ledger._shards if shard.keys) == 4
+
+
+def test_hours_roll_over_and_old_ones_are_dropped(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(token_accounting.time, "time", lambda: now[0])
+    ledger = TokenLedger(retention_hours=2, shards=2)
+    ledger.record(0, 100, 10)
+    now[0] += 3600
+    ledger.record(0, 200, 20)
+    ledger.record(1, 300, 30)
+    assert [(row["hour"], row["prompt_tokens"], sorted(row["keys"])) for row in ledger.by_hour()] == [
+        ("2023-11-14T22:00Z", 100, ["1"]), ("2023-11-14T23:00Z", 500, ["1", "2"]),
+    ]
+
+    now[0] += 2 * 3600
+    # Written from another thread, so another shard: the first shard's old hours go at read time
+    thread = threading.Thread(target=ledger.record, args=(0, 1, 1))
+    thread.start()
+    thread.join()
+    assert [row["hour"] for row in ledger.by_hour()] == ["2023-11-15T01:00Z"]
+    assert all(hour >= 472225 for shard in ledger._shards for hour, _ in shard.hours)
+    # Totals per key outlive the hours they were counted in
+    assert ledger.by_key()["1"]["prompt_tokens"] == 301
+
+
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+def test_session_token_usage_accumulates_and_resets(backend):
+    if backend == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        store = RedisSessionStore(client=fakeredis.FakeRedis())
+    else:
+        store = MemorySessionStore()
+    assert store.get_token_usage("user") == (0, 0)
+    assert store.add_token_usage("user", 2400, 80) == (2400, 80)
+    assert store.add_token_usage("user", 3100, 120) == (5500, 200)
+    assert store.get_token_usage("user") == (5500, 200)
+    assert store.get_token_usage("other") == (0, 0)
+    store.reset_token_usage("user")
+    assert store.get_token_usage("user") == (0, 0)
@@ -0,0 +1,161 @@
+"""
+Token usage and cost of model calls, per API key and per hour.
+
+Every model reply records the prompt and completion tokens Gemini reported for
+it (estimated from the text when the response carried no usage). The ledger
+keeps running totals per key and per clock hour in this process, exported on
+/metrics as counters and on /health with the hours still retained. The session's
+own total lives in the session store, where the token budget is enforced, so it
+is shared by every worker. A hedged attempt that loses the race is charged to
+its own key for what it used before its stream was closed, but not to the
+session; an attempt that failed or was cancelled before Gemini answered reports
+no usage and is not counted.
+
+Records land in one of a fixed number of shards, each with its own lock; a
+thread is given the next shard round-robin the first time it records, so the
+gthread workers, the batch pool and the event loop don't queue on one lock for
+every reply. (Thread idents can't pick the shard: on Linux they are aligned
+addresses, so ident % shards is the same for every thread.) A read merges the
+shards, first dropping hours past retention from all of them.
+"""
+
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+
+PROMPT = "prompt"
+COMPLETION = "completion"
+
+
+class _Shard:
+    __slots__ = ("lock", "keys", "hours")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key index -> [prompt tokens, completion tokens, calls, estimated calls]
+        self.keys = {}
+        # (hour, key index) -> the same
+        self.hours = {}
+
+
+def _add(table, name, prompt_tokens, completion_tokens, estimated):
+    totals = table.get(name)
+    if totals is None:
+        totals = table[name] = [0, 0, 0, 0]
+    totals[0] += prompt_tokens
+    totals[1] += completion_tokens
+    totals[2] += 1
+    totals[3] += estimated
+
+
+class TokenLedger:
+    """Prompt and completion tokens by API key and by hour, in thread-sharded counters"""
+
+    def __init__(self, prompt_price=0.0, completion_price=0.0, retention_hours=48, shards=16):
+        # USD per million tokens
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.retention_hours = retention_hours
+        self._shards = [_Shard() for _ in range(shards)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+
+    def cost(self, prompt_tokens, completion_tokens):
+        """USD for a number of tokens at the configured prices"""
+        return (prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1e6
+
+    def record(self, key_index, prompt_tokens, completion_tokens, estimated=False):
+        """Count one model call's tokens against its key and the current hour"""
+        hour = int(time.time() // 3600)
+        shard = self._shard()
+        with shard.lock:
+            _add(shard.keys, key_index, prompt_tokens, completion_tokens, estimated)
+            _add(shard.hours, (hour, key_index), prompt_tokens, completion_tokens, estimated)
+            self._prune(shard, hour)
+
+    def _shard(self):
+        """This thread's shard, handed out round-robin on its first record"""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = self._shards[next(self._next_shard) % len(self._shards)]
+        return shard
+
+    def _prune(self, shard, hour):
+        """Drop hours past retention from a shard; call with its lock held"""
+        oldest = hour - self.retention_hours
+        if shard.hours and min(shard.hours)[0] <= oldest:
+            for name in [name for name in shard.hours if name[0] <= oldest]:
+                del shard.hours[name]
+
+    def _merged(self, table):
+        merged = {}
+        hour = int(time.time() // 3600)
+        for shard in self._shards:
+            with shard.lock:
+                # Shards whose threads stopped recording still lose their old hours
+                self._prune(shard, hour)
+                rows = [(name, list(totals)) for name, totals in getattr(shard, table).items()]
+            for name, totals in rows:
+                current = merged.setdefault(name, [0, 0, 0, 0])
+                for i, value in enumerate(totals):
+                    current[i] += value
+        return merged
+
+    def _row(self, totals):
+        prompt_tokens, completion_tokens, calls, estimated = totals
+        return {
+            "calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated_calls": estimated,
+            "cost_usd": round(self.cost(prompt_tokens, completion_tokens), 6),
+        }
+
+    def by_key(self):
+        """Totals since start per key, keyed by its 1-based number"""
+        return {str(key_index + 1): self._row(totals) for key_index, totals in sorted(self._merged("keys").items())}
+
+    def by_hour(self):
+        """Totals per clock hour (UTC) still retained, oldest first, each with its per-key split"""
+        hours = {}
+        for (hour, key_index), totals in self._merged("hours").items():
+            hours.setdefault(hour, {})[key_index] = totals
+        rows = []
+        for hour, keys in sorted(hours.items()):
+            overall = [sum(values) for values in zip(*keys.values())]
+            rows.append({
+                "hour": datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y-%m-%dT%H:00Z"),
+                **self._row(overall),
+                "keys": {str(key_index + 1): self._row(totals) for key_index, totals in sorted(keys.items())},
+            })
+        return rows
+
+    def stats(self):
+        """Per-key and per-hour totals for the /health endpoint"""
+        keys = self.by_key()
+        return {
+            "prices_per_million": {PROMPT: self.prompt_price, COMPLETION: self.completion_price},
+            "total": self._row([sum(row[field] for row in keys.values()) for field in
+                                ("prompt_tokens", "completion_tokens", "calls", "estimated_calls")]),
+            "keys": keys,
+            "hours": self.by_hour(),
+        }
+
+    def render(self):
+        """Prometheus counters of tokens and cost per key, for /metrics"""
+        keys = self.by_key()
+        lines = [
+            "# HELP curaai_llm_tokens_total Tokens billed for model replies, by API key and kind",
+            "# TYPE curaai_llm_tokens_total counter",
+        ]
+        for key, row in keys.items():
+            lines.append(f'curaai_llm_tokens_total{{key="{key}",kind="{PROMPT}"}} {row["prompt_tokens"]}')
+            lines.append(f'curaai_llm_tokens_total{{key="{key}",kind="{COMPLETION}"}} {row["completion_tokens"]}')
+        lines += [
+            "# HELP curaai_llm_cost_usd_total Estimated spend on model replies at the configured prices, by API key",
+            "# TYPE curaai_llm_cost_usd_total counter",
+        ]
+        for key, row in keys.items():
+            lines.append(f'curaai_llm_cost_usd_total{{key="{key}"}} {row["cost_usd"]}')
+        return lines